@@ -3,6 +3,11 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Served by gunicorn with uvicorn workers when SERVER_MODE=asgi (see
+gunicorn.conf.py). The ASGI stack uses the async race list and race page
+(ASYNC_VIEWS), so slow clients wait on the event loop instead of holding a
+worker thread, and serves the live comment streams.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -12,5 +17,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
 
 application = get_asgi_application()
+
+# Live comment streams must stop when their browser goes away
+from races.live_comments import cancel_streams_on_disconnect  # noqa: E402 - needs the app registry
+
+application = cancel_streams_on_disconnect(application)
@@ -0,0 +1,6 @@
+"""
+Pooled variants of Django's database backends (see pool.py)
+
+    ENGINE = 'config.db_backends.postgresql'
+    ENGINE = 'config.db_backends.sqlite3'
+"""
@@ -0,0 +1,300 @@
+"""
+A small per-process database connection pool
+
+Django opens a new database connection for every request and closes it at
+the end (CONN_MAX_AGE = 0). With PostgreSQL that is a TCP + TLS handshake
+and authentication per request. The pooled backends in this package keep
+closed connections in a pool instead and hand them to the next request:
+
+- the pool is shared by all threads of a worker (safe for gthread
+  workers); each thread still uses its own connection while it has one
+- at most MAX_SIZE connections exist per process; when all are busy a
+  thread waits up to TIMEOUT seconds and then gets an OperationalError
+- returned connections are rolled back; on PostgreSQL their session state
+  (advisory locks, SET parameters, temporary tables) is discarded as well
+- idle connections are health-checked before reuse if they sat unused for
+  longer than HEALTH_CHECK_AFTER seconds, and replaced after MAX_LIFETIME
+- connections are never shared across fork(): a pool created in another
+  process is forgotten (not closed - the parent still owns the sockets)
+
+Wait times, timeouts and pool sizes are recorded with config.metrics.
+
+Configure with a "POOL" entry in the DATABASES settings dict:
+
+    'POOL': {'MAX_SIZE': 5, 'TIMEOUT': 10, 'MAX_LIFETIME': 1800,
+             'HEALTH_CHECK_AFTER': 30}
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from config import metrics
+
+DEFAULTS = {
+    'MAX_SIZE': 5,
+    'TIMEOUT': 10.0,
+    'MAX_LIFETIME': 1800.0,
+    'HEALTH_CHECK_AFTER': 30.0,
+}
+
+WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool TIMEOUT"""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of raw DB-API connections for one database
+
+    `create()` opens a new raw connection, `is_alive(connection)` checks an
+    idle one and `close(connection)` closes one for good.
+    """
+
+    def __init__(self, alias, create, is_alive, close, **options):
+        self.alias = alias
+        self.create = create
+        self.is_alive = is_alive
+        self.close_connection = close
+        config = {**DEFAULTS, **{key.upper(): value for key, value in options.items()}}
+        self.max_size = int(config['MAX_SIZE'])
+        self.timeout = float(config['TIMEOUT'])
+        self.max_lifetime = config['MAX_LIFETIME']
+        self.health_check_after = config['HEALTH_CHECK_AFTER']
+        self.pid = os.getpid()
+
+        self._condition = threading.Condition()
+        self._idle = deque()     # (connection, created_at, last_used_at)
+        self._created = {}       # id(connection) -> created_at
+        self.in_use = 0
+
+    @property
+    def size(self):
+        return len(self._created)
+
+    def acquire(self):
+        """Return a raw connection, reusing an idle one when possible"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            connection, check, placeholder = self._checkout(deadline)
+            if connection is None:
+                break
+            # Health check without holding the lock: against a database that
+            # went away it blocks until the TCP timeout, and the other threads
+            # must still be able to acquire and release meanwhile
+            if check and not self.is_alive(connection):
+                self._discard(connection)
+                continue
+            with self._condition:
+                self._record(start)
+            return connection
+
+        # A slot is reserved: connect without holding the lock
+        try:
+            connection = self.create()
+        except BaseException:
+            with self._condition:
+                del self._created[id(placeholder)]
+                self._condition.notify()
+            raise
+        with self._condition:
+            del self._created[id(placeholder)]
+            self._created[id(connection)] = time.monotonic()
+            self.in_use += 1
+            self._record(start)
+        return connection
+
+    def _checkout(self, deadline):
+        """
+        Take an idle connection, or reserve a slot for a new one
+
+        Returns (connection, needs a health check, None), or (None, False,
+        placeholder) once a slot is reserved. Idle connections past
+        MAX_LIFETIME are closed after the lock is released.
+        """
+        expired = []
+        try:
+            with self._condition:
+                while True:
+                    while self._idle:
+                        connection, created_at, last_used = self._idle.pop()
+                        now = time.monotonic()
+                        if self.max_lifetime is not None and now - created_at > self.max_lifetime:
+                            self._created.pop(id(connection), None)
+                            expired.append(connection)
+                            continue
+                        self.in_use += 1
+                        check = (self.health_check_after is not None
+                                 and now - last_used > self.health_check_after)
+                        return connection, check, None
+                    if self.size < self.max_size:
+                        placeholder = object()
+                        self._created[id(placeholder)] = None
+                        return None, False, placeholder
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.inc('django_db_pool_timeouts_total', database=self.alias)
+                        raise PoolTimeout(
+                            f"No database connection available for '{self.alias}' "
+                            f"after {self.timeout:.1f}s (pool size {self.max_size})")
+                    self._condition.wait(remaining)
+        finally:
+            for connection in expired:
+                self._close_quietly(connection)
+
+    def release(self, connection, reusable=True):
+        """Give a connection back (or close it if it can't be reused)"""
+        with self._condition:
+            if id(connection) not in self._created or self.pid != os.getpid():
+                # Not ours, or inherited through fork() - the socket belongs
+                # to the parent process, so leave it alone
+                return
+            if reusable:
+                self.in_use -= 1
+                self._idle.append((connection, self._created[id(connection)], time.monotonic()))
+                self._gauges()
+                self._condition.notify()
+                return
+        self._discard(connection)
+
+    def close_all(self):
+        """Close every idle connection (connections in use are closed on release)"""
+        with self._condition:
+            idle = [connection for connection, _, _ in self._idle]
+            self._idle.clear()
+            for connection in idle:
+                self._created.pop(id(connection), None)
+            self._gauges()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    def _discard(self, connection):
+        """Drop a checked-out connection; closed outside the lock"""
+        with self._condition:
+            self._created.pop(id(connection), None)
+            self.in_use -= 1
+            self._gauges()
+            self._condition.notify()
+        self._close_quietly(connection)
+
+    def _close_quietly(self, connection):
+        try:
+            self.close_connection(connection)
+        except Exception:  # noqa: BLE001 - it is being thrown away anyway
+            pass
+
+    def _record(self, start):
+        metrics.observe('django_db_pool_wait_seconds', time.monotonic() - start,
+                        buckets=WAIT_BUCKETS, database=self.alias)
+        self._gauges()
+
+    def _gauges(self):
+        metrics.set_gauge('django_db_pool_connections', self.size, database=self.alias)
+        metrics.set_gauge('django_db_pool_in_use', self.in_use, database=self.alias)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """
+    The pool for `key` in this process, created with `factory()` if needed
+
+    Pools inherited from a parent process are dropped without closing
+    their connections - those sockets belong to the parent.
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is not None and pool.pid != os.getpid():
+            _pools.clear()
+            pool = None
+        if pool is None:
+            pool = _pools[key] = factory()
+        return pool
+
+
+def close_pools():
+    """Close the idle connections of every pool in this process"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        if pool.pid == os.getpid():
+            pool.close_all()
+
+
+def pool_stats():
+    """{alias: {"size", "in_use", "idle", "max_size"}} for this process"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {
+        pool.alias: {'size': pool.size, 'in_use': pool.in_use,
+                     'idle': len(pool._idle), 'max_size': pool.max_size}
+        for pool in pools if pool.pid == os.getpid()
+    }
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mix into a backend's DatabaseWrapper to take connections from a pool
+
+    Django still "opens" a connection at the start of a request and
+    "closes" it at the end; those now check a connection out of and back
+    into the process pool.
+    """
+
+    def _pool(self, conn_params):
+        key = (self.alias, tuple(sorted((name, repr(value)) for name, value in conn_params.items())))
+
+        def factory():
+            return ConnectionPool(
+                self.alias,
+                create=lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params),
+                is_alive=self.pool_connection_alive,
+                close=lambda connection: connection.close(),
+                **self.settings_dict.get('POOL', {}),
+            )
+        return get_pool(key, factory)
+
+    def get_new_connection(self, conn_params):
+        pool = self._pool(conn_params)
+        try:
+            connection = pool.acquire()
+        except PoolTimeout as error:
+            raise self.Database.OperationalError(str(error)) from error
+        self._connection_pool = pool
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = getattr(self, '_connection_pool', None)
+        if pool is None:
+            return super()._close()
+        # Closed inside atomic(): Django keeps using this wrapper's handle,
+        # so the connection must really be closed rather than reused
+        reusable = not self.in_atomic_block and self.reset_pooled_connection(self.connection)
+        with self.wrap_database_errors:
+            pool.release(self.connection, reusable=reusable)
+
+    def reset_pooled_connection(self, connection):
+        """Roll back any open transaction; False if the connection is broken"""
+        try:
+            connection.rollback()
+        except self.Database.Error:
+            return False
+        return True
+
+    def pool_connection_alive(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except self.Database.Error:
+            return False
+        return True
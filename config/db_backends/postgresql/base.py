@@ -0,0 +1,45 @@
+"""PostgreSQL backend with per-process connection pooling"""
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from config.db_backends.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        # Django sets this while connecting; a reused connection skips that
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = (
+            IsolationLevel.READ_COMMITTED if isolation_level is None
+            else IsolationLevel(isolation_level)
+        )
+        return connection
+
+    def pool_connection_alive(self, connection):
+        # psycopg marks connections it knows are broken - skip the round trip
+        if getattr(connection, 'closed', False):
+            return False
+        return super().pool_connection_alive(connection)
+
+    def reset_pooled_connection(self, connection):
+        """
+        Also forget the session's state before the next thread gets it
+
+        A rollback ends the transaction but not the session: advisory locks
+        (the scheduler's leader lock), SET parameters and temporary tables
+        would otherwise be inherited by whoever checks the connection out
+        next - and a session advisory lock is re-entrant, so that thread
+        would "win" the lock too. DISCARD ALL releases all of it; the time
+        zone and role are set again when the connection is handed out.
+        """
+        if not super().reset_pooled_connection(connection):
+            return False
+        try:
+            connection.autocommit = True  # DISCARD ALL refuses to run in a transaction
+            with connection.cursor() as cursor:
+                cursor.execute('DISCARD ALL')
+        except self.Database.Error:
+            return False
+        return True
@@ -0,0 +1,8 @@
+"""SQLite backend with per-process connection pooling (a PostgreSQL stand-in for local benchmarks)"""
+from django.db.backends.sqlite3 import base
+
+from config.db_backends.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,61 @@
+"""
+Read-replica database routing
+
+Configured replicas (DATABASE_REPLICA_URLS) serve the read-only ORM queries
+of a few busy, read-only pages (REPLICA_READ_VIEWS). Everything else -
+writes, admin, forms, sessions - uses the primary ("default") database.
+
+Read-your-writes: replicas lag slightly behind the primary, so a user who
+just created a race or posted a comment might not see it on the next page.
+ReplicaRoutingMiddleware therefore sets a short-lived "pin" cookie after
+every write request (POST etc.); while it is present that browser reads
+from the primary. Within a single request, reads also move to the primary
+as soon as anything has been written.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+# Apps whose tables are always read from the primary (a session written a
+# moment ago at login must be visible immediately)
+PRIMARY_ONLY_APPS = {'sessions'}
+
+# True while a view listed in REPLICA_READ_VIEWS runs without a pin
+replica_reads_allowed = ContextVar('replica_reads_allowed', default=False)
+# Set once the current request has written anything
+request_has_written = ContextVar('request_has_written', default=False)
+
+
+def replica_aliases():
+    """Database aliases configured as replicas"""
+    return [alias for alias, config in settings.DATABASES.items()
+            if config.get('REPLICA_OF') == PRIMARY]
+
+
+class ReplicaRouter:
+    """Send allowed reads to a random replica and everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if (not replica_reads_allowed.get() or request_has_written.get()
+                or model._meta.app_label in PRIMARY_ONLY_APPS):
+            return PRIMARY
+        replicas = replica_aliases()
+        return random.choice(replicas) if replicas else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        request_has_written.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        return db not in replica_aliases()
@@ -0,0 +1,345 @@
+"""
+Lightweight request metrics in Prometheus text format
+
+Recording is lock-free on the hot path: every thread writes into its own
+buffer (a plain dict), and buffers are only merged when /metrics is read.
+
+With several gunicorn workers each process periodically writes a snapshot
+of its totals to METRICS_DIR/<pid>.json (atomic rename). The /metrics view
+merges every snapshot file, so whichever worker answers the scrape reports
+totals for the whole server. Clear METRICS_DIR when the server starts
+(see clear_multiprocess_dir) so numbers from an old deploy are not reused.
+
+Metric types:
+- counter: monotonically increasing float, summed across processes
+- gauge: last value, the maximum is reported across processes
+- histogram: cumulative buckets + sum + count, summed across processes
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Default histogram buckets (seconds) - tuned for web request latency
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+HELP = {
+    'django_http_requests_total': 'Requests by route, method and status',
+    'django_http_request_duration_seconds': 'Request latency by route',
+    'django_http_response_size_bytes': 'Response body size by route',
+    'django_db_queries_per_request': 'SQL queries executed per request',
+    'django_db_query_duration_seconds_total': 'Total SQL time by route',
+    'django_template_render_seconds': 'Template render time per request',
+    'django_db_pool_wait_seconds': 'Time spent waiting for a pooled database connection',
+    'django_db_pool_timeouts_total': 'Requests that gave up waiting for a connection',
+    'django_db_pool_connections': 'Open pooled connections per process',
+    'django_db_pool_in_use': 'Pooled connections currently checked out',
+    'django_counter_flush_lag_seconds': 'Age of the oldest buffered counter increment at the last flush',
+    'django_counter_flush_seconds': 'Time spent writing buffered counters to the database',
+    'django_counter_increments_flushed_total': 'Buffered counter increments written to the database',
+    'django_counter_flush_failures_total': 'Counter flushes that failed and were retried',
+    'django_rate_limited_total': 'Requests refused with 429 by route and bucket',
+    'django_rate_limit_route_overruns_total': 'Requests over a route-wide limit (reported, not refused)',
+}
+
+_kinds = {}
+_buckets = {}
+_buffers = []
+_buffers_guard = threading.Lock()
+_local = threading.local()
+_last_flush = 0.0
+
+
+def _buffer():
+    """This thread's private buffer (created and registered on first use)"""
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        buffer = {}
+        with _buffers_guard:
+            _buffers.append(buffer)
+        _local.buffer = buffer
+    return buffer
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())) if labels else ())
+
+
+def inc(name, value=1.0, **labels):
+    """Add `value` to a counter"""
+    _kinds[name] = 'counter'
+    buffer = _buffer()
+    key = _key(name, labels)
+    buffer[key] = buffer.get(key, 0.0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to `value`"""
+    _kinds[name] = 'gauge'
+    _buffer()[_key(name, labels)] = (time.time(), float(value))
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Record one observation in a histogram"""
+    _kinds[name] = 'histogram'
+    _buckets[name] = buckets
+    buffer = _buffer()
+    key = _key(name, labels)
+    entry = buffer.get(key)
+    if entry is None:
+        # [per-bucket counts..., +Inf count, sum]
+        entry = buffer[key] = [0] * (len(buckets) + 1) + [0.0]
+    entry[bisect_left(buckets, value)] += 1
+    entry[-1] += value
+
+
+def snapshot():
+    """
+    Merge every thread buffer of this process
+
+    Returns {"kinds": {...}, "buckets": {...}, "values": [[name, labels, value]]}
+    which is also the on-disk format used between processes.
+    """
+    merged = {}
+    with _buffers_guard:
+        buffers = list(_buffers)
+    for buffer in buffers:
+        for key, value in buffer.copy().items():
+            kind = _kinds.get(key[0])
+            if kind == 'histogram':
+                current = merged.get(key)
+                merged[key] = list(value) if current is None else [
+                    a + b for a, b in zip(current, value)]
+            elif kind == 'gauge':
+                current = merged.get(key)
+                if current is None or value[0] > current[0]:
+                    merged[key] = value
+            else:
+                merged[key] = merged.get(key, 0.0) + value
+    return {
+        'kinds': dict(_kinds),
+        'buckets': {name: list(b) for name, b in _buckets.items()},
+        'values': [[name, list(labels), value] for (name, labels), value in merged.items()],
+    }
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def flush(force=False):
+    """
+    Write this process's snapshot to METRICS_DIR (at most every few seconds)
+    """
+    global _last_flush
+    directory = metrics_dir()
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+        return
+    _last_flush = now
+
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as handle:
+        json.dump(snapshot(), handle)
+    os.replace(temp_path, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+def clear_multiprocess_dir():
+    """Remove snapshot files left by a previous server run"""
+    directory = metrics_dir()
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, name))
+
+
+def collect():
+    """Merge the snapshots of every process (this one read live)"""
+    snapshots = [snapshot()]
+    directory = metrics_dir()
+    own_file = f'{os.getpid()}.json'
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if not name.endswith('.json') or name == own_file:
+                continue
+            try:
+                with open(os.path.join(directory, name)) as handle:
+                    snapshots.append(json.load(handle))
+            except (OSError, ValueError):
+                continue  # File being replaced - picked up next scrape
+
+    kinds, buckets, merged = {}, {}, {}
+    for data in snapshots:
+        kinds.update(data['kinds'])
+        buckets.update(data['buckets'])
+        for name, labels, value in data['values']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            kind = kinds.get(name)
+            current = merged.get(key)
+            if current is None:
+                merged[key] = value
+            elif kind == 'histogram':
+                merged[key] = [a + b for a, b in zip(current, value)]
+            elif kind == 'gauge':
+                merged[key] = max(current, value, key=lambda item: item[1])
+            else:
+                merged[key] = current + value
+    return kinds, buckets, merged
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for key, value in pairs
+    )
+    return '{' + body + '}'
+
+
+def render_prometheus():
+    """Return all metrics in the Prometheus text exposition format"""
+    kinds, buckets, merged = collect()
+    lines = []
+    for name in sorted({key[0] for key in merged}):
+        kind = kinds.get(name, 'untyped')
+        if name in HELP:
+            lines.append(f'# HELP {name} {HELP[name]}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (metric, labels), value in sorted(merged.items()):
+            if metric != name:
+                continue
+            if kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(list(buckets[name]) + ['+Inf'], value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {value[-1]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+            elif kind == 'gauge':
+                lines.append(f'{name}{_format_labels(labels)} {value[1]}')
+            else:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# ------------------------------------------------------------------------------
+# Per-request statistics (SQL and template timings)
+# ------------------------------------------------------------------------------
+
+class RequestStats:
+    """Counters for the request currently being handled"""
+
+    __slots__ = ('query_count', 'query_seconds', 'template_seconds',
+                 'template_depth', 'template_log')
+
+    def __init__(self):
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        # Set to a list to also keep (template name, milliseconds) per render
+        self.template_log = None
+
+
+current_stats = ContextVar('current_request_stats', default=None)
+
+
+def query_timer(execute, sql, params, many, context):
+    """
+    connection.execute_wrapper() hook counting queries and their time
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.query_count += 1
+        stats.query_seconds += time.perf_counter() - start
+
+
+def install_query_timer(connection, **kwargs):
+    """
+    Add query_timer to a connection for good (connection_created receiver)
+
+    Outside a request current_stats is None and the timer only passes the
+    query through.
+    """
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_timer)
+
+
+_template_timer_installed = False
+
+
+def install_template_timer():
+    """
+    Time Django template rendering for the current request
+
+    Wraps the template backend's render() once per process. Only the
+    outermost render is timed, so {% include %}s are not double counted.
+    """
+    global _template_timer_installed
+    if _template_timer_installed:
+        return
+    from django.template.backends.django import Template
+
+    original_render = Template.render
+
+    def timed_render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return original_render(self, context, request)
+        stats.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original_render(self, context, request)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                stats.template_seconds += elapsed
+            if stats.template_log is not None:
+                stats.template_log.append(
+                    {'template': self.origin.template_name, 'ms': round(elapsed * 1000, 3)})
+
+    Template.render = timed_render
+    _template_timer_installed = True
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint
+
+    Allowed for staff users, or for scrapers sending
+    "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    import hmac
+    from django.http import HttpResponse, HttpResponseForbidden
+
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    token_ok = bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+    user = getattr(request, 'user', None)
+    if not token_ok and not (user is not None and user.is_staff):
+        return HttpResponseForbidden("Metrics are restricted.")
+
+    flush(force=True)
+    return HttpResponse(
+        render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -1,21 +1,59 @@
 """
 ease add cCustom middleware for improving Best Practices Score and Cache Performance
+
+Every middleware here works in both stacks: the WSGI one (gunicorn sync
+workers) and the ASGI one (SERVER_MODE=asgi, see gunicorn.conf.py). Under
+ASGI, Django runs a sync-only middleware - and everything below it - in a
+worker thread for the whole request, so a single one would bring back the
+thread-per-request cost the async views avoid.
 """
 import re
+import time
+
+import allauth
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.utils.http import http_date
+from allauth.account.middleware import AccountMiddleware as AllauthAccountMiddleware
+from whitenoise.middleware import WhiteNoiseMiddleware
 
 
-class SecurityHeadersMiddleware:
+class AsyncCapableMiddleware:
     """
-    Middleware to add security headers that improve Lighthouse
-    Best Practices score and address cookie issues with third-party resources
+    Base for middleware usable in the sync (WSGI) and async (ASGI) stacks
+
+    When Django hands us an async get_response we mark the instance as a
+    coroutine function; subclasses then return self.__acall__(request) from
+    __call__, the same switch Django's own MiddlewareMixin makes.
     """
-    
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django would run a sync process_view in a thread; hand it the
+            # async twin instead where a subclass has one
+            if hasattr(self, 'aprocess_view'):
+                self.process_view = self.aprocess_view
+
+
+class SecurityHeadersMiddleware(AsyncCapableMiddleware):
+    """
+    Middleware to add security headers that improve Lighthouse
+    Best Practices score and address cookie issues with third-party resources
+    """
 
     def __call__(self, request):
-        response = self.get_response(request)
-        
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.add_headers(self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(await self.get_response(request))
+
+    def add_headers(self, response):
         # Add security headers
         response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
         response['Permissions-Policy'] = (
@@ -32,23 +70,64 @@ class SecurityHeadersMiddleware:
         return response
 
 
-class MediaCacheMiddleware:
+class MediaCacheMiddleware(AsyncCapableMiddleware):
     """
     Middleware to add proper cache headers for media files (user uploads)
     This significantly improves repeat visit performance
+
+    Resized images from the /img/<w>x<h>/ proxy are recognised by their
+    X-Image-Derivative header and cached for a year. Unless
+    MEDIA_SERVE_ORIGINALS is True, requests for original media images are
+    redirected to a derivative so full-size uploads never reach the browser.
     """
     
     def __init__(self, get_response):
-        self.get_response = get_response
+        super().__init__(get_response)
         # Pattern to match media files
         self.media_pattern = re.compile(
             r'^/media/.*\.(jpg|jpeg|png|gif|webp|svg|ico|css|js|woff|woff2|'
             r'ttf|eot|pdf|zip)$',
             re.IGNORECASE
         )
+        # Pattern to match original images that the resize proxy can serve
+        self.original_image_pattern = re.compile(
+            r'^/media/(?P<path>.*\.(jpg|jpeg|png|gif|webp))$',
+            re.IGNORECASE
+        )
 
     def __call__(self, request):
-        response = self.get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        redirect = self.redirect_original(request)
+        if redirect is not None:
+            return redirect
+        return self.add_cache_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        redirect = self.redirect_original(request)
+        if redirect is not None:
+            return redirect
+        return self.add_cache_headers(request, await self.get_response(request))
+
+    def redirect_original(self, request):
+        from django.conf import settings
+
+        # Send browsers to a resized copy instead of the original upload
+        if not getattr(settings, 'MEDIA_SERVE_ORIGINALS', True):
+            match = self.original_image_pattern.match(request.path_info)
+            if match:
+                from django.http import HttpResponsePermanentRedirect
+                from races.image_proxy import derivative_url
+                size = getattr(settings, 'IMAGE_PROXY_DEFAULT_SIZE', '1600x1600')
+                return HttpResponsePermanentRedirect(
+                    derivative_url(match.group('path'), size))
+        return None
+
+    def add_cache_headers(self, request, response):
+        # Resized derivatives: the proxy set its own Cache-Control (immutable
+        # only for versioned URLs) and a content-based ETag
+        if response.has_header('X-Image-Derivative'):
+            return response
         
         # Check if this is a media file request
         if self.media_pattern.match(request.path_info):
@@ -57,7 +136,7 @@ class MediaCacheMiddleware:
             # since these might be updated by users
             response['Cache-Control'] = 'public, max-age=2592000, immutable'
             # 30 days from now
-            response['Expires'] = 'Thu, 06 Nov 2025 00:00:00 GMT'
+            response['Expires'] = http_date(time.time() + 2592000)
             
             # Add ETag for better cache validation
             if hasattr(response, 'content') and response.content:
@@ -65,4 +144,454 @@ class MediaCacheMiddleware:
                 etag = hashlib.md5(response.content).hexdigest()
                 response['ETag'] = f'"{etag}"'
         
-        return response
\ No newline at end of file
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, async-capable
+
+    The installed WhiteNoise release is sync-only. Its file lookup is an
+    in-memory dictionary (autorefresh off), so under ASGI we answer static
+    files directly and await everything else. The file itself is streamed
+    in 64 KiB chunks, each read in a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # Development only: find_file() walks the disk
+            response = await sync_to_async(self.process_request)(request)
+        else:
+            response = self.process_request(request)
+        if response is None:
+            return await self.get_response(request)
+        if response.streaming and not response.is_async:
+            response.block_size = 64 * 1024
+            response.streaming_content = read_in_thread(response.streaming_content)
+        return response
+
+
+async def read_in_thread(chunks):
+    """Async iterator over a blocking one (e.g. file reads), one thread hop per chunk"""
+    chunks = iter(chunks)
+    while True:
+        chunk = await sync_to_async(next)(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class AccountMiddleware(AllauthAccountMiddleware):
+    """
+    allauth's AccountMiddleware, async-capable
+
+    Listed in MIDDLEWARE instead of allauth's own (races.apps.AccountConfig
+    accepts it there). The dangling-login clean-up may load the session,
+    which is a database read - under ASGI it runs in a thread.
+
+    __acall__ copies allauth's __call__ and uses its internals (the private
+    _remove_dangling_login and allauth.core.context), so it is only
+    async-capable with the allauth release it was written against,
+    ALLAUTH_VERSION; with any other release Django runs it synchronously,
+    just like allauth's own middleware.
+    """
+
+    ALLAUTH_VERSION = '0.57.2'
+
+    sync_capable = True
+    async_capable = allauth.__version__ == ALLAUTH_VERSION
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        from allauth.core import context
+
+        with context.request_context(request):
+            response = await self.get_response(request)
+            await sync_to_async(self._remove_dangling_login)(request, response)
+            return response
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Middleware recording per-route request metrics (see config/metrics.py)
+
+    For every request it records latency, status, response size, the number
+    and total time of SQL queries (metrics.query_timer, installed on every
+    connection by races/apps.py - under ASGI queries run in sync_to_async
+    threads, on connections a per-request execute_wrapper() would never
+    see) and the time spent rendering templates. Put it first in MIDDLEWARE
+    so the latency covers the whole stack.
+    """
+
+    def __init__(self, get_response):
+        from . import metrics
+
+        super().__init__(get_response)
+        self.metrics = metrics
+        metrics.install_template_timer()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.metrics.current_stats.reset(token)
+        return self.record(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.metrics.current_stats.reset(token)
+        return self.record(request, response, stats, time.perf_counter() - start)
+
+    def start(self):
+        stats = self.metrics.RequestStats()
+        token = self.metrics.current_stats.set(stats)
+        return stats, token, time.perf_counter()
+
+    def record(self, request, response, stats, duration):
+        metrics = self.metrics
+
+        # Label by URL name ("race-detail", "account_login", ...), never by raw path
+        match = getattr(request, 'resolver_match', None)
+        route = (match.view_name or match._func_path) if match else 'unmatched'
+        method = request.method
+
+        metrics.inc('django_http_requests_total', route=route, method=method,
+                    status=str(response.status_code))
+        metrics.observe('django_http_request_duration_seconds', duration,
+                        route=route, method=method)
+        metrics.observe('django_db_queries_per_request', stats.query_count,
+                        buckets=metrics.COUNT_BUCKETS, route=route)
+        metrics.inc('django_db_query_duration_seconds_total', stats.query_seconds,
+                    route=route)
+        if stats.template_seconds:
+            metrics.observe('django_template_render_seconds', stats.template_seconds,
+                            route=route)
+
+        if response.streaming:
+            size = response.get('Content-Length')
+        else:
+            size = len(response.content)
+        if size is not None:
+            metrics.observe('django_http_response_size_bytes', int(size),
+                            buckets=metrics.SIZE_BUCKETS, route=route)
+
+        metrics.flush()
+        return response
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """
+    Middleware profiling single requests on demand (see races/profiling.py)
+
+    Staff users add an "X-Profile: 1" (cProfile) or "X-Profile: sample"
+    (flame graph sampler) header to profile that one request. Without the
+    header the only cost is one dictionary lookup. Must come after
+    AuthenticationMiddleware.
+
+    Under ASGI the profiler watches the event-loop thread, where async
+    views run; ORM work they hand to threads shows up only as waiting time
+    (see races/profiling.py). Only one request at a time is run under
+    cProfile; the X-Profile-Mode response header names the profiler used.
+    """
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if 'HTTP_X_PROFILE' not in request.META:
+            return self.get_response(request)
+        if not request.user.is_staff:
+            return self.get_response(request)
+
+        from races.profiling import profile_request
+        return profile_request(request, self.get_response)
+
+    async def __acall__(self, request):
+        if 'HTTP_X_PROFILE' not in request.META:
+            return await self.get_response(request)
+        # Loading the user is a database read
+        if not await sync_to_async(lambda: request.user.is_staff)():
+            return await self.get_response(request)
+
+        from races.profiling import profile_request_async
+        return await profile_request_async(request, self.get_response)
+
+
+class QueryLogMiddleware(AsyncCapableMiddleware):
+    """
+    Middleware giving the slow-query log its request context
+
+    Remembers which view is running (so slow queries can name it) and, for
+    a sample of requests, counts query shapes so shapes repeated within one
+    request are recorded as N+1 candidates (see races/slow_queries.py).
+    """
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        from races import slow_queries
+
+        log, tokens = self.start()
+        try:
+            response = self.get_response(request)
+            if log is not None:
+                log.finish(slow_queries.current_view.get())
+        finally:
+            self.reset(tokens)
+        return response
+
+    async def __acall__(self, request):
+        from races import slow_queries
+
+        log, tokens = self.start()
+        try:
+            response = await self.get_response(request)
+            if log is not None:
+                # finish() may write the N+1 candidates to the database
+                await sync_to_async(log.finish)(slow_queries.current_view.get())
+        finally:
+            self.reset(tokens)
+        return response
+
+    def start(self):
+        from races import slow_queries
+
+        # Unsampled requests leave the log at None: queries are only timed
+        log = slow_queries.RequestQueryLog() if slow_queries.count_shapes() else None
+        return log, (slow_queries.current_request_log.set(log),
+                     slow_queries.current_view.set(''))
+
+    def reset(self, tokens):
+        from races import slow_queries
+
+        log_token, view_token = tokens
+        slow_queries.current_request_log.reset(log_token)
+        slow_queries.current_view.reset(view_token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.name_view(request, view_func)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.name_view(request, view_func)
+
+    def name_view(self, request, view_func):
+        from races import slow_queries
+        match = request.resolver_match
+        slow_queries.current_view.set(match.view_name if match else view_func.__name__)
+
+
+class RepeatedQueryError(Exception):
+    """Raised in strict mode when a request repeats the same query shape"""
+
+
+class QueryInspectorMiddleware(AsyncCapableMiddleware):
+    """
+    Development middleware flagging N+1 queries as they happen
+
+    When the same query shape runs QUERY_INSPECTOR_LIMIT or more times in
+    one request it logs an error and adds an X-Repeated-Queries header. With
+    QUERY_INSPECTOR_STRICT (used by the test suite) it raises instead, so
+    the offending page fails loudly. Only active when QUERY_INSPECTOR_ENABLED
+    (defaults to DEBUG); must come after QueryLogMiddleware.
+    """
+
+    def __init__(self, get_response):
+        from django.conf import settings
+        from django.core.exceptions import MiddlewareNotUsed
+
+        if not getattr(settings, 'QUERY_INSPECTOR_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.limit = getattr(settings, 'QUERY_INSPECTOR_LIMIT', 5)
+        self.strict = getattr(settings, 'QUERY_INSPECTOR_STRICT', False)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.inspect(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.inspect(request, await self.get_response(request))
+
+    def inspect(self, request, response):
+        import logging
+        from races import slow_queries
+
+        log = slow_queries.current_request_log.get()
+        if log is None:
+            return response
+
+        repeated = log.repeated(self.limit)
+        if repeated:
+            details = '; '.join(
+                f"{count}x at {log.locations[shape] or '?'}: {shape[:200]}"
+                for shape, count in repeated
+            )
+            if self.strict:
+                raise RepeatedQueryError(f"{request.path}: {details}")
+            logging.getLogger('races.slow_queries').error(
+                "Repeated queries in %s: %s", request.path, details)
+            response['X-Repeated-Queries'] = str(len(repeated))
+        return response
+
+
+class ReplicaRoutingMiddleware(AsyncCapableMiddleware):
+    """
+    Middleware deciding which requests may read from a database replica
+
+    Only safe (GET/HEAD) requests to the views in REPLICA_READ_VIEWS read
+    from replicas, and only if the browser has no read-your-writes pin.
+    Any request that may have written (POST, PUT, PATCH, DELETE) pins the
+    browser to the primary for REPLICA_PIN_SECONDS (see config/db_routers.py).
+    """
+
+    PIN_COOKIE = 'db_primary_until'
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        from config import db_routers
+
+        tokens = self.start()
+        try:
+            response = self.get_response(request)
+            wrote = db_routers.request_has_written.get()
+        finally:
+            self.reset(tokens)
+        return self.pin(request, response, wrote)
+
+    async def __acall__(self, request):
+        from config import db_routers
+
+        tokens = self.start()
+        try:
+            response = await self.get_response(request)
+            wrote = db_routers.request_has_written.get()
+        finally:
+            self.reset(tokens)
+        return self.pin(request, response, wrote)
+
+    def start(self):
+        from config import db_routers
+
+        return (db_routers.replica_reads_allowed.set(False),
+                db_routers.request_has_written.set(False))
+
+    def reset(self, tokens):
+        from config import db_routers
+
+        allowed_token, written_token = tokens
+        db_routers.replica_reads_allowed.reset(allowed_token)
+        db_routers.request_has_written.reset(written_token)
+
+    def pin(self, request, response, wrote):
+        from django.conf import settings
+
+        if (wrote or request.method not in ('GET', 'HEAD')) and response.status_code < 500:
+            seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+            response.set_cookie(
+                self.PIN_COOKIE, str(int(time.time() + seconds)),
+                max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.route(request)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.route(request)
+
+    def route(self, request):
+        from django.conf import settings
+        from config import db_routers
+
+        match = request.resolver_match
+        if (request.method in ('GET', 'HEAD') and match
+                and match.view_name in getattr(settings, 'REPLICA_READ_VIEWS', ())
+                and not self.is_pinned(request)):
+            db_routers.replica_reads_allowed.set(True)
+
+    def is_pinned(self, request):
+        try:
+            return int(request.COOKIES.get(self.PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+class RateLimitMiddleware(AsyncCapableMiddleware):
+    """
+    Middleware throttling the routes listed in RATE_LIMITS (see config/ratelimit.py)
+
+    A request to a limited route, with a limited method, takes a token from
+    each of its buckets; an empty bucket answers 429 with Retry-After
+    before the view runs. Other requests cost one dictionary lookup. Must
+    come after AuthenticationMiddleware (per-user buckets).
+
+    Under ASGI process_view is async, so unlimited requests are not sent
+    to a thread just to be waved through.
+    """
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def rule_for(self, request):
+        from django.conf import settings
+
+        match = request.resolver_match
+        rule = getattr(settings, 'RATE_LIMITS', {}).get(match.view_name if match else None)
+        if rule and request.method in rule.get('methods', ('POST',)):
+            return match.view_name, rule
+        return None, None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route, rule = self.rule_for(request)
+        if rule:
+            return self.limit(request, route, rule)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        route, rule = self.rule_for(request)
+        if rule:
+            # Loading the user and the cache calls are blocking
+            return await sync_to_async(self.limit)(request, route, rule)
+
+    def limit(self, request, route, rule):
+        from . import metrics, ratelimit
+
+        denied = ratelimit.check(request, route, rule)
+        if denied is None:
+            return None
+        kind, wait = denied
+        metrics.inc('django_rate_limited_total', route=route, bucket=kind)
+        return ratelimit.too_many_requests(wait)
@@ -0,0 +1,153 @@
+"""
+Token-bucket rate limiting for write and expensive endpoints
+
+RATE_LIMITS (settings) names the routes to limit, by URL name:
+
+    'create-race': {'methods': ('POST',), 'user': '20/h', 'ip': '60/h'}
+
+Every request to a limited route takes one token from each of its buckets:
+- 'user': one bucket per logged-in user (anonymous requests skip it)
+- 'ip': one bucket per client address (see client_ip)
+- 'route': one bucket shared by everybody - report only: an overrun is
+  logged and counted in metrics but never refused, or a flood from a few
+  dozen addresses would lock every visitor out of the login form
+A rate of '20/h' is a bucket holding 20 tokens, refilled at 20 per hour:
+bursts of up to 20 pass, after that one request every 3 minutes. An empty
+user or ip bucket gets a 429 response with a Retry-After header.
+
+The buckets live in the RATE_LIMIT_CACHE cache so every worker process
+shares them. Each bucket is a single integer - the time (milliseconds)
+at which it would be full again, the "theoretical arrival time" of GCRA -
+moved forward with one atomic cache.incr() per request, and its expiry
+pushed back to that time with cache.touch(). That works with any cache
+whose incr() is atomic (Redis, Memcached, local memory); a request costs
+two cache round trips per bucket.
+
+If the cache is down, requests are let through (and a warning logged):
+losing throttling for a moment is better than losing every form post.
+"""
+import logging
+import math
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('config.ratelimit')
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'20/h' -> (bucket size, milliseconds to refill one token)"""
+    count, period = rate.split('/')
+    count = int(count)
+    seconds = PERIODS[period.strip()[0].lower()]
+    return count, max(1, round(seconds * 1000 / count))
+
+
+def take(key, rate, now=None):
+    """
+    Take a token from the bucket `key`
+
+    Returns 0 if the request may go ahead, else the seconds to wait.
+    `now` (milliseconds) is only passed by tests.
+    """
+    size, interval = parse_rate(rate)
+    capacity = size * interval  # Milliseconds an empty bucket takes to fill up
+    cache = caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+    now = int(time.time() * 1000) if now is None else now
+    timeout = capacity // 1000 + 1
+
+    try:
+        full_at = cache.incr(key, interval)
+    except ValueError:
+        # No bucket yet (or it expired: it was full) - start one
+        if cache.add(key, now + interval, timeout):
+            return 0
+        full_at = cache.incr(key, interval)
+
+    if full_at - interval < now:
+        # The bucket had filled up again since its last use: count from now.
+        # A request racing this one may have its incr() overwritten - it
+        # passes uncounted, one token from a bucket that was full anyway
+        cache.set(key, now + interval, timeout)
+        return 0
+
+    if full_at - now <= capacity:
+        # Keep the key until the bucket is full again: incr() leaves the
+        # expiry alone, so a bucket in steady use would otherwise expire
+        # (and come back full) while still partly drained
+        cache.touch(key, (full_at - now) // 1000 + 1)
+        return 0
+
+    # Empty: give the token back; the next one is due in full_at - capacity
+    cache.decr(key, interval)
+    cache.touch(key, timeout)
+    return (full_at - capacity - now) / 1000
+
+
+def client_ip(request):
+    """
+    The client's address
+
+    Behind RATE_LIMIT_PROXY_COUNT trusted proxies (Heroku's router is one)
+    the address is read from X-Forwarded-For: each proxy appends the
+    address it got the request from, so earlier entries may be forged.
+    """
+    proxies = getattr(settings, 'RATE_LIMIT_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [part.strip() for part in
+                     request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check(request, route, rule):
+    """
+    Take a token from each bucket of `rule` for this request
+
+    Returns (bucket kind, seconds to wait) for the first empty user or ip
+    bucket, or None if the request may go ahead. An empty route bucket is
+    only reported.
+    """
+    from . import metrics
+
+    for kind in ('user', 'ip', 'route'):
+        rate = rule.get(kind)
+        if not rate:
+            continue
+        if kind == 'user':
+            user = getattr(request, 'user', None)
+            if user is None or not user.is_authenticated:
+                continue
+            ident = user.pk
+        elif kind == 'ip':
+            ident = client_ip(request)
+        else:
+            ident = '*'
+        try:
+            wait = take(f'ratelimit:{route}:{kind}:{ident}', rate)
+        except Exception:  # noqa: BLE001 - fail open (see the module docstring)
+            logger.warning("Rate limit cache unavailable", exc_info=True)
+            return None
+        if wait and kind == 'route':
+            metrics.inc('django_rate_limit_route_overruns_total', route=route)
+            logger.warning("Rate limit for all of %s exceeded (not enforced)", route)
+        elif wait:
+            return kind, wait
+    return None
+
+
+def too_many_requests(wait):
+    """The 429 response, Retry-After in whole seconds"""
+    from django.http import HttpResponse
+
+    response = HttpResponse(
+        "Too many requests - please wait a moment and try again.",
+        status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
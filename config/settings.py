@@ -13,9 +13,6 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 import os
 import dj_database_url
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 
 if os.path.isfile("env.py"):
    import env
@@ -46,7 +43,7 @@ INSTALLED_APPS = [
     'cloudinary_storage',
     'django.contrib.sites',        
     'allauth',
-    'allauth.account',
+    'races.apps.AccountConfig',  # allauth.account, accepting config.middleware.AccountMiddleware
     'allauth.socialaccount',
     'django_summernote',
     'cloudinary',
@@ -60,19 +57,158 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
 MIDDLEWARE = [
+    'config.middleware.MetricsMiddleware',  # Per-route latency/SQL metrics (first = times everything)
+    'config.middleware.QueryLogMiddleware',  # Slow / repeated query log context
+    'config.middleware.QueryInspectorMiddleware',  # Dev only: flags N+1 query patterns
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'config.middleware.StaticFilesMiddleware',  # WhiteNoise, usable under ASGI too
     'config.middleware.MediaCacheMiddleware',  # Custom media cache headers
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'config.middleware.ReplicaRoutingMiddleware',  # Read-only pages may use a DB replica
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'config.middleware.RateLimitMiddleware',  # 429 for floods of posts (RATE_LIMITS)
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'allauth.account.middleware.AccountMiddleware',
+    'config.middleware.AccountMiddleware',  # allauth's, async-capable (see races.apps.AccountConfig)
+    'config.middleware.ProfilingMiddleware',  # Staff-only "X-Profile" request profiling
     'config.middleware.SecurityHeadersMiddleware',  # Custom security headers
 ]
 
+# Request metrics exposed at /metrics (Prometheus text format)
+# METRICS_DIR lets gunicorn workers share totals through snapshot files
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = 5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Bearer token for scrapers
+
+# On-demand request profiling (staff send an "X-Profile" header)
+PROFILE_ROOT = os.environ.get('PROFILE_ROOT', os.path.join(BASE_DIR, '.profiles'))
+PROFILE_MAX_COUNT = 50  # Keep at most this many stored profiles
+PROFILE_MAX_AGE_DAYS = 7  # ...and none older than this
+PROFILE_SAMPLE_INTERVAL = 0.001  # Seconds between stack samples ("X-Profile: sample")
+
+# Slow-query log (races/slow_queries.py) - see "Slow Queries" in the admin
+SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+SLOW_QUERY_EXPLAIN_ANALYZE = os.environ.get('SLOW_QUERY_EXPLAIN_ANALYZE') == 'True'  # PostgreSQL only
+SLOW_QUERY_REPEAT_THRESHOLD = 10  # Same query shape this often in one request = N+1
+SLOW_QUERY_REPEAT_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_REPEAT_SAMPLE_RATE', 0.05))  # Share of requests checked for N+1
+
+# Admin lists for tables with millions of rows (races/admin_scale.py):
+# estimated row counts and "Older / Newest" paging instead of COUNT(*) and
+# page numbers
+ADMIN_LARGE_TABLE_MODE = os.environ.get('ADMIN_LARGE_TABLE_MODE') == 'True'
+
+# Background jobs (races/jobs.py) - run them with `manage.py run_workers`
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))  # Seconds between checks when idle
+JOB_MAX_ATTEMPTS = 5  # Default tries before a job is marked failed
+JOB_RETRY_BACKOFF = 10  # Seconds before the first retry; doubles each attempt
+JOB_RETRY_BACKOFF_MAX = 3600  # ...up to this many seconds
+JOB_HEARTBEAT = 60  # Seconds between a running job's heartbeats
+JOB_TIMEOUT = 600  # A running job with no heartbeat for this long is assumed lost and re-queued
+
+# Periodic maintenance (races/scheduler.py, jobs in races/maintenance.py).
+# With SCHEDULER_ENABLED every gunicorn worker runs the scheduler in a
+# thread; a database lock makes sure each job still runs only once.
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED') == 'True'
+SCHEDULER_TICK = 60  # Seconds between checks for due jobs
+SCHEDULER_LEASE = 600  # Non-PostgreSQL databases: seconds before a stuck job's lock expires
+MAINTENANCE_BATCH_SIZE = 1000  # Rows per transaction in maintenance jobs
+RACE_ARCHIVE_AFTER_DAYS = 30  # Races this long over are archived (leave the lists)
+DELETION_REQUEST_RETENTION_DAYS = 90  # Completed deletion requests are kept this long
+
+# Email - notifications go through the outbox (races/outbox.py) and are
+# sent in batches over one connection by the send_outbox job
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS') == 'True'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'Run for Fun <noreply@runforfun.local>')
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')  # For links in emails
+EMAIL_OUTBOX_BATCH_SIZE = 100  # Emails per batch
+EMAIL_OUTBOX_RATE = 10  # At most this many emails per second (0 = no limit)
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5  # Tries before an email is marked failed
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 600  # Seconds before an email claimed by a dead sender is re-queued
+
+# Race page views are counted in memory and added to the database in
+# batches (races/counters.py) - counts lag by up to this many seconds
+VIEW_COUNTER_FLUSH_INTERVAL = float(os.environ.get('VIEW_COUNTER_FLUSH_INTERVAL', 5))  # 0 = only at worker exit
+VIEW_COUNTER_FLUSH_BATCH = 500  # Races per UPDATE statement
+
+# "Trending" race ordering (races/trending.py): recent activity with
+# exponential decay - an event counts half as much after each half-life
+TRENDING_HALF_LIFE_HOURS = 48
+TRENDING_VIEW_WEIGHT = 1  # Per page view
+TRENDING_COMMENT_WEIGHT = 10  # Per comment
+TRENDING_NEW_RACE_WEIGHT = 20  # When the race is approved
+TRENDING_UPCOMING_WEIGHT = 30  # Daily, on race day (less the further away it is)
+TRENDING_UPCOMING_DAYS = 30  # Races closer than this get the daily boost
+
+# "You might also like" on the race page (races/similarity.py): text
+# similarity (TF-IDF cosine, 0 to 1) plus bonuses for shared features
+SIMILAR_RACES_TOP_K = 4  # Recommendations stored per race
+SIMILAR_TEXT_WEIGHT = 1.0
+SIMILAR_DISTANCE_WEIGHT = 0.2  # Same distance
+SIMILAR_DIFFICULTY_WEIGHT = 0.1  # Same difficulty
+SIMILAR_LOCATION_WEIGHT = 0.3  # Same city (a quarter for the same country)
+
+# Async race list / race page (races/async_views.py). config/asgi.py turns
+# this on, so it is set whenever the site is served over ASGI
+# (SERVER_MODE=asgi in gunicorn.conf.py); WSGI keeps the sync views
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == 'True'
+
+# Live comments on the race page (races/live_comments.py) - Server-Sent
+# Events, ASGI only. One poll per worker process feeds every open stream
+LIVE_COMMENTS_POLL_INTERVAL = 1.0  # Seconds between checks for new comments
+LIVE_COMMENTS_HEARTBEAT = 15  # Seconds between keep-alive lines on an idle stream
+LIVE_COMMENTS_MAX_CONNECTIONS = 1000  # Open streams per worker (503 beyond)
+LIVE_COMMENTS_MAX_SECONDS = 600  # A stream then ends and the browser reconnects
+LIVE_COMMENTS_QUEUE_SIZE = 100  # Events a slow stream may fall behind before it is dropped
+LIVE_COMMENTS_REPLAY_LIMIT = 50  # Missed events sent on (re)connect
+LIVE_COMMENTS_RETRY_MS = 3000  # Browser reconnect delay
+LIVE_COMMENTS_RETENTION_HOURS = 24  # Events older than this are pruned (nightly)
+
+# Cache - shared by every worker when REDIS_URL is set (needs the redis
+# package); otherwise each process has its own in-memory cache
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Rate limiting (config/ratelimit.py, config.middleware.RateLimitMiddleware)
+# Token buckets per URL name: 'user' = per logged-in user, 'ip' = per
+# client address (429 when empty), 'route' = one bucket for everybody,
+# only reported to metrics. '10/m' = bursts of 10, refilled at 10 per
+# minute. Only the listed methods are limited.
+RATE_LIMITS = {
+    'race-detail': {'methods': ('POST',), 'user': '10/m', 'ip': '30/m'},  # Comments
+    'create-race': {'methods': ('POST',), 'user': '20/h', 'ip': '60/h'},
+    'request-deletion': {'methods': ('POST',), 'user': '5/h', 'ip': '20/h'},
+    'account_login': {'methods': ('POST',), 'ip': '10/m', 'route': '3000/m'},
+    'account_signup': {'methods': ('POST',), 'ip': '5/h', 'route': '1000/h'},
+}
+RATE_LIMIT_CACHE = 'default'  # Needs atomic incr(): Redis, Memcached or local memory
+# Trusted proxies in front of the app. Behind Heroku's router REMOTE_ADDR is
+# the router, so the Procfile sets 1 - with 0 every visitor would share a
+# handful of 'ip' buckets
+RATE_LIMIT_PROXY_COUNT = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 0))
+
+# Development N+1 detector (config.middleware.QueryInspectorMiddleware)
+QUERY_INSPECTOR_ENABLED = DEBUG
+QUERY_INSPECTOR_LIMIT = 5  # Flag query shapes repeated this often in one request
+QUERY_INSPECTOR_STRICT = False  # Raise instead of logging (the test suite turns this on)
+
 # Security Headers - Improve Best Practices Score
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
@@ -113,6 +249,42 @@ DATABASES = {
    'default': dj_database_url.parse(os.environ.get("DATABASE_URL"))
 }
 
+# Read replicas - comma separated database URLs. Read-only pages listed in
+# REPLICA_READ_VIEWS read from a replica; writes, admin and everything else
+# use the primary. After a write the user reads from the primary for
+# REPLICA_PIN_SECONDS so they always see their own changes.
+DATABASE_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+for number, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f'replica_{number}'] = dict(
+        dj_database_url.parse(url),
+        REPLICA_OF='default',
+        TEST={'MIRROR': 'default'},  # Tests read the primary's test database
+    )
+if DATABASE_REPLICA_URLS:
+    DATABASE_ROUTERS = ['config.db_routers.ReplicaRouter']
+REPLICA_READ_VIEWS = ['race-list', 'race-detail', 'my-races']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+# Connection pooling - each worker process keeps up to DATABASE_POOL_SIZE
+# connections open and reuses them across requests instead of connecting
+# per request (see config/db_backends/pool.py). 0 disables pooling.
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+POOLED_ENGINES = {
+    'django.db.backends.postgresql': 'config.db_backends.postgresql',
+    'django.db.backends.postgresql_psycopg2': 'config.db_backends.postgresql',
+    'django.db.backends.sqlite3': 'config.db_backends.sqlite3',
+}
+for database in DATABASES.values():
+    database['CONN_HEALTH_CHECKS'] = True  # Re-check connections after errors
+    if DATABASE_POOL_SIZE and database['ENGINE'] in POOLED_ENGINES:
+        database['ENGINE'] = POOLED_ENGINES[database['ENGINE']]
+        database['POOL'] = {
+            'MAX_SIZE': DATABASE_POOL_SIZE,
+            'TIMEOUT': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),  # Seconds to wait for a free connection
+            'MAX_LIFETIME': 1800,  # Replace connections after 30 minutes
+            'HEALTH_CHECK_AFTER': 30,  # Ping connections idle for longer than this
+        }
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -196,29 +368,32 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# On-the-fly image resizing (/img/<w>x<h>/<path>) for local media
+IMAGE_CACHE_ROOT = os.environ.get('IMAGE_CACHE_ROOT', os.path.join(BASE_DIR, '.image_cache'))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+IMAGE_PROXY_MAX_DIMENSION = 2400  # Largest width/height the proxy will produce
+IMAGE_PROXY_DEFAULT_SIZE = '1600x1600'  # Used when originals are redirected
+IMAGE_PROXY_UNVERSIONED_MAX_AGE = 300  # Seconds to cache /img/ URLs without ?v= (then revalidate)
+MEDIA_SERVE_ORIGINALS = os.environ.get('MEDIA_SERVE_ORIGINALS', 'False') == 'True'
+
 # Cloudinary Configuration
-if 'CLOUDINARY_URL' in os.environ:
-    # Use the CLOUDINARY_URL if available (most common format)
-    cloudinary.config()
-    # Explicitly set the config as backup
-    cloudinary.config(
-        cloud_name='dece3gnhm',
-        api_key='832681451742447',
-        api_secret='1XTFspXWu98Gs8G7YtAUNmAVC6U',
-        secure=True,
-    )
-else:
-    # Fallback to individual environment variables
-    cloudinary.config(
-        cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME'),
-        api_key=os.environ.get('CLOUDINARY_API_KEY'),
-        api_secret=os.environ.get('CLOUDINARY_API_SECRET'),
-        secure=True,  # Always use HTTPS
-    )
+# The cloudinary package is configured once, when the app registry is ready
+# (config/startup.py configure_cloudinary). It reads CLOUDINARY_URL on its
+# own; these individual environment variables are only used without it.
+CLOUDINARY_CONFIG = {
+    'cloud_name': os.environ.get('CLOUDINARY_CLOUD_NAME'),
+    'api_key': os.environ.get('CLOUDINARY_API_KEY'),
+    'api_secret': os.environ.get('CLOUDINARY_API_SECRET'),
+    'secure': True,  # Always use HTTPS
+}
 
 # Use Cloudinary for media storage in production
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Image deduplication - uploads within this many bits (perceptual hash) of an
+# already stored image reuse it instead of uploading a new copy (0-3, 0 = exact only)
+IMAGE_DEDUPE_MAX_DISTANCE = int(os.environ.get('IMAGE_DEDUPE_MAX_DISTANCE', 3))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
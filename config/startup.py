@@ -0,0 +1,142 @@
+"""
+Process start-up helpers
+
+- configure_cloudinary(): configure the cloudinary package once, when the
+  app registry is ready, instead of while settings are being imported
+- warm_up(): do the expensive "first request" work up front - compile every
+  template, build the URL resolver, load the content type cache and check
+  the database. gunicorn.conf.py runs it in the master process before
+  workers are forked (preload_app), so every worker starts warm and shares
+  the memory copy-on-write.
+
+Database connections opened during warm-up are closed again before
+returning: a socket inherited by several forked workers would be shared by
+all of them and corrupt every conversation on it.
+"""
+import logging
+import os
+import time
+
+logger = logging.getLogger('config.startup')
+
+_cloudinary_configured = False
+
+
+def configure_cloudinary():
+    """Configure the cloudinary package (safe to call more than once)"""
+    global _cloudinary_configured
+    if _cloudinary_configured:
+        return
+    import cloudinary
+    from django.conf import settings
+
+    if 'CLOUDINARY_URL' in os.environ:
+        # cloudinary already parsed CLOUDINARY_URL when it was imported
+        cloudinary.config(secure=True)
+    else:
+        cloudinary.config(**getattr(settings, 'CLOUDINARY_CONFIG', {}))
+    _cloudinary_configured = True
+
+
+def template_names():
+    """Every template file name the configured Django template loaders can find"""
+    from django.template import engines
+
+    names = []
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        if engine is None:
+            continue
+        directories = []
+        for loader in engine.template_loaders:
+            # The cached loader wraps the filesystem / app_directories loaders
+            for inner in getattr(loader, 'loaders', [loader]):
+                if hasattr(inner, 'get_dirs'):
+                    directories.extend(str(path) for path in inner.get_dirs())
+        for directory in directories:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    if filename.endswith(('.html', '.txt', '.xml')):
+                        name = os.path.relpath(os.path.join(root, filename), directory)
+                        names.append((backend, name.replace(os.sep, '/')))
+    return names
+
+
+def compile_templates():
+    """
+    Load (parse and cache) every template; returns (compiled, failed)
+
+    With the cached template loader - Django's default when DEBUG is off -
+    the compiled templates stay in memory for the life of the process.
+    """
+    compiled, failed = 0, 0
+    seen = set()
+    for backend, name in template_names():
+        if (backend.name, name) in seen:
+            continue
+        seen.add((backend.name, name))
+        try:
+            backend.get_template(name)
+            compiled += 1
+        except Exception:  # noqa: BLE001 - e.g. templates of optional features
+            failed += 1
+            logger.debug("Could not compile template %s", name, exc_info=True)
+    return compiled, failed
+
+
+def populate_urls():
+    """Import every view module and build the URL resolver's lookup tables"""
+    from django.urls import get_resolver, reverse
+
+    resolver = get_resolver()
+    resolver.reverse_dict  # noqa: B018 - accessing it populates the resolver
+    reverse('race-list')
+    return len(resolver.reverse_dict)
+
+
+def check_databases():
+    """
+    Connect to every database once, load the content type cache, then close
+
+    Surfaces bad credentials at boot rather than on the first request.
+    """
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import connections
+    from config.db_backends.pool import close_pools
+
+    try:
+        for connection in connections.all():
+            connection.ensure_connection()
+        ContentType.objects.get_for_models(*_project_models())
+    finally:
+        connections.close_all()
+        # Pooled backends only park connections on close - really close them
+        close_pools()
+
+
+def _project_models():
+    from django.apps import apps
+    return [model for model in apps.get_models() if model._meta.app_label == 'races']
+
+
+def warm_up(database=True):
+    """
+    Run every warm-up step and return {step: milliseconds} (plus counts)
+    """
+    timings = {}
+
+    def step(name, function):
+        start = time.perf_counter()
+        result = function()
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    configure_cloudinary()
+    compiled, failed = step('templates_ms', compile_templates)
+    timings['templates_compiled'] = compiled
+    timings['templates_failed'] = failed
+    timings['url_patterns'] = step('urls_ms', populate_urls)
+    if database:
+        step('database_ms', check_databases)
+    logger.info("Warm-up finished: %s", timings)
+    return timings
@@ -18,11 +18,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from config.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('races.urls'), name='home'),  # Include races URLs at root level
     path("accounts/", include("allauth.urls")),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape endpoint
 ]
 
 # Serve media files during development and local testing
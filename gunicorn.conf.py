@@ -0,0 +1,67 @@
+"""
+gunicorn configuration (used by the Procfile)
+
+The application is imported once in the master process (preload_app) and
+warmed up there - templates compiled, URL resolver built, database checked -
+before the workers are forked. Workers then start serving immediately
+instead of paying that cost on their first request, and share the loaded
+code and compiled templates copy-on-write.
+
+WEB_CONCURRENCY and PORT are read by gunicorn itself (Heroku sets both).
+
+SERVER_MODE picks the stack:
+- wsgi (default): config.wsgi on gunicorn's sync workers - one request per
+  worker at a time, including the time spent sending to slow clients
+- asgi: config.asgi on uvicorn workers - the async race list and race page
+  run on an event loop, so waiting on clients costs no thread
+"""
+import os
+
+if os.environ.get('SERVER_MODE') == 'asgi':
+    wsgi_app = 'config.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'config.wsgi:application'
+
+preload_app = True
+# Worker heartbeat files in memory rather than on a (possibly slow) disk
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def when_ready(server):
+    """Master process: the app is loaded - warm it up before forking"""
+    from config import metrics
+    from config.startup import warm_up
+
+    # Snapshots from a previous run would be merged into /metrics otherwise
+    metrics.clear_multiprocess_dir()
+    timings = warm_up()
+    server.log.info("Application warmed up: %s", timings)
+
+
+def post_fork(server, worker):
+    """Worker process: never reuse a database connection from the master"""
+    from django.conf import settings
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        # Drop the inherited handle without closing the master's socket
+        connection.connection = None
+    connections.close_all()
+
+    # Periodic maintenance - every worker ticks, a database lock elects
+    # one of them per job (races/scheduler.py)
+    if getattr(settings, 'SCHEDULER_ENABLED', False):
+        from races.scheduler import start_in_background
+        start_in_background()
+
+    # Buffered race view counts are written every few seconds
+    from races.counters import start_flusher
+    start_flusher()
+
+
+def worker_exit(server, worker):
+    """Worker process: write buffered view counts before exiting"""
+    from races.counters import stop_flusher
+
+    stop_flusher()
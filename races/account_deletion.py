@@ -0,0 +1,107 @@
+"""
+Carry out approved account deletions in small batches
+
+`user.delete()` would cascade through every race and comment of the user
+(and every comment on those races) in one transaction, holding locks on
+all of those rows until it finishes. The executor instead deletes, in
+short transactions of at most `batch_size` rows:
+
+1. the user's own comments
+2. other people's comments on the user's races
+3. the user's races (now without comments, so each delete is cheap)
+4. the user, and the request is marked COMPLETED in the same transaction
+
+with an optional pause between batches to leave room for other traffic.
+
+Progress is simply "what is left in the database", so the executor can be
+stopped or crash at any point and the next run carries on where it left
+off. Counters on the request (deleted_comments / deleted_races) show how
+far it got. complete() is only called once the user row is gone.
+"""
+import logging
+import time
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import rollups
+from .models import AccountDeletionRequest, Comment, Race
+
+logger = logging.getLogger('races.account_deletion')
+
+
+def approved_requests():
+    """Approved requests still waiting for (or part way through) deletion"""
+    return AccountDeletionRequest.objects.filter(status='APPROVED').order_by('reviewed_at', 'pk')
+
+
+def delete_in_batches(queryset, batch_size, pause=0.0, on_batch=None):
+    """
+    Delete every row of `queryset`, at most `batch_size` rows per transaction
+
+    Returns the number of rows deleted. `on_batch(count)` runs inside each
+    batch's transaction (used to keep the progress counters exact).
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return total
+            queryset.model._base_manager.filter(pk__in=ids).delete()
+            if on_batch is not None:
+                on_batch(len(ids))
+        total += len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def execute(deletion_request, batch_size=500, pause=0.0):
+    """
+    Delete the account of one APPROVED request; returns a summary dict
+
+    Safe to call again on a request that was interrupted half way.
+    """
+    if deletion_request.status != 'APPROVED':
+        raise ValueError(f"Request {deletion_request.pk} is {deletion_request.status}, not APPROVED")
+
+    pending = AccountDeletionRequest.objects.filter(pk=deletion_request.pk)
+    if deletion_request.processing_started_at is None:
+        deletion_request.processing_started_at = timezone.now()
+        pending.update(processing_started_at=deletion_request.processing_started_at)
+    # Stop the user logging in and adding content while we delete it
+    User.objects.filter(pk=deletion_request.user_id, is_active=True).update(is_active=False)
+
+    def count(field):
+        return lambda deleted: pending.update(**{field: F(field) + deleted})
+
+    user_id = deletion_request.user_id
+    summary = {'request': deletion_request.pk, 'username': deletion_request.username,
+               'comments': 0, 'races': 0}
+    if user_id is not None:
+        # Comments per month, for the dashboard counters (races/rollups.py)
+        counted = rollups.tally(Comment.objects.filter(
+            Q(author_id=user_id) | Q(race__created_by_id=user_id)))
+        summary['comments'] += delete_in_batches(
+            Comment.objects.filter(author_id=user_id), batch_size, pause,
+            count('deleted_comments'))
+        summary['comments'] += delete_in_batches(
+            Comment.objects.filter(race__created_by_id=user_id), batch_size, pause,
+            count('deleted_comments'))
+        summary['races'] = delete_in_batches(
+            Race.all_objects.filter(created_by_id=user_id), batch_size, pause,
+            count('deleted_races'))
+        rollups.record({key: -rows for key, rows in counted.items()})
+
+    # The user row and the status change commit together - a request is
+    # never COMPLETED while its account still exists
+    with transaction.atomic():
+        if user_id is not None:
+            User.objects.filter(pk=user_id).delete()  # Clears deletion_request.user too
+        deletion_request.refresh_from_db()
+        deletion_request.complete()
+    logger.info("Deleted account %s: %s", deletion_request.username, summary)
+    return summary
+
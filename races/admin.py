@@ -1,10 +1,20 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils import timezone
-from .models import Race, Comment, AccountDeletionRequest
+from .models import (Race, Comment, AccountDeletionRequest, StoredImage, RequestProfile,
+                     SlowQuery, ModerationLog, Job, ScheduledTask, OutboxEmail, StatCounter)
+from . import moderation
+from .admin_scale import AutocompleteFilter, LargeTableAdminMixin
+
+
+class RaceAutocompleteFilter(AutocompleteFilter):
+    """Filter comments by race without listing every race in the sidebar"""
+    title = 'race'
+    field_name = 'race'
 
 
 @admin.register(Race)
-class RaceAdmin(admin.ModelAdmin):
+class RaceAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """ admin interface for Race model with approval system"""
     
     # What columns to show in the race list
@@ -18,6 +28,9 @@ class RaceAdmin(admin.ModelAdmin):
         'created_by'
     ]
     
+    # Fetch the creator in the same query instead of one query per row
+    list_select_related = ['created_by']
+    
     # Add filters in the right sidebar
     list_filter = [
         'approved',
@@ -73,17 +86,8 @@ class RaceAdmin(admin.ModelAdmin):
     
     # Custom admin actions
     def approve_races(self, request, queryset):
-        """Bulk action to approve selected races"""
-        from django.utils import timezone
-        
-        updated = 0
-        for race in queryset:
-            if not race.approved:
-                race.approved = True
-                race.approved_by = request.user
-                race.approved_at = timezone.now()
-                race.save()
-                updated += 1
+        """Bulk action to approve selected races (one UPDATE for all of them)"""
+        updated = moderation.approve_races(queryset, request.user)
         
         self.message_user(
             request,
@@ -93,11 +97,7 @@ class RaceAdmin(admin.ModelAdmin):
     
     def unapprove_races(self, request, queryset):
         """Bulk action to unapprove selected races"""
-        updated = queryset.update(
-            approved=False,
-            approved_by=None,
-            approved_at=None
-        )
+        updated = moderation.unapprove_races(queryset, request.user)
         self.message_user(
             request,
             f'{updated} race(s) have been unapproved.'
@@ -108,11 +108,25 @@ class RaceAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not change:  # Only when creating new race
             obj.created_by = request.user
-        super().save_model(request, obj, form, change)
+        if not (change and 'approved' in form.changed_data):
+            super().save_model(request, obj, form, change)
+            return
+        # Ticking or unticking "approved" goes through races/moderation.py,
+        # like the bulk actions: logged, creator emailed, lists updated
+        approved = obj.approved
+        obj.approved = not approved
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            race = Race.all_objects.filter(pk=obj.pk)
+            if approved:
+                moderation.approve_races(race, request.user)
+            else:
+                moderation.unapprove_races(race, request.user)
+        obj.refresh_from_db(fields=['approved', 'approved_by', 'approved_at'])
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin interface for Comment model"""
     
     # What columns to show in the comments list
@@ -124,11 +138,15 @@ class CommentAdmin(admin.ModelAdmin):
         'approved'
     ]
     
+    # Fetch race and author in the same query instead of two per row
+    list_select_related = ['race', 'author']
+    
     # Add filters in the right sidebar
+    # (the race filter searches as you type instead of listing every race)
     list_filter = [
         'approved',
         'created_on',
-        'race'
+        RaceAutocompleteFilter
     ]
     
     # Add search functionality
@@ -149,18 +167,21 @@ class CommentAdmin(admin.ModelAdmin):
 
 
 @admin.register(AccountDeletionRequest)
-class AccountDeletionRequestAdmin(admin.ModelAdmin):
+class AccountDeletionRequestAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin interface for Account Deletion Requests"""
     
     # What columns to show in the deletion requests list
     list_display = [
-        'user',
+        'username',
         'status',
         'requested_at',
         'reviewed_by',
         'reviewed_at'
     ]
     
+    # Fetch the reviewer in the same query
+    list_select_related = ['reviewed_by']
+    
     # Add filters in the right sidebar
     list_filter = [
         'status',
@@ -170,6 +191,7 @@ class AccountDeletionRequestAdmin(admin.ModelAdmin):
     
     # Add search functionality
     search_fields = [
+        'username',
         'user__username',
         'user__email',
         'reason',
@@ -182,17 +204,21 @@ class AccountDeletionRequestAdmin(admin.ModelAdmin):
     # Make some fields read-only
     readonly_fields = [
         'user',
+        'username',
         'reason',
         'requested_at',
         'reviewed_at',
-        'completed_at'
+        'completed_at',
+        'processing_started_at',
+        'deleted_comments',
+        'deleted_races'
     ]
     
     # Group form fields logically
     fieldsets = (
         ('Request Details', {
             'fields': (
-                'user', 'reason', 'requested_at'
+                'user', 'username', 'reason', 'requested_at'
             )
         }),
         ('Admin Review', {
@@ -201,17 +227,19 @@ class AccountDeletionRequestAdmin(admin.ModelAdmin):
         ('Review Info', {
             'fields': ('reviewed_by', 'reviewed_at', 'completed_at'),
             'classes': ('collapse',)  # Starts collapsed
+        }),
+        ('Deletion Progress', {
+            # Filled in by the process_account_deletions command
+            'fields': ('processing_started_at', 'deleted_comments', 'deleted_races'),
+            'classes': ('collapse',)
         })
     )
     
     # Custom admin actions
     def approve_deletion(self, request, queryset):
         """Bulk action to approve selected deletion requests"""
-        updated = 0
-        for deletion_request in queryset.filter(status='PENDING'):
-            deletion_request.approve(request.user, 
-                                   "Approved via admin bulk action")
-            updated += 1
+        updated = moderation.approve_deletion_requests(
+            queryset, request.user, "Approved via admin bulk action")
         
         self.message_user(
             request,
@@ -221,11 +249,8 @@ class AccountDeletionRequestAdmin(admin.ModelAdmin):
     
     def reject_deletion(self, request, queryset):
         """Bulk action to reject selected deletion requests"""
-        updated = 0
-        for deletion_request in queryset.filter(status='PENDING'):
-            deletion_request.reject(request.user, 
-                                  "Rejected via admin bulk action")
-            updated += 1
+        updated = moderation.reject_deletion_requests(
+            queryset, request.user, "Rejected via admin bulk action")
         
         self.message_user(
             request,
@@ -235,10 +260,310 @@ class AccountDeletionRequestAdmin(admin.ModelAdmin):
     
     actions = ['approve_deletion', 'reject_deletion']
     
-    # Automatically set the reviewer to current user when saving
+    # Approving or rejecting on the change form goes through
+    # races/moderation.py, like the bulk actions: the reviewer is set, the
+    # user emailed and (once approved) the deletion job queued
     def save_model(self, request, obj, form, change):
-        if change and 'status' in form.changed_data:
-            if obj.status in ['APPROVED', 'REJECTED'] and not obj.reviewed_by:
-                obj.reviewed_by = request.user
-                obj.reviewed_at = timezone.now()
-        super().save_model(request, obj, form, change)
+        status = obj.status
+        if not (change and 'status' in form.changed_data and status in ['APPROVED', 'REJECTED']):
+            super().save_model(request, obj, form, change)
+            return
+        obj.status = 'PENDING'
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            deletion_request = AccountDeletionRequest.objects.filter(pk=obj.pk)
+            if status == 'APPROVED':
+                moderation.approve_deletion_requests(deletion_request, request.user, obj.admin_notes)
+            else:
+                moderation.reject_deletion_requests(deletion_request, request.user, obj.admin_notes)
+        obj.refresh_from_db(fields=['status', 'reviewed_by', 'reviewed_at', 'admin_notes'])
+
+
+@admin.register(StoredImage)
+class StoredImageAdmin(admin.ModelAdmin):
+    """Read-only view of the image fingerprints used for deduplication"""
+
+    list_display = ['public_id', 'phash', 'width', 'height', 'created_at']
+    search_fields = ['public_id', 'content_hash', 'phash']
+    readonly_fields = [
+        'content_hash', 'phash', 'phash_band_0', 'phash_band_1',
+        'phash_band_2', 'phash_band_3', 'public_id', 'width', 'height',
+        'created_at'
+    ]
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Recent profiled requests, slowest first, with profile downloads"""
+
+    list_display = [
+        'route',
+        'method',
+        'status_code',
+        'duration_ms',
+        'query_count',
+        'sql_ms',
+        'template_ms',
+        'user',
+        'created_at',
+        'download_link'
+    ]
+    list_filter = ['route', 'method', 'created_at']
+    search_fields = ['path', 'route']
+    ordering = ['-duration_ms']
+    list_select_related = ['user']
+    readonly_fields = [
+        'created_at', 'path', 'route', 'method', 'status_code', 'duration_ms',
+        'query_count', 'sql_ms', 'template_ms', 'user', 'download_link',
+        'sql_log', 'template_timings'
+    ]
+    exclude = ['artifact', 'details']
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        from django.urls import path
+        custom = [
+            path('<int:pk>/download/',
+                 self.admin_site.admin_view(self.download_view),
+                 name='races_requestprofile_download'),
+        ]
+        return custom + super().get_urls()
+
+    def download_view(self, request, pk):
+        """Stream the stored .prof / .folded file"""
+        from django.http import FileResponse, Http404
+        from django.shortcuts import get_object_or_404
+
+        if not self.has_view_permission(request):
+            raise Http404
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        try:
+            handle = open(profile.artifact_path, 'rb')
+        except FileNotFoundError:
+            raise Http404("Profile file has been removed.")
+        return FileResponse(handle, as_attachment=True, filename=profile.artifact)
+
+    # Custom display methods
+    def download_link(self, obj):
+        """Link to download the raw profile file"""
+        from django.urls import reverse
+        from django.utils.html import format_html
+        url = reverse('admin:races_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.artifact.rsplit('.', 1)[-1])
+    download_link.short_description = 'Profile'
+
+    def sql_log(self, obj):
+        """Every captured query with its time"""
+        from django.utils.html import format_html_join
+        return format_html_join(
+            '\n', '<div><code>{} ms</code> {}</div>',
+            ((query['ms'], query['sql']) for query in obj.details.get('queries', []))
+        )
+    sql_log.short_description = 'SQL log'
+
+    def template_timings(self, obj):
+        """Template render times"""
+        from django.utils.html import format_html_join
+        return format_html_join(
+            '\n', '<div><code>{} ms</code> {}</div>',
+            ((entry['ms'], entry['template']) for entry in obj.details.get('templates', []))
+        )
+    template_timings.short_description = 'Templates'
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    """Aggregated slow and repeated (N+1) queries, most total time first"""
+
+    list_display = [
+        'short_sql',
+        'kind',
+        'count',
+        'average_ms_display',
+        'max_ms',
+        'view',
+        'location',
+        'last_seen'
+    ]
+    list_filter = ['kind', 'view']
+    search_fields = ['normalized_sql', 'view', 'location']
+    ordering = ['-total_ms']
+    readonly_fields = [
+        'kind', 'normalized_sql', 'sample_sql', 'view', 'location', 'explain',
+        'count', 'total_ms', 'max_ms', 'first_seen', 'last_seen'
+    ]
+    exclude = ['fingerprint']
+
+    def has_add_permission(self, request):
+        return False
+
+    # Custom display methods
+    def short_sql(self, obj):
+        """First 100 characters of the normalized query"""
+        sql = obj.normalized_sql
+        return sql[:100] + "..." if len(sql) > 100 else sql
+    short_sql.short_description = 'Query'
+
+    def average_ms_display(self, obj):
+        return f"{obj.average_ms:.1f}"
+    average_ms_display.short_description = 'Avg ms'
+
+
+@admin.register(ModerationLog)
+class ModerationLogAdmin(admin.ModelAdmin):
+    """Read-only audit trail of bulk moderation actions"""
+
+    list_display = ['action', 'object_type', 'object_id', 'moderator', 'notes', 'created_at']
+    list_filter = ['action', 'created_at']
+    search_fields = ['moderator__username', 'notes']
+    list_select_related = ['moderator']
+    readonly_fields = ['action', 'object_type', 'object_id', 'moderator', 'notes', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Background jobs, with queue depth and latency above the list"""
+
+    list_display = ['task', 'status', 'attempts', 'run_at', 'started_at', 'finished_at', 'worker']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'idempotency_key', 'last_error']
+    readonly_fields = [
+        'task', 'kwargs', 'status', 'priority', 'idempotency_key', 'run_at', 'attempts',
+        'max_attempts', 'last_error', 'worker', 'created_at', 'started_at', 'heartbeat_at',
+        'finished_at'
+    ]
+    change_list_template = 'admin/races/job/change_list.html'
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        from .jobs import queue_stats
+        extra_context = dict(extra_context or {}, queue_stats=queue_stats())
+        return super().changelist_view(request, extra_context)
+
+    # Custom admin actions
+    def retry_jobs(self, request, queryset):
+        """Run failed (or stuck) jobs again from the first attempt"""
+        updated = queryset.exclude(status=Job.DONE).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(), last_error='')
+        self.message_user(request, f'{updated} job(s) queued again.')
+    retry_jobs.short_description = "Retry selected jobs"
+
+
+@admin.register(ScheduledTask)
+class ScheduledTaskAdmin(admin.ModelAdmin):
+    """Periodic maintenance jobs: when they last ran and how it went"""
+
+    list_display = [
+        'name', 'last_succeeded', 'last_started_at', 'last_duration_ms', 'next_run_at',
+        'last_result'
+    ]
+    readonly_fields = [
+        'name', 'next_run_at', 'last_started_at', 'last_finished_at', 'last_duration_ms',
+        'last_result', 'last_succeeded', 'locked_by', 'locked_until'
+    ]
+    actions = ['run_now']
+
+    def has_add_permission(self, request):
+        return False
+
+    # Custom admin actions
+    def run_now(self, request, queryset):
+        """Run the selected jobs now (still only if no other process is running them)"""
+        from .scheduler import tick
+        ran = tick(names=set(queryset.values_list('name', flat=True)), force=True)
+        self.message_user(request, f'Ran: {", ".join(ran) or "nothing (already running)"}')
+    run_now.short_description = "Run selected jobs now"
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    """Queued, sent and failed notification emails"""
+
+    list_display = ['subject', 'to', 'kind', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['to', 'subject']
+    readonly_fields = [
+        'kind', 'to', 'subject', 'body', 'status', 'attempts', 'last_error', 'send_after',
+        'created_at', 'sent_at'
+    ]
+    actions = ['retry_emails']
+
+    def has_add_permission(self, request):
+        return False
+
+    # Custom admin actions
+    def retry_emails(self, request, queryset):
+        """Queue failed emails again"""
+        updated = queryset.filter(status=OutboxEmail.FAILED).update(
+            status=OutboxEmail.PENDING, attempts=0, send_after=timezone.now())
+        self.message_user(request, f'{updated} email(s) queued again.')
+    retry_emails.short_description = "Retry selected failed emails"
+
+
+@admin.register(StatCounter)
+class StatCounterAdmin(admin.ModelAdmin):
+    """
+    Statistics dashboard - counts read from the rollup counters only
+
+    No GROUP BY over races or comments when the page loads; the counters
+    are kept current as rows change (races/rollups.py).
+    """
+
+    list_display = ['name', 'key', 'value', 'updated_at']
+    list_filter = ['name']
+    readonly_fields = ['name', 'key', 'value', 'updated_at']
+    change_list_template = 'admin/races/statcounter/change_list.html'
+    actions = ['rebuild_counters']
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        from .rollups import dashboard
+        counters = dashboard()
+        distances = dict(Race.DISTANCE_CHOICES)
+        difficulties = dict(Race.DIFFICULTY_CHOICES)
+        approval = dict(counters['race_approval'])
+        deletions = dict(counters['deletion_requests'])
+        stats = {
+            'total_races': sum(approval.values()),
+            'pending_approvals': approval.get('pending', 0),
+            # Waiting for review, or approved and waiting for the executor
+            'deletion_backlog': deletions.get('PENDING', 0) + deletions.get('APPROVED', 0),
+            'tables': [
+                ("Races by country", sorted(counters['races_by_country'],
+                                            key=lambda row: -row[1])),
+                ("Races by distance", [(distances.get(key, key), value)
+                                       for key, value in counters['races_by_distance']]),
+                ("Races by difficulty", [(difficulties.get(key, key), value)
+                                         for key, value in counters['races_by_difficulty']]),
+                ("Races by month", counters['races_by_month']),
+                ("Comments by month", counters['comments_by_month']),
+                ("Deletion requests", counters['deletion_requests']),
+            ],
+        }
+        extra_context = dict(extra_context or {}, stats=stats)
+        return super().changelist_view(request, extra_context)
+
+    # Custom admin actions
+    def rebuild_counters(self, request, queryset):
+        """Queue a job recomputing every counter (slow on big tables)"""
+        from .jobs import enqueue
+        if Job.objects.filter(task='races.rebuild_rollups',
+                              status__in=(Job.QUEUED, Job.RUNNING)).exists():
+            self.message_user(request, 'A rebuild is already queued.')
+            return
+        enqueue('races.rebuild_rollups')
+        self.message_user(request, 'Rebuild queued; the counters update when the job has run.')
+    rebuild_counters.short_description = "Rebuild all statistics from scratch"
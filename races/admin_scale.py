@@ -0,0 +1,215 @@
+"""
+Admin changelists that stay fast on very large tables
+
+The stock changelist runs COUNT(*) over the filtered table (twice when
+filtering), builds "page N of M" links with OFFSET queries that get slower
+the deeper you page, and filters on a foreign key by listing every related
+row in the sidebar. LargeTableAdminMixin replaces those pieces:
+
+- AutocompleteFilter: a foreign-key filter that searches the related
+  table as you type (admin autocomplete endpoint) instead of loading it
+- always on: joined selects (list_select_related) and no second
+  "total" COUNT(*) (show_full_result_count = False)
+- with ADMIN_LARGE_TABLE_MODE on:
+    * EstimatedCountPaginator - row counts from the PostgreSQL planner
+      statistics (pg_class.reltuples / EXPLAIN) instead of COUNT(*);
+      exact counts are still used for small results and other databases
+    * KeysetChangeList - "Older" / "Newest" links that continue from the
+      last primary key shown (WHERE pk < last ORDER BY pk DESC LIMIT n),
+      so every page costs the same as the first. Used while the list is
+      in its default order; sorting by a column falls back to pages.
+"""
+import json
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import ALL_VAR, ORDER_VAR, ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+CURSOR_VAR = 'cursor'
+
+# Below this many (estimated) rows an exact COUNT(*) is cheap enough
+EXACT_COUNT_BELOW = 10000
+
+
+def large_table_mode():
+    return getattr(settings, 'ADMIN_LARGE_TABLE_MODE', False)
+
+
+def estimate_count(queryset):
+    """
+    Planner estimate of the number of rows `queryset` returns, or None
+
+    Unfiltered tables use pg_class.reltuples (kept up to date by
+    autovacuum / ANALYZE); filtered querysets use EXPLAIN's row estimate.
+    Only PostgreSQL keeps usable statistics, so other databases get None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            # reltuples is -1 for a table that was never analyzed
+            return row[0] if row and row[0] >= 0 else None
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator whose count comes from planner statistics on big results"""
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < EXACT_COUNT_BELOW:
+            return super().count
+        return estimate
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist paging by primary key instead of OFFSET
+
+    `?cursor=<pk>` shows the rows with a smaller primary key than <pk>.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR) or None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Changing filters or sorting starts again from the newest rows
+        remove = list(remove or [])
+        if not new_params or CURSOR_VAR not in new_params:
+            remove.append(CURSOR_VAR)
+        return super().get_query_string(new_params, remove)
+
+    def get_ordering(self, request, queryset):
+        if ORDER_VAR not in self.params:
+            return ['-pk']
+        return super().get_ordering(request, queryset)
+
+    @property
+    def keyset(self):
+        # Only the default newest-first order can be paged by primary key
+        return ORDER_VAR not in self.params and ALL_VAR not in self.params
+
+    def get_results(self, request):
+        self.next_cursor_url = self.newest_url = None
+        if not self.keyset:
+            return super().get_results(request)
+
+        queryset = self.queryset
+        if self.cursor is not None:
+            try:
+                queryset = queryset.filter(pk__lt=int(self.cursor))
+            except ValueError:
+                self.cursor = None
+        rows = list(queryset[:self.list_per_page + 1])
+        has_next = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = has_next or self.cursor is not None
+        self.paginator = paginator
+        self.next_cursor_url = (
+            self.get_query_string({CURSOR_VAR: rows[-1].pk}) if has_next else None)
+        self.newest_url = self.get_query_string(remove=[CURSOR_VAR]) if self.cursor else None
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    Sidebar filter on a foreign key, using the admin autocomplete widget
+
+    Subclass and set `field_name` (and `title`). The related model's admin
+    must define search_fields. Only the selected object is ever loaded.
+    """
+
+    template = 'admin/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = f'{self.field_name}__id__exact'
+        super().__init__(request, params, model, model_admin)
+        field = model._meta.get_field(self.field_name)
+        # The form field hands the widget its (lazy) choices; only the
+        # selected value is ever looked up
+        self.widget = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site), required=False,
+        ).widget
+        self.rendered_widget = self.widget.render(
+            self.parameter_name, self.value(),
+            attrs={'id': f'autocomplete-filter-{self.field_name}', 'data-filter-autocomplete': '1'},
+        )
+
+    def has_output(self):
+        return True
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'All',
+        }
+        # Template needs the base URL to add the chosen value to
+        self.base_query_string = changelist.get_query_string(remove=[self.parameter_name])
+
+
+class LargeTableAdminMixin:
+    """ModelAdmin mixin switching on the large-table changelist features"""
+
+    show_full_result_count = False
+    change_list_template = 'admin/large_table_change_list.html'
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        if large_table_mode():
+            return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+
+    def get_changelist(self, request, **kwargs):
+        if large_table_mode():
+            return KeysetChangeList
+        return super().get_changelist(request, **kwargs)
+
+    @property
+    def media(self):
+        # select2 + autocomplete.js for AutocompleteFilter
+        media = super().media
+        if any(isinstance(spec, type) and issubclass(spec, AutocompleteFilter)
+               for spec in self.list_filter):
+            media += AutocompleteSelect(None, self.admin_site).media
+        return media
@@ -1,6 +1,58 @@
+import logging
+
+from allauth.account import apps as allauth_apps
 from django.apps import AppConfig
 
+logger = logging.getLogger('races.apps')
+
 
 class RacesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'races'
+
+    def ready(self):
+        """Configure Cloudinary and connect signal receivers once the app registry is ready"""
+        from django.core.signals import request_finished
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from config import metrics
+        from config.startup import configure_cloudinary
+        from . import maintenance, profiling, signals, slow_queries, tasks  # noqa: F401 - registers receivers, tasks and jobs
+
+        configure_cloudinary()
+
+        # Watch every query on every database connection
+        connection_created.connect(slow_queries.install)
+        connection_created.connect(metrics.install_query_timer)
+        connection_created.connect(profiling.install)
+        request_finished.connect(slow_queries.flush_on_request_finished)
+        for connection in connections.all(initialized_only=True):
+            slow_queries.install(connection)
+            metrics.install_query_timer(connection)
+            profiling.install(connection)
+
+
+class AccountConfig(allauth_apps.AccountConfig):
+    """
+    allauth's account app, with our AccountMiddleware in MIDDLEWARE
+
+    allauth's ready() only checks that its own middleware's dotted path is
+    in MIDDLEWARE; config.middleware.AccountMiddleware, the async-capable
+    subclass, stands in for it there.
+    """
+
+    default = False  # Not picked for the races app itself
+
+    def ready(self):
+        import allauth
+        from django.conf import settings
+        from django.core.exceptions import ImproperlyConfigured
+        from config.middleware import AccountMiddleware
+
+        paths = {'allauth.account.middleware.AccountMiddleware', 'config.middleware.AccountMiddleware'}
+        if not paths.intersection(settings.MIDDLEWARE):
+            raise ImproperlyConfigured(
+                "config.middleware.AccountMiddleware must be added to settings.MIDDLEWARE")
+        if not AccountMiddleware.async_capable:
+            logger.warning("django-allauth %s is not %s: AccountMiddleware runs synchronously",
+                           allauth.__version__, AccountMiddleware.ALLAUTH_VERSION)
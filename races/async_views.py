@@ -0,0 +1,194 @@
+"""
+Async versions of the race list and the race page (served over ASGI)
+
+Same pages, same queries as race_list / race_detail in views.py, written
+with Django's async ORM (acount, aget, aiterator). Under ASGI (config/asgi.py
+sets ASYNC_VIEWS) they run on the event loop: while a request waits for the
+database or for a slow client to read the page, the worker serves others
+instead of holding a thread.
+
+Rules for code in this module:
+- every query is awaited; templates get plain lists, never lazy querysets
+  (a query started while rendering raises SynchronousOnlyOperation)
+- request.user is loaded up front in a thread (Django 4.2 has no
+  request.auser()); that also loads the session the messages and CSRF
+  code read later
+- writes (the comment form POST) stay in the sync view, run in a thread
+
+race_comments_live is ASGI-only: a Server-Sent Events stream of the race's
+new comments (races/live_comments.py).
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import render
+
+from . import live_comments, views
+from .counters import record_view
+from .models import Race
+from .similarity import similar_races
+from .trending import trending_races
+
+
+def _load_user(request):
+    """Resolve the lazy request.user (and with it the session)"""
+    request.user.is_authenticated  # noqa: B018 - evaluates the lazy object
+    request.session.keys()
+    return request.user
+
+
+async def _page(queryset, per_page, number):
+    """paginator.get_page() with the COUNT and the page rows fetched async"""
+    paginator = Paginator(queryset, per_page)
+    # Paginator.count is a cached_property - fill the cache ourselves
+    paginator.count = await queryset.acount()
+    page = paginator.get_page(number)
+    page.object_list = [obj async for obj in page.object_list.aiterator()]
+    return page
+
+
+async def race_list(request):
+    """
+    VIEW 1 (async): Homepage - Display races based on user permissions
+
+    See views.race_list: the same races for the same users, 6 per page,
+    with the ?sort=trending ordering.
+    """
+
+    # STEP 1: Load the user, then pick the base queryset exactly like the sync view
+    user = await sync_to_async(_load_user)(request)
+    if user.is_authenticated and (user.is_staff or user.is_superuser):
+        races = Race.objects.filter(status=1).order_by('race_date')
+    elif user.is_authenticated:
+        from django.db.models import Q
+        races = Race.objects.filter(
+            Q(status=1, approved=True) |
+            Q(status=1, created_by=user)
+        ).order_by('race_date')
+    else:
+        races = Race.objects.filter(status=1, approved=True).order_by('race_date')
+
+    sort = request.GET.get('sort')
+    if sort == 'trending':
+        races = trending_races()
+    else:
+        sort = 'date'
+
+    # STEP 2: Count the races and fetch this page's rows (two awaited queries)
+    page_obj = await _page(races, 6, request.GET.get('page'))
+
+    # STEP 3: Render - everything the template reads is already in memory
+    context = {
+        'races': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
+        'page_obj': page_obj,
+        'sort': sort,
+    }
+    return render(request, 'races/race_list.html', context)
+
+
+async def race_detail(request, pk):
+    """
+    VIEW 2 (async): Race Detail Page - Show race with comments
+
+    See views.race_detail. Posting a comment is handed to the sync view.
+    """
+
+    # STEP 1: Comment submissions write to the database - use the sync view
+    if request.method == "POST":
+        return await sync_to_async(views.race_detail)(request, pk)
+
+    # STEP 2: Get the race (published or archived) and check who may see it
+    user = await sync_to_async(_load_user)(request)
+    try:
+        race = await Race.objects.select_related('created_by').aget(pk=pk, status__in=(1, 2))
+    except Race.DoesNotExist:
+        raise Http404("No Race matches the given query.")
+    if not race.is_visible_to_user(user):
+        raise Http404("Race not found or not available.")
+
+    # STEP 3: Get the approved comments, newest first, with their authors
+    comments = [
+        comment async for comment in
+        race.comments.filter(approved=True).select_related('author')
+        .order_by('-created_on').aiterator()
+    ]
+
+    # STEP 4: Get the precomputed "You might also like" races
+    similar = [other async for other in similar_races(race).aiterator()]
+
+    # STEP 5: Count the page view (in memory only - see races/counters.py)
+    record_view(race.pk)
+
+    # STEP 6: Render with the fetched rows
+    # live_comments = the page subscribes to the comment stream below
+    context = {
+        'race': race,
+        'comments': comments,
+        'comment_count': len(comments),
+        'similar_races': similar,
+        'live_comments': True,
+    }
+    return render(request, 'races/race_detail.html', context)
+
+
+async def _visible_race(request, pk):
+    """The race at `pk` if this user may see it, else Http404"""
+    user = await sync_to_async(_load_user)(request)
+    try:
+        race = await Race.objects.aget(pk=pk, status__in=(1, 2))
+    except Race.DoesNotExist:
+        raise Http404("No Race matches the given query.")
+    if not race.is_visible_to_user(user):
+        raise Http404("Race not found or not available.")
+    return race
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def race_comments_live(request, pk):
+    """
+    VIEW 11 (async): Live comments - Server-Sent Events stream for one race
+
+    Sends each newly approved comment as a rendered card, so the race page
+    can add it without reloading. See races/live_comments.py.
+    """
+
+    # STEP 1: Only on the ASGI stack - under WSGI an open stream would hold
+    # a whole worker. 204 tells EventSource not to reconnect
+    if not getattr(settings, 'ASYNC_VIEWS', False):
+        return HttpResponse(status=204)
+
+    # STEP 2: Same visibility rules as the race page
+    race = await _visible_race(request, pk)
+
+    # STEP 3: Respect the per-worker connection cap
+    if live_comments.hub.full():
+        response = HttpResponse("Too many live connections, try again later.", status=503)
+        response['Retry-After'] = str(getattr(settings, 'LIVE_COMMENTS_RETRY_MS', 3000) // 1000 or 1)
+        return response
+
+    # STEP 4: Where to start - after the browser's Last-Event-ID when it
+    # reconnects, else from the time the page was rendered (?since=)
+    after_id = _int_or_none(request.headers.get('Last-Event-ID'))
+    since = _int_or_none(request.GET.get('since'))
+    if since is not None:
+        try:
+            since = datetime.fromtimestamp(since, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            since = None
+
+    # STEP 5: Stream (the connection stays open; events are pushed as they come)
+    response = StreamingHttpResponse(
+        live_comments.stream(race.pk, after_id, since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Proxies must not buffer the stream
+    return response
@@ -0,0 +1,203 @@
+"""
+Write-buffered view counters
+
+Counting a page view with `UPDATE races_race SET view_count = view_count + 1`
+on every request would turn race_detail into a write path, and popular
+races into row-lock hot spots. Instead each process counts views in
+memory:
+
+    record_view(race.pk)        # a dict increment under a lock - no SQL
+
+and a background thread, started in every gunicorn worker, flushes the
+buffer every VIEW_COUNTER_FLUSH_INTERVAL seconds with batched multi-row
+UPDATEs, up to VIEW_COUNTER_FLUSH_BATCH races per statement:
+
+    UPDATE races_race
+    SET view_count = view_count + CASE id WHEN 7 THEN 31 WHEN 9 THEN 2 ... END
+    WHERE id IN (7, 9, ...)
+
+Counts in the database are therefore eventually consistent (a few seconds
+behind). If a flush fails, the increments go back into the buffer and are
+retried. On graceful shutdown the buffer is flushed one last time
+(gunicorn's worker_exit hook, and atexit as a fallback), so increments are
+not lost.
+
+Flush lag - how long the oldest increment waited to be written - and flush
+timings are exported on /metrics (config/metrics.py).
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, PositiveBigIntegerField, Value, When
+
+from config import metrics
+
+logger = logging.getLogger('races.counters')
+
+
+class CounterBuffer:
+    """In-memory increments for one integer column, flushed in batches"""
+
+    def __init__(self, model, field, name, on_flush=None):
+        self.model = model
+        self.field = field
+        self.name = name
+        self.on_flush = on_flush  # Called with {pk: amount} after each successful flush
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._oldest = None  # time.time() of the oldest unflushed increment
+        self.last_flush_at = None
+
+    def add(self, pk, amount=1):
+        with self._lock:
+            self._pending[pk] = self._pending.get(pk, 0) + amount
+            if self._oldest is None:
+                self._oldest = time.time()
+
+    def pending(self):
+        """Copy of the unflushed increments {pk: amount}"""
+        with self._lock:
+            return dict(self._pending)
+
+    def lag(self):
+        """Seconds since the oldest increment that is not in the database yet"""
+        oldest = self._oldest
+        return time.time() - oldest if oldest is not None else 0.0
+
+    def _take(self):
+        with self._lock:
+            pending, oldest = self._pending, self._oldest
+            self._pending, self._oldest = {}, None
+        return pending, oldest
+
+    def _restore(self, pending, oldest):
+        with self._lock:
+            for pk, amount in pending.items():
+                self._pending[pk] = self._pending.get(pk, 0) + amount
+            if oldest is not None and (self._oldest is None or oldest < self._oldest):
+                self._oldest = oldest
+
+    def write(self, pending):
+        """Add `pending` {pk: amount} to the column, one UPDATE per batch"""
+        batch_size = getattr(settings, 'VIEW_COUNTER_FLUSH_BATCH', 500)
+        manager = self.model._base_manager
+        items = sorted(pending.items())  # Same lock order in every process
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            increment = Case(
+                *[When(pk=pk, then=Value(amount)) for pk, amount in batch],
+                default=Value(0),
+                output_field=PositiveBigIntegerField(),
+            )
+            manager.filter(pk__in=[pk for pk, _ in batch]).update(
+                **{self.field: F(self.field) + increment})
+
+    def flush(self):
+        """Write every buffered increment; returns the number of rows touched"""
+        pending, oldest = self._take()
+        labels = {'counter': self.name}
+        if not pending:
+            metrics.set_gauge('django_counter_flush_lag_seconds', 0, **labels)
+            return 0
+        start = time.perf_counter()
+        try:
+            self.write(pending)
+        except Exception:  # noqa: BLE001 - keep the increments and retry next time
+            self._restore(pending, oldest)
+            metrics.inc('django_counter_flush_failures_total', **labels)
+            logger.warning("Flushing %s counters failed; will retry", self.name, exc_info=True)
+            return 0
+        self.last_flush_at = time.time()
+        if self.on_flush is not None:
+            try:
+                self.on_flush(pending)
+            except Exception:  # noqa: BLE001 - the counts themselves are saved
+                logger.warning("After-flush hook of %s counters failed", self.name, exc_info=True)
+        metrics.observe('django_counter_flush_seconds', time.perf_counter() - start, **labels)
+        metrics.inc('django_counter_increments_flushed_total', sum(pending.values()), **labels)
+        # Lag of what was just written: how long the oldest increment waited
+        metrics.set_gauge('django_counter_flush_lag_seconds', self.last_flush_at - oldest, **labels)
+        return len(pending)
+
+
+def _race_views():
+    from .models import Race
+    from .trending import record_views
+    # Flushed views also move the races up the trending ranking
+    return CounterBuffer(Race, 'view_count', 'race_views', on_flush=record_views)
+
+
+race_views = None
+_buffers_guard = threading.Lock()
+_flusher = None
+_stop = threading.Event()
+
+
+def buffers():
+    global race_views
+    if race_views is None:
+        with _buffers_guard:
+            if race_views is None:
+                race_views = _race_views()
+    return [race_views]
+
+
+def record_view(race_id):
+    """Count one view of a race (buffered; written within a few seconds)"""
+    buffers()
+    race_views.add(race_id)
+
+
+def flush_all():
+    """Flush every counter buffer now (used at shutdown and in tests)"""
+    total = 0
+    for buffer in buffers():
+        total += buffer.flush()
+    return total
+
+
+def _flush_loop(interval):
+    while not _stop.wait(interval):
+        try:
+            flush_all()
+        finally:
+            connection.close()  # This thread's own connection
+
+
+def start_flusher():
+    """
+    Flush the buffers every VIEW_COUNTER_FLUSH_INTERVAL seconds in a thread
+
+    Called by gunicorn's post_fork hook, once per worker. Other processes
+    (runserver, the test suite, management commands) only write their
+    counts when flush_all() is called.
+    """
+    global _flusher
+    interval = getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 5)
+    if not interval or (_flusher is not None and _flusher.is_alive()):
+        return
+    _stop.clear()
+    _flusher = threading.Thread(target=_flush_loop, args=(interval,),
+                                name='counter-flusher', daemon=True)
+    _flusher.start()
+    atexit.register(_flush_on_exit)
+
+
+def stop_flusher():
+    """Stop the flush thread and write whatever is still buffered"""
+    _stop.set()
+    if _flusher is not None:
+        _flusher.join(timeout=5)
+    return flush_all()
+
+
+def _flush_on_exit():
+    if race_views is not None and race_views.pending():
+        try:
+            flush_all()
+        except Exception:  # noqa: BLE001 - interpreter shutting down
+            logger.exception("Final counter flush failed")
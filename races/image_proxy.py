@@ -0,0 +1,332 @@
+"""
+On-the-fly image resizing for local / self-hosted media
+
+`/img/<w>x<h>/<path>` serves a resized copy of MEDIA_ROOT/<path>. The first
+request resizes the original and writes the result to a size-bounded disk
+cache; later requests stream the cached file straight from disk.
+
+- Cache files are keyed on path + original mtime + size, so replacing an
+  original automatically produces new derivatives. derivative_url() puts
+  the same version in the URL (?v=), so only versioned URLs are cached as
+  immutable by browsers and CDNs
+- The cache is least-recently-used: hits refresh the file mtime and the
+  oldest files are evicted once IMAGE_CACHE_MAX_BYTES is exceeded
+- Concurrent requests for the same derivative are collapsed into a single
+  resize (a per-key lock in this process plus a file lock across processes).
+  Lock files whose derivative is gone are deleted whenever the cache evicts
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+try:
+    import fcntl
+except ImportError:  # Windows - fall back to in-process locking only
+    fcntl = None
+
+# File types we are willing to resize, mapped to the Pillow format we write
+IMAGE_FORMATS = {
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.png': 'PNG',
+    '.gif': 'PNG',
+    '.webp': 'WEBP',
+}
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+
+class ImageProxyError(Exception):
+    """Raised when a derivative cannot be produced (bad path, size or image)"""
+
+
+def cache_root():
+    return str(getattr(settings, 'IMAGE_CACHE_ROOT',
+                       os.path.join(settings.BASE_DIR, '.image_cache')))
+
+
+def max_cache_bytes():
+    return getattr(settings, 'IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+
+
+def max_dimension():
+    return getattr(settings, 'IMAGE_PROXY_MAX_DIMENSION', 2400)
+
+
+def resolve_original(path):
+    """
+    Map a URL path onto a file inside MEDIA_ROOT
+
+    Raises ImageProxyError for traversal attempts, unknown file types and
+    missing files so the view can answer 404.
+    """
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    original = os.path.realpath(os.path.join(media_root, path))
+    if os.path.commonpath([media_root, original]) != media_root:
+        raise ImageProxyError("Path outside MEDIA_ROOT")
+    if os.path.splitext(original)[1].lower() not in IMAGE_FORMATS:
+        raise ImageProxyError("Unsupported image type")
+    if not os.path.isfile(original):
+        raise ImageProxyError("Image not found")
+    return original
+
+
+def derivative_key(original, width, height):
+    """Cache key for one size of one version of an original"""
+    stat = os.stat(original)
+    raw = f"{original}:{stat.st_mtime_ns}:{stat.st_size}:{width}x{height}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def original_version(path):
+    """Short version tag of an original (changes when the file is replaced)"""
+    stat = os.stat(resolve_original(path))
+    return hashlib.sha1(f"{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:12]
+
+
+class DiskLRUCache:
+    """
+    Size-bounded directory of derivative files
+
+    File mtime doubles as "last used" time - reads touch the file, eviction
+    removes the files with the oldest mtime first until the cache is back
+    under 90% of its budget.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        # Approximate size - refreshed by a full scan whenever we evict
+        self._approx_bytes = None
+
+    def path_for(self, key, extension):
+        return os.path.join(self.root, key[:2], f"{key}{extension}")
+
+    def lock_path_for(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.lock")
+
+    def get(self, key, extension):
+        """Return the cached file path (refreshing its LRU position) or None"""
+        path = self.path_for(key, extension)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Hold the lock for one derivative key
+
+        In-process threads queue on a shared threading.Lock; other worker
+        processes queue on an flock()ed lock file next to the cache entry.
+        """
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if fcntl is None:
+                    yield
+                else:
+                    lock_path = self.lock_path_for(key)
+                    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+                    with open(lock_path, 'a') as handle:
+                        fcntl.flock(handle, fcntl.LOCK_EX)
+                        try:
+                            yield
+                        finally:
+                            fcntl.flock(handle, fcntl.LOCK_UN)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._key_locks.pop(key, None)
+
+    def store(self, key, extension, write):
+        """
+        Atomically create a cache entry
+
+        `write(handle)` fills a temporary file which is then renamed into
+        place, so readers never see a half-written image.
+        """
+        path = self.path_for(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                write(handle)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        size = os.path.getsize(path)
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self.total_bytes()
+            else:
+                self._approx_bytes += size
+            over_budget = self._approx_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+        return path
+
+    def entries(self):
+        """(mtime, size, path) for every cached derivative"""
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(('.lock', '.tmp')):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, path))
+        return found
+
+    def remove_stale_locks(self, min_age=60):
+        """
+        Delete lock files whose derivative is gone (evicted, or never written)
+
+        If that key is being resized again at that moment, the worst case is
+        a second resize of the same image - the atomic rename keeps it correct.
+        """
+        cutoff = time.time() - min_age
+        for directory, _, files in os.walk(self.root):
+            keys = {os.path.splitext(name)[0] for name in files if not name.endswith('.lock')}
+            for name in files:
+                if name.endswith('.lock') and name[:-len('.lock')] not in keys:
+                    path = os.path.join(directory, name)
+                    try:
+                        if os.stat(path).st_mtime < cutoff:
+                            os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """
+        Delete least recently used files until under 90% of the budget
+
+        Lock files without a derivative go too (see remove_stale_locks).
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.remove_stale_locks()
+        with self._lock:
+            self._approx_bytes = total
+        return total
+
+
+_cache = None
+_cache_guard = threading.Lock()
+
+
+def get_cache():
+    """Process-wide cache instance (rebuilt if the settings change in tests)"""
+    global _cache
+    root, limit = cache_root(), max_cache_bytes()
+    with _cache_guard:
+        if _cache is None or _cache.root != root or _cache.max_bytes != limit:
+            _cache = DiskLRUCache(root, limit)
+        return _cache
+
+
+def resize_image(original, width, height, handle, image_format):
+    """
+    Write `original` scaled to fit inside width x height into `handle`
+
+    A dimension of 0 means "any". Images are never upscaled.
+    """
+    with Image.open(original) as image:
+        image = ImageOps.exif_transpose(image)
+        box = (width or image.width, height or image.height)
+        if image_format == 'JPEG':
+            image.draft('RGB', box)
+            image = image.convert('RGB')
+        image.thumbnail(box, Image.Resampling.LANCZOS)
+        options = {'optimize': True}
+        if image_format in ('JPEG', 'WEBP'):
+            options['quality'] = getattr(settings, 'IMAGE_PROXY_QUALITY', 82)
+        image.save(handle, image_format, **options)
+
+
+def get_derivative(path, width, height):
+    """
+    Return (file_path, content_type, cache_key) for a resized media image
+
+    Resizes on the first request and serves from the disk cache afterwards.
+    """
+    limit = max_dimension()
+    if width < 0 or height < 0 or width > limit or height > limit:
+        raise ImageProxyError("Requested size is out of range")
+    if width == 0 and height == 0:
+        raise ImageProxyError("Requested size is out of range")
+
+    original = resolve_original(path)
+    image_format = IMAGE_FORMATS[os.path.splitext(original)[1].lower()]
+    extension = '.jpg' if image_format == 'JPEG' else f".{image_format.lower()}"
+    key = derivative_key(original, width, height)
+    cache = get_cache()
+
+    # Fast path: already cached
+    cached = cache.get(key, extension)
+    if cached is None:
+        # Slow path: one resize per key, everyone else waits for it
+        with cache.lock(key):
+            cached = cache.get(key, extension)
+            if cached is None:
+                try:
+                    cached = cache.store(
+                        key, extension,
+                        lambda handle: resize_image(
+                            original, width, height, handle, image_format),
+                    )
+                except OSError as error:
+                    raise ImageProxyError(f"Could not resize image: {error}")
+
+    return cached, CONTENT_TYPES[image_format], key
+
+
+def derivative_url(path, size):
+    """
+    URL of a derivative, e.g. derivative_url('race_images/a.jpg', '600x400')
+
+    Carries the original's version (?v=...) when the file exists, so the
+    URL changes whenever the original does.
+    """
+    path = str(path).lstrip('/')
+    try:
+        return f"/img/{size}/{path}?v={original_version(path)}"
+    except (ImageProxyError, OSError):
+        return f"/img/{size}/{path}"
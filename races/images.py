@@ -0,0 +1,140 @@
+"""
+Image fingerprinting helpers for race photo uploads
+
+Users often upload the same stock photo for different races. Every upload is
+stored (and transformed) separately on Cloudinary, so we fingerprint each
+image when it is uploaded and reuse the stored asset when we have seen it
+before.
+
+Two fingerprints are used:
+- content hash: SHA-256 of the raw bytes, catches byte-identical copies
+- perceptual hash: 64-bit difference hash (dHash), catches the same photo
+  re-saved, re-compressed or resized
+
+The perceptual hash is split into four 16-bit bands that are stored in
+indexed columns. Two hashes within 3 bits of each other always share at
+least one band (pigeonhole principle), so near-duplicates can be found with
+an indexed lookup instead of scanning the whole table.
+"""
+import hashlib
+from dataclasses import dataclass
+
+from django.conf import settings
+from PIL import Image, UnidentifiedImageError
+
+# dHash grid: 9x8 greyscale pixels gives 8x8 = 64 comparison bits
+HASH_SIZE = 8
+BAND_COUNT = 4
+BAND_BITS = 64 // BAND_COUNT
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+@dataclass(frozen=True)
+class ImageFingerprint:
+    """Content and perceptual hashes of a single image"""
+    content_hash: str
+    phash: int
+    width: int
+    height: int
+
+    @property
+    def phash_hex(self):
+        """Perceptual hash as a fixed-width 16 character hex string"""
+        return f"{self.phash:016x}"
+
+    @property
+    def bands(self):
+        """The perceptual hash split into BAND_COUNT 16-bit integers"""
+        return split_bands(self.phash)
+
+
+def split_bands(phash):
+    """Split a 64-bit hash into BAND_COUNT integers (most significant first)"""
+    return [
+        (phash >> (BAND_BITS * (BAND_COUNT - 1 - index))) & BAND_MASK
+        for index in range(BAND_COUNT)
+    ]
+
+
+def hamming_distance(first, second):
+    """Number of differing bits between two integer hashes"""
+    return bin(first ^ second).count('1')
+
+
+def max_distance():
+    """
+    Largest perceptual hash distance still treated as the same image
+
+    Values above BAND_COUNT - 1 are clamped because the band index can only
+    guarantee a match for distances below the number of bands.
+    """
+    distance = getattr(settings, 'IMAGE_DEDUPE_MAX_DISTANCE', 3)
+    return max(0, min(distance, BAND_COUNT - 1))
+
+
+def difference_hash(image):
+    """
+    Compute the 64-bit difference hash (dHash) of a PIL image
+
+    The image is reduced to a 9x8 greyscale thumbnail and each bit records
+    whether a pixel is brighter than its right-hand neighbour. This survives
+    re-compression, resizing and small colour changes.
+    """
+    thumbnail = image.convert('L').resize(
+        (HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS
+    )
+    pixels = list(thumbnail.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            left = pixels[offset + column]
+            right = pixels[offset + column + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def fingerprint_file(file_obj):
+    """
+    Fingerprint an open file (Django UploadedFile or any binary file object)
+
+    The file position is restored to the start afterwards so the caller can
+    still upload it. Returns None when the file is not a readable image.
+    """
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+
+    # STEP 1: Content hash - read in chunks so big uploads stay off the heap
+    digest = hashlib.sha256()
+    if hasattr(file_obj, 'chunks'):
+        for chunk in file_obj.chunks():
+            digest.update(chunk)
+    else:
+        for chunk in iter(lambda: file_obj.read(64 * 1024), b''):
+            digest.update(chunk)
+
+    # STEP 2: Perceptual hash from the decoded image
+    file_obj.seek(0)
+    try:
+        with Image.open(file_obj) as image:
+            width, height = image.size
+            # draft() lets JPEG decode at reduced size - much faster for hashing
+            image.draft('L', (HASH_SIZE * 16, HASH_SIZE * 16))
+            phash = difference_hash(image)
+    except (UnidentifiedImageError, OSError):
+        return None
+    finally:
+        file_obj.seek(0)
+
+    return ImageFingerprint(
+        content_hash=digest.hexdigest(),
+        phash=phash,
+        width=width,
+        height=height,
+    )
+
+
+def fingerprint_bytes(data):
+    """Fingerprint an image held in memory"""
+    from io import BytesIO
+    return fingerprint_file(BytesIO(data))
@@ -0,0 +1,230 @@
+"""
+Database-backed background job queue
+
+No broker needed - jobs are rows in the Job table of the project database.
+
+    from races.jobs import enqueue, task
+
+    @task('races.send_welcome')
+    def send_welcome(user_id):
+        ...
+
+    enqueue('races.send_welcome', user_id=5)
+    enqueue('races.purge_race', key=f'purge-race-{race.pk}', race_id=race.pk)
+
+Workers (`manage.py run_workers --concurrency 4`) claim due jobs:
+
+- PostgreSQL (and any database with SKIP LOCKED): SELECT ... FOR UPDATE
+  SKIP LOCKED, so concurrent workers never wait on or pick the same row
+- SQLite: each worker reads a few candidate ids and claims one with a
+  conditional UPDATE (... WHERE status = 'queued'); the database serializes
+  writes, so only one worker's UPDATE matches
+
+A failing job is retried with exponential backoff (JOB_RETRY_BACKOFF,
+doubling up to JOB_RETRY_BACKOFF_MAX, with jitter) until max_attempts, then
+marked failed with its last error. While a job runs, a heartbeat thread
+touches its heartbeat_at every JOB_HEARTBEAT seconds; a running job whose
+worker has not checked in for JOB_TIMEOUT seconds (a crashed worker) is
+re-queued. A job is never re-queued just for running long, but one whose
+worker died part way runs again, so tasks must be safe to run twice.
+An idempotency key makes enqueue() return the existing job instead of
+adding a duplicate.
+
+Because jobs live in the same database, enqueueing inside a transaction is
+atomic with the rest of the work: if the transaction rolls back, the job
+was never queued.
+"""
+import logging
+import random
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('races.jobs')
+
+# task name -> function
+registry = {}
+
+
+class UnknownTask(Exception):
+    """enqueue() or a worker met a task name nobody registered"""
+
+
+def task(name):
+    """Decorator registering a function as a background task under `name`"""
+    def decorator(function):
+        registry[name] = function
+        return function
+    return decorator
+
+
+def enqueue(name, key=None, delay=0, priority=0, max_attempts=None, **kwargs):
+    """
+    Queue `name(**kwargs)` to run in a worker; returns the Job
+
+    `key` is an idempotency key: if a job with that key already exists it is
+    returned unchanged. `delay` (seconds) postpones the first run.
+    """
+    if name not in registry:
+        raise UnknownTask(name)
+    job = Job(
+        task=name, kwargs=kwargs, idempotency_key=key, priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+    if key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError:
+        return Job.objects.get(idempotency_key=key)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before retry number `attempts` (1, 2, ...)"""
+    base = getattr(settings, 'JOB_RETRY_BACKOFF', 10)
+    cap = getattr(settings, 'JOB_RETRY_BACKOFF_MAX', 3600)
+    delay = min(cap, base * 2 ** (attempts - 1))
+    # Jitter so jobs that failed together do not all retry together
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _due():
+    return (Job.objects.filter(status=Job.QUEUED, run_at__lte=timezone.now())
+            .order_by('priority', 'run_at', 'pk'))
+
+
+def claim(worker):
+    """Mark the next due job as running for `worker` and return it (or None)"""
+    db = router.db_for_write(Job)
+    now = timezone.now()
+    running = dict(status=Job.RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+                   attempts=F('attempts') + 1)
+    if connections[db].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=db):
+            pk = _due().select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            Job.objects.filter(pk=pk).update(**running)
+    else:
+        # Polling fallback: race for a few candidates with conditional UPDATEs
+        for pk in _due().values_list('pk', flat=True)[:5]:
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(**running):
+                break
+        else:
+            return None
+    return Job.objects.get(pk=pk)
+
+
+def run(job):
+    """Run a claimed job and record the outcome; returns True on success"""
+    function = registry.get(job.task)
+    try:
+        if function is None:
+            raise UnknownTask(job.task)
+        with heartbeat(job):
+            function(**job.kwargs)
+    except Exception:  # noqa: BLE001 - any failure is recorded on the job
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = retry_delay(job.attempts)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED, last_error=error,
+                run_at=timezone.now() + timedelta(seconds=delay))
+            logger.warning("Job %s failed (attempt %s), retrying in %.0fs",
+                           job, job.attempts, delay)
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, last_error=error, finished_at=timezone.now())
+            logger.error("Job %s failed permanently after %s attempts", job, job.attempts)
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished_at=timezone.now())
+    return True
+
+
+@contextmanager
+def heartbeat(job):
+    """
+    Keep `job`'s heartbeat_at fresh while the block runs
+
+    A thread updates it every JOB_HEARTBEAT seconds, using (and then
+    closing) its own database connection between beats.
+    """
+    interval = getattr(settings, 'JOB_HEARTBEAT', 60)
+    stop = threading.Event()
+
+    def beat():
+        db = router.db_for_write(Job)
+        while not stop.wait(interval):
+            try:
+                Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker).update(
+                    heartbeat_at=timezone.now())
+            except Exception:  # noqa: BLE001 - try again at the next beat
+                logger.warning("Could not record the heartbeat of job %s", job, exc_info=True)
+            finally:
+                connections[db].close()
+
+    thread = threading.Thread(target=beat, name=f'job-heartbeat-{job.pk}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def requeue_stale():
+    """Put jobs whose worker died (no heartbeat for JOB_TIMEOUT) back in the queue"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'JOB_TIMEOUT', 600))
+    return (Job.objects.filter(status=Job.RUNNING)
+            .filter(Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff))
+            .update(status=Job.QUEUED, last_error='Worker stopped responding; re-queued'))
+
+
+def run_next(worker):
+    """Claim and run one job; returns False when nothing was due"""
+    job = claim(worker)
+    if job is None:
+        return False
+    run(job)
+    return True
+
+
+def queue_stats(recent=500):
+    """
+    Queue depth and latency for the admin
+
+    Latency is how long jobs waited between becoming due and being started,
+    over the `recent` most recently started jobs.
+    """
+    from django.db.models import Count, Min
+
+    now = timezone.now()
+    counts = dict(Job.objects.values_list('status').annotate(total=Count('pk')).order_by())
+    oldest_due = (Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+                  .aggregate(oldest=Min('run_at'))['oldest'])
+    waits = sorted(
+        (started - run_at).total_seconds()
+        for started, run_at in Job.objects.filter(started_at__isnull=False)
+        .order_by('-started_at').values_list('started_at', 'run_at')[:recent]
+    )
+    return {
+        'counts': {status: counts.get(status, 0) for status, _ in Job.STATUS_CHOICES},
+        'due': Job.objects.filter(status=Job.QUEUED, run_at__lte=now).count(),
+        'oldest_due_seconds': (now - oldest_due).total_seconds() if oldest_due else 0,
+        'wait_p50_seconds': waits[len(waits) // 2] if waits else None,
+        'wait_p95_seconds': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None,
+        'tasks': list(Job.objects.filter(status__in=[Job.QUEUED, Job.RUNNING])
+                      .values('task').annotate(total=Count('pk')).order_by('-total')),
+    }
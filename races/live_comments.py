@@ -0,0 +1,265 @@
+"""
+Live comments on the race page - Server-Sent Events (ASGI only)
+
+The async race page opens an EventSource on /race/<pk>/comments/live/ and
+new approved comments appear at the top of the list as they are posted,
+without reloading the page.
+
+How a comment reaches the browsers:
+1. A comment saved approved (posted, or approved later in the admin) gets
+   a CommentEvent row once its transaction commits (races/signals.py).
+   The row's id is the SSE event id.
+2. Each worker process has one CommentHub. While anyone is listening, a
+   single task polls for new CommentEvent rows every
+   LIVE_COMMENTS_POLL_INTERVAL seconds - one indexed query per process,
+   however many browsers are connected - renders each comment once and
+   hands the fragment to every listener of that race.
+3. Each stream sends its listener's events, plus a comment-line heartbeat
+   every LIVE_COMMENTS_HEARTBEAT seconds so proxies keep it open.
+
+Resume: EventSource reconnects by itself and sends the id of the last
+event it got (Last-Event-ID); the stream first replays the race's events
+after it. The first connection passes ?since=<page render time> instead,
+so comments posted while the page loaded are not lost (the page skips any
+it already shows).
+
+Leaving: Django 4.2 does not notice a client leaving a streaming response,
+so config/asgi.py wraps the app in cancel_streams_on_disconnect().
+
+Limits: LIVE_COMMENTS_MAX_CONNECTIONS streams per worker (503 beyond),
+each stream ends after LIVE_COMMENTS_MAX_SECONDS (the browser reconnects),
+and a listener that falls LIVE_COMMENTS_QUEUE_SIZE events behind is
+disconnected rather than buffered without end.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+logger = logging.getLogger('races.live_comments')
+
+HEARTBEAT = b': heartbeat\n\n'
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def publish(comment):
+    """Add the CommentEvent of an approved comment (once per comment)"""
+    from .models import CommentEvent
+
+    CommentEvent.objects.bulk_create(
+        [CommentEvent(race_id=comment.race_id, comment=comment)], ignore_conflicts=True)
+
+
+def events():
+    """Events of comments that are still approved, oldest first"""
+    from .models import CommentEvent
+
+    return (CommentEvent.objects.filter(comment__approved=True)
+            .select_related('comment__author').order_by('pk'))
+
+
+def format_event(event):
+    """One SSE message: id, type and the rendered comment as data lines"""
+    html = render_to_string('races/includes/comment_card.html', {'comment': event.comment})
+    lines = [f'id: {event.pk}', 'event: comment']
+    lines += [f'data: {line}' for line in html.strip().splitlines()]
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+class Listener:
+    """One open stream: a bounded queue of (event id, message)"""
+
+    def __init__(self, race_id):
+        self.race_id = race_id
+        self.queue = asyncio.Queue(maxsize=setting('LIVE_COMMENTS_QUEUE_SIZE', 100))
+        self.dropped = False
+
+
+class CommentHub:
+    """
+    Per-process fan-out of comment events to the open streams
+
+    Lives on the event loop; nothing here is touched from other threads.
+    """
+
+    def __init__(self):
+        self.listeners = defaultdict(set)  # race id -> {Listener}
+        self.connections = 0
+        self.poller = None
+        self.loop = None
+        self.started = asyncio.Event()  # Set once the poller knows where to start
+
+    def full(self):
+        return self.connections >= setting('LIVE_COMMENTS_MAX_CONNECTIONS', 1000)
+
+    def subscribe(self, race_id):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            # A new event loop (tests run one per request) - start afresh
+            self.__init__()
+            self.loop = loop
+        listener = Listener(race_id)
+        self.listeners[race_id].add(listener)
+        self.connections += 1
+        if self.poller is None or self.poller.done():
+            self.started = asyncio.Event()
+            self.poller = loop.create_task(self.poll())
+        return listener
+
+    def unsubscribe(self, listener):
+        listeners = self.listeners.get(listener.race_id)
+        if listeners and listener in listeners:
+            listeners.discard(listener)
+            self.connections -= 1
+            if not listeners:
+                del self.listeners[listener.race_id]
+
+    def dispatch(self, race_id, event_id, message):
+        for listener in list(self.listeners.get(race_id, ())):
+            try:
+                listener.queue.put_nowait((event_id, message))
+            except asyncio.QueueFull:
+                # Too far behind - its stream ends and the browser resumes
+                # from its Last-Event-ID
+                listener.dropped = True
+                self.unsubscribe(listener)
+
+    async def poll(self):
+        """While anyone listens: fetch new events every interval, fan them out"""
+        from django.db.models import Max
+        from .models import CommentEvent
+
+        interval = setting('LIVE_COMMENTS_POLL_INTERVAL', 1.0)
+        cursor = None  # Newest event id already handled
+        while self.listeners:
+            try:
+                if cursor is None:
+                    # Streams replay older events themselves - start from now.
+                    # They wait for this (started) before their replay query,
+                    # so any event after it is theirs to get from us
+                    cursor = (await CommentEvent.objects.aaggregate(last=Max('pk')))['last'] or 0
+                    self.started.set()
+                else:
+                    batch = events().filter(pk__gt=cursor, race_id__in=list(self.listeners))[:500]
+                    async for event in batch.aiterator():
+                        cursor = max(cursor, event.pk)
+                        self.dispatch(event.race_id, event.pk, format_event(event))
+            except Exception:  # noqa: BLE001 - keep polling; the next try may work
+                logger.warning("Could not poll for comment events", exc_info=True)
+            await asyncio.sleep(interval)
+
+
+hub = CommentHub()
+
+
+async def stream(race_id, after_id=None, since=None):
+    """
+    The SSE body for one browser: missed events, then live ones and heartbeats
+
+    `after_id` is the Last-Event-ID to resume after; `since` (first
+    connection) replays the events from that time on.
+    """
+    listener = hub.subscribe(race_id)
+    started = hub.started
+    heartbeat = setting('LIVE_COMMENTS_HEARTBEAT', 15)
+    try:
+        yield f"retry: {setting('LIVE_COMMENTS_RETRY_MS', 3000)}\n\n".encode()
+
+        # Replay what the browser missed. Subscribed first, and the replay
+        # query only runs once the hub has read its starting point: events
+        # up to it are replayed, later ones are delivered live, so nothing
+        # falls in between (an event in both is sent once)
+        last_sent = after_id or 0
+        if after_id is not None or since is not None:
+            while not started.is_set():
+                try:
+                    await asyncio.wait_for(started.wait(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+            missed = events().filter(race_id=race_id)
+            if after_id is not None:
+                missed = missed.filter(pk__gt=after_id)
+            else:
+                missed = missed.filter(created_at__gte=since)
+            async for event in missed[:setting('LIVE_COMMENTS_REPLAY_LIMIT', 50)].aiterator():
+                last_sent = max(last_sent, event.pk)
+                yield format_event(event)
+
+        deadline = time.monotonic() + setting('LIVE_COMMENTS_MAX_SECONDS', 600)
+        while not listener.dropped:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event_id, message = await asyncio.wait_for(
+                    listener.queue.get(), timeout=min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+                continue
+            if event_id > last_sent:
+                last_sent = event_id
+                yield message
+    finally:
+        hub.unsubscribe(listener)
+
+
+def prune(batch_size=1000):
+    """Delete events older than LIVE_COMMENTS_RETENTION_HOURS; returns the count"""
+    from .account_deletion import delete_in_batches
+    from .models import CommentEvent
+
+    cutoff = timezone.now() - timedelta(hours=setting('LIVE_COMMENTS_RETENTION_HOURS', 24))
+    return delete_in_batches(CommentEvent.objects.filter(created_at__lt=cutoff), batch_size)
+
+
+def cancel_streams_on_disconnect(app):
+    """
+    ASGI wrapper ending Server-Sent Events streams when the browser leaves
+
+    Django 4.2 stops reading `receive` once it has the request body, so it
+    never hears that a client went away and an event stream would run on,
+    sending heartbeats to nobody. For requests accepting text/event-stream
+    this reads the body first, runs the app as a task and cancels it on
+    http.disconnect (the stream's `finally` then unsubscribes it).
+    """
+    async def application(scope, receive, send):
+        accept = dict(scope.get('headers', ())).get(b'accept', b'')
+        if scope['type'] != 'http' or b'text/event-stream' not in accept:
+            return await app(scope, receive, send)
+
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] != 'http.request':
+                return  # Gone before the request was even read
+            body.append(message)
+            if not message.get('more_body'):
+                break
+
+        async def replay_body():
+            return body.pop(0) if body else {'type': 'http.disconnect'}
+
+        async def wait_for_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            task.cancel()
+
+        task = asyncio.ensure_future(app(scope, replay_body, send))
+        watcher = asyncio.ensure_future(wait_for_disconnect())
+        try:
+            await asyncio.wait([task])
+        finally:
+            watcher.cancel()
+            task.cancel()
+        if not task.cancelled():
+            task.result()
+
+    return application
@@ -0,0 +1,441 @@
+"""
+Load-test harness for the WSGI and ASGI applications
+
+Drives the site with concurrent simulated clients and reports throughput
+plus p50/p95/p99 latency per route. Three transports:
+
+- "inprocess": calls the WSGI callable directly from client threads. No
+  sockets or server involved, so it measures Django + database only
+- "gunicorn": starts a local gunicorn on a free port and sends real HTTP
+  requests over keep-alive connections, as a browser would
+- "asgi": the same with `config.asgi` on uvicorn workers (async views)
+
+SlowClients adds connections that trickle their request headers in, like
+clients on a bad mobile network. Each one occupies a gunicorn sync worker
+for as long as it takes; an ASGI worker just waits for it on its event
+loop (see the benchmark_servers command).
+
+Results are plain dicts that the run_load_test command saves as JSON, so
+two runs (before / after a change) can be compared with --compare.
+"""
+import http.client
+import importlib.util
+import io
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.utils import timezone
+
+# Route name -> function building a URL from the shared LoadContext
+ROUTES = {
+    'race-list': lambda context: '/',
+    'race-list-page': lambda context: f'/?page={context.rng.randint(1, context.pages)}',
+    'race-detail': lambda context: f'/race/{context.rng.choice(context.race_ids)}/',
+    'my-races': lambda context: '/my-races/',
+}
+
+DEFAULT_ROUTES = ['race-list', 'race-list-page', 'race-detail']
+
+
+class LoadTestError(Exception):
+    """Raised when a run cannot start (no data, server did not come up...)"""
+
+
+class LoadContext:
+    """Everything clients need to build URLs and authenticate"""
+
+    def __init__(self, race_ids, pages, cookie='', seed=None):
+        self.race_ids = race_ids
+        self.pages = max(pages, 1)
+        self.cookie = cookie
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def url_for(self, route):
+        # random.Random is not thread-safe for our purposes - serialize it
+        with self._lock:
+            return ROUTES[route](self)
+
+
+def build_context(routes, username=None, seed=None):
+    """
+    Collect race ids for detail pages and log in `username` if given
+
+    The login is a real session row, so it works for in-process and
+    gunicorn runs alike.
+    """
+    from .models import Race
+
+    race_ids = list(
+        Race.objects.filter(status=1, approved=True).values_list('pk', flat=True)[:5000]
+    )
+    if 'race-detail' in routes and not race_ids:
+        raise LoadTestError("No published races - run seed_perf_data first")
+    pages = (Race.objects.filter(status=1, approved=True).count() + 5) // 6
+
+    cookie = ''
+    if username:
+        cookie = login_cookie(username)
+    elif 'my-races' in routes:
+        raise LoadTestError("The my-races route needs --user")
+    return LoadContext(race_ids, pages, cookie, seed)
+
+
+def login_cookie(username):
+    """Create an authenticated session for `username` and return its Cookie header"""
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.auth.models import User
+    from importlib import import_module
+
+    try:
+        user = User.objects.get(username=username)
+    except User.DoesNotExist:
+        raise LoadTestError(f"Unknown user {username!r}")
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    store[SESSION_KEY] = str(user.pk)
+    store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    store.save()
+    return f'{settings.SESSION_COOKIE_NAME}={store.session_key}'
+
+
+# ------------------------------------------------------------------------------
+# Transports - each returns (status_code, bytes_received) for one request
+# ------------------------------------------------------------------------------
+
+class InProcessTransport:
+    """Call the WSGI application directly"""
+
+    def __init__(self, application, cookie=''):
+        self.application = application
+        self.cookie = cookie
+
+    def request(self, url):
+        path, _, query = url.partition('?')
+        environ = {
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'REQUEST_METHOD': 'GET',
+            'HTTP_HOST': 'localhost',
+            'SERVER_NAME': 'localhost',
+            'wsgi.input': io.BytesIO(),
+        }
+        if self.cookie:
+            environ['HTTP_COOKIE'] = self.cookie
+        setup_testing_defaults(environ)
+
+        status = []
+
+        def start_response(status_line, headers, exc_info=None):
+            status.append(int(status_line.split(' ', 1)[0]))
+
+        body = self.application(environ, start_response)
+        try:
+            size = sum(len(chunk) for chunk in body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return status[0], size
+
+    def close(self):
+        pass
+
+
+class HTTPTransport:
+    """One keep-alive HTTP connection per client thread"""
+
+    def __init__(self, host, port, cookie=''):
+        self.host = host
+        self.port = port
+        self.headers = {'Host': 'localhost'}
+        if cookie:
+            self.headers['Cookie'] = cookie
+        self.connection = None
+
+    def request(self, url):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            self.connection.request('GET', url, headers=self.headers)
+            response = self.connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            # Server dropped the connection - reconnect on the next request
+            self.close()
+            raise
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close()
+        return response.status, len(body)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+# ------------------------------------------------------------------------------
+# Running clients and summarizing
+# ------------------------------------------------------------------------------
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    rank = max(int(round(fraction * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(samples, elapsed):
+    """
+    Turn raw samples into the per-route report
+
+    `samples` is a list of (route, seconds, status, bytes, error) tuples.
+    """
+    by_route = defaultdict(list)
+    for sample in samples:
+        by_route[sample[0]].append(sample)
+
+    def describe(rows):
+        latencies = sorted(row[1] for row in rows)
+        errors = sum(1 for row in rows if row[4] or row[2] >= 500)
+        return {
+            'requests': len(rows),
+            'errors': errors,
+            'throughput_rps': round(len(rows) / elapsed, 2) if elapsed else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            'bytes': sum(row[3] for row in rows),
+            'status_codes': dict(sorted(Counter(str(row[2]) for row in rows).items())),
+        }
+
+    return {
+        'total': describe(samples),
+        'routes': {route: describe(rows) for route, rows in sorted(by_route.items())},
+    }
+
+
+def run_clients(make_transport, context, routes, concurrency, requests=None,
+                duration=None, warmup=0):
+    """
+    Run `concurrency` clients until `requests` in total or `duration` seconds
+
+    With a single client everything runs in the calling thread, which also
+    keeps in-process runs inside the caller's database connection.
+    """
+    if not requests and not duration:
+        raise LoadTestError("Give a number of requests or a duration")
+
+    samples = []
+    samples_lock = threading.Lock()
+    remaining = [requests] if requests else None
+    deadline = [None]
+
+    def take_ticket():
+        if remaining is None:
+            return time.perf_counter() < deadline[0]
+        with samples_lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def client(index):
+        from django.db import connections
+
+        transport = make_transport()
+        local = []
+        route_cycle = index
+        try:
+            for _ in range(warmup):
+                transport.request(context.url_for(routes[0]))
+            while take_ticket():
+                route = routes[route_cycle % len(routes)]
+                route_cycle += 1
+                url = context.url_for(route)
+                start = time.perf_counter()
+                error = ''
+                status, size = 0, 0
+                try:
+                    status, size = transport.request(url)
+                except Exception as exc:  # noqa: BLE001 - count it, keep going
+                    error = f'{type(exc).__name__}: {exc}'
+                local.append((route, time.perf_counter() - start, status, size, error))
+        finally:
+            transport.close()
+            if concurrency > 1:
+                connections.close_all()
+        with samples_lock:
+            samples.extend(local)
+
+    start = time.perf_counter()
+    if duration:
+        deadline[0] = start + duration
+    if concurrency <= 1:
+        client(0)
+    else:
+        threads = [threading.Thread(target=client, args=(index,), daemon=True)
+                   for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    report = summarize(samples, elapsed)
+    report['elapsed_seconds'] = round(elapsed, 3)
+    report['sample_errors'] = sorted({row[4] for row in samples if row[4]})[:10]
+    return report
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class GunicornServer:
+    """
+    Context manager running gunicorn on a free local port
+
+    `config.wsgi` on sync (or threaded) workers, or with asgi=True
+    `config.asgi` on uvicorn workers.
+    """
+
+    def __init__(self, workers=2, threads=1, startup_timeout=30, asgi=False):
+        self.workers = workers
+        self.threads = threads
+        self.startup_timeout = startup_timeout
+        self.asgi = asgi
+        self.port = free_port()
+        self.process = None
+
+    def __enter__(self):
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '--bind', f'127.0.0.1:{self.port}',
+            '--workers', str(self.workers),
+            '--log-level', 'warning',
+        ]
+        if self.asgi:
+            if importlib.util.find_spec('uvicorn') is None:
+                raise LoadTestError("uvicorn is not installed - pip install -r requirements.txt")
+            command += ['--worker-class', 'uvicorn.workers.UvicornWorker', 'config.asgi:application']
+        else:
+            command += ['--threads', str(self.threads), 'config.wsgi:application']
+        self.process = subprocess.Popen(
+            command, cwd=str(settings.BASE_DIR), env=os.environ.copy(),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise LoadTestError(
+                    "gunicorn exited: " + self.process.stderr.read().decode(errors='replace'))
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=0.5):
+                    return self
+            except OSError:
+                time.sleep(0.1)
+        self.__exit__()
+        raise LoadTestError("gunicorn did not start in time")
+
+    def __exit__(self, *exc):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class SlowClients:
+    """
+    Context manager holding `count` connections that send their request slowly
+
+    Each connection sends a request line, then one more header line every
+    `interval` seconds and never finishes, until the block exits.
+    """
+
+    def __init__(self, host, port, count, interval=1.0):
+        self.host = host
+        self.port = port
+        self.count = count
+        self.interval = interval
+        self.stop = threading.Event()
+        self.threads = []
+
+    def trickle(self):
+        try:
+            with socket.create_connection((self.host, self.port), timeout=5) as sock:
+                sock.sendall(b'GET / HTTP/1.1\r\nHost: localhost\r\n')
+                while not self.stop.wait(self.interval):
+                    sock.sendall(b'X-Slow-Client: 1\r\n')
+        except OSError:
+            pass  # The server gave up on us (e.g. a worker timeout)
+
+    def __enter__(self):
+        for _ in range(self.count):
+            thread = threading.Thread(target=self.trickle, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        time.sleep(0.5)  # Let every connection reach the server first
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+
+def environment():
+    """Metadata stored with every result so runs can be told apart"""
+    commit = ''
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=str(settings.BASE_DIR),
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': settings.DATABASES['default']['ENGINE'],
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(baseline, current):
+    """
+    Per-route differences between two reports
+
+    Returns {route: {metric: (before, after, percent_change)}}.
+    """
+    changes = {}
+    metrics = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')
+    routes = dict(current['routes'], total=current['total'])
+    previous = dict(baseline['routes'], total=baseline['total'])
+    for route, stats in routes.items():
+        if route not in previous:
+            continue
+        changes[route] = {}
+        for metric in metrics:
+            before, after = previous[route][metric], stats[metric]
+            change = ((after - before) / before * 100) if before else 0.0
+            changes[route][metric] = (before, after, round(change, 1))
+    return changes
@@ -0,0 +1,131 @@
+"""
+Periodic maintenance jobs (run by races/scheduler.py)
+
+Each job works in small batches, every batch its own short transaction,
+and returns a short summary that is stored on its ScheduledTask row.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .account_deletion import delete_in_batches
+from .scheduler import periodic
+
+
+def update_in_batches(queryset, batch_size=1000, **changes):
+    """UPDATE the rows of `queryset`, at most `batch_size` per transaction"""
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return total
+            queryset.model._base_manager.filter(pk__in=ids).update(**changes)
+        total += len(ids)
+
+
+def batch_size():
+    return getattr(settings, 'MAINTENANCE_BATCH_SIZE', 1000)
+
+
+@periodic('clear_expired_sessions', every=timedelta(hours=1))
+def clear_expired_sessions():
+    """Delete expired django_session rows (SESSION_SAVE_EVERY_REQUEST makes many)"""
+    from django.contrib.sessions.models import Session
+
+    deleted = delete_in_batches(Session.objects.filter(expire_date__lt=timezone.now()),
+                                batch_size())
+    return f"{deleted} expired session(s) deleted"
+
+
+@periodic('archive_past_races', every=timedelta(hours=6))
+def archive_past_races():
+    """Move published races that ended RACE_ARCHIVE_AFTER_DAYS ago out of the lists"""
+    from .models import Race
+
+    cutoff = timezone.now().date() - timedelta(days=getattr(settings, 'RACE_ARCHIVE_AFTER_DAYS', 30))
+    archived = update_in_batches(Race.objects.filter(status=1, race_date__lt=cutoff),
+                                 batch_size(), status=2)
+    return f"{archived} race(s) archived"
+
+
+@periodic('clean_completed_deletion_requests', every=timedelta(days=1))
+def clean_completed_deletion_requests():
+    """Forget COMPLETED account deletion requests after the retention period"""
+    from .models import AccountDeletionRequest
+
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'DELETION_REQUEST_RETENTION_DAYS', 90))
+    deleted = delete_in_batches(
+        AccountDeletionRequest.objects.filter(status='COMPLETED', completed_at__lt=cutoff),
+        batch_size())
+    return f"{deleted} completed request(s) deleted"
+
+
+@periodic('queue_account_deletions', every=timedelta(hours=1))
+def queue_account_deletions():
+    """Make sure every approved deletion request has a deletion job (e.g. approved in the shell)"""
+    from .account_deletion import approved_requests
+    from .jobs import enqueue
+
+    ids = list(approved_requests().values_list('pk', flat=True))
+    for request_id in ids:
+        # Same key as the approval receiver: requests already queued are left alone
+        enqueue('races.execute_account_deletion', key=f'account-deletion-{request_id}',
+                request_id=request_id)
+    return f"{len(ids)} approved request(s) queued"
+
+
+@periodic('clean_finished_jobs', every=timedelta(hours=6))
+def clean_finished_jobs():
+    """Delete background jobs that finished more than a week ago"""
+    from .models import Job
+
+    cutoff = timezone.now() - timedelta(days=7)
+    deleted = delete_in_batches(
+        Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff),
+        batch_size())
+    return f"{deleted} finished job(s) deleted"
+
+
+@periodic('refresh_trending', every=timedelta(days=1))
+def refresh_trending():
+    """Tidy the trending ranking and boost races whose day is getting close"""
+    from . import trending
+
+    removed, added, boosted = trending.refresh(batch_size=batch_size())
+    return f"{removed} removed, {added} added, {boosted} boosted"
+
+
+@periodic('rebuild_similar_races', every=timedelta(days=1))
+def rebuild_similar_races():
+    """Recompute every "You might also like" list with fresh word statistics"""
+    from . import similarity
+
+    return f"{similarity.rebuild()} race(s) updated"
+
+
+@periodic('rebuild_rollups', every=timedelta(days=1))
+def rebuild_rollups():
+    """Recompute the dashboard statistics, correcting any drift"""
+    from . import rollups
+
+    return f"{rollups.rebuild()} counter(s) rebuilt"
+
+
+@periodic('prune_comment_events', every=timedelta(days=1))
+def prune_comment_events():
+    """Delete live comment events too old to be replayed"""
+    from .live_comments import prune
+
+    return f"{prune(batch_size())} comment event(s) deleted"
+
+
+@periodic('send_outbox', every=timedelta(minutes=1))
+def send_outbox():
+    """Send queued notification emails over one SMTP connection"""
+    from .outbox import drain
+
+    sent, failed = drain()
+    return f"{sent} email(s) sent, {failed} failed"
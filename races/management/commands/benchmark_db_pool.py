@@ -0,0 +1,96 @@
+"""
+Compare request latency with and without database connection pooling
+
+    python manage.py benchmark_db_pool --requests 1000 --concurrency 8
+    python manage.py benchmark_db_pool --mode gunicorn --threads 4 \
+        --database-url postgres://localhost/runforfun
+
+Runs run_load_test twice in fresh processes - once with
+DATABASE_POOL_SIZE=0 (a new connection per request) and once with pooling
+- and prints both results side by side. Against a local SQLite file the
+difference is small (opening SQLite is cheap); against PostgreSQL, where
+every connection is a TCP handshake plus authentication, it is the point.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from races import loadtest
+
+
+class Command(BaseCommand):
+    help = "Benchmark request latency with and without connection pooling"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['inprocess', 'gunicorn'], default='inprocess')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=4,
+                            help="gunicorn gthread threads per worker (gunicorn mode)")
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--pool-size', type=int, default=5)
+        parser.add_argument('--routes', default=','.join(loadtest.DEFAULT_ROUTES))
+        parser.add_argument('--database-url', default=None,
+                            help="Database to benchmark (default: DATABASE_URL)")
+        parser.add_argument('--output', default=None, help="Save both results as JSON")
+
+    def handle(self, *args, **options):
+        results = {}
+        for label, pool_size in (('no_pool', 0), ('pooled', options['pool_size'])):
+            self.stdout.write(f"Running {label} (DATABASE_POOL_SIZE={pool_size})...")
+            results[label] = self.run_load_test(options, pool_size)
+
+        self.stdout.write(f"\n{'route':<16}{'':<8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        routes = list(results['pooled']['routes']) + ['total']
+        for route in routes:
+            for label in ('no_pool', 'pooled'):
+                data = results[label]
+                stats = data['total'] if route == 'total' else data['routes'].get(route)
+                if stats is None:
+                    continue
+                self.stdout.write(
+                    f"{route:<16}{label:<8}{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>9.1f}"
+                    f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}")
+
+        changes = loadtest.compare(results['no_pool'], results['pooled'])['total']
+        self.stdout.write("\nPooled vs unpooled: " + ', '.join(
+            f"{metric} {change:+.1f}%" for metric, (_, _, change) in changes.items()))
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+
+    def run_load_test(self, options, pool_size):
+        environment = dict(os.environ, DATABASE_POOL_SIZE=str(pool_size))
+        if options['database_url']:
+            environment['DATABASE_URL'] = options['database_url']
+        if options['mode'] == 'gunicorn':
+            # gthread workers: several threads share one process pool
+            environment['GUNICORN_CMD_ARGS'] = '--worker-class gthread'
+
+        fd, output = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        command = [
+            sys.executable, 'manage.py', 'run_load_test',
+            '--mode', options['mode'],
+            '--requests', str(options['requests']),
+            '--concurrency', str(options['concurrency']),
+            '--workers', str(options['workers']),
+            '--threads', str(options['threads']),
+            '--routes', options['routes'],
+            '--output', output,
+        ]
+        try:
+            process = subprocess.run(command, cwd=str(settings.BASE_DIR), env=environment,
+                                     capture_output=True, text=True)
+            if process.returncode != 0:
+                raise CommandError(f"run_load_test failed:\n{process.stderr[-2000:]}")
+            with open(output) as handle:
+                return json.load(handle)
+        finally:
+            os.remove(output)
@@ -0,0 +1,91 @@
+"""
+Compare concurrent-connection throughput of the WSGI and ASGI stacks
+
+    python manage.py seed_perf_data --races 2000 --comments 20000
+    python manage.py benchmark_servers --concurrency 32 --duration 10
+    python manage.py benchmark_servers --slow-clients 4 --output servers.json
+
+Runs the same load against a local gunicorn serving config.wsgi (sync
+workers) and one serving config.asgi (uvicorn workers, async views), with
+the same number of worker processes. --slow-clients holds that many extra
+connections that trickle their headers in: each one blocks a sync worker,
+while an ASGI worker keeps serving everyone else. See races/loadtest.py.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from races import loadtest
+
+SERVERS = ['wsgi', 'asgi']
+
+
+class Command(BaseCommand):
+    help = "Load-test gunicorn WSGI and ASGI (uvicorn) servers side by side"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help="Simultaneous keep-alive client connections")
+        parser.add_argument('--duration', type=float, default=10,
+                            help="Seconds of load per server")
+        parser.add_argument('--slow-clients', type=int, default=0,
+                            help="Extra connections that send their request slowly")
+        parser.add_argument('--workers', type=int, default=2,
+                            help="gunicorn worker processes for both servers")
+        parser.add_argument('--routes', default=','.join(loadtest.DEFAULT_ROUTES),
+                            help=f"Comma separated, from: {', '.join(loadtest.ROUTES)}")
+        parser.add_argument('--only', choices=SERVERS, default=None,
+                            help="Run just one of the servers")
+        parser.add_argument('--output', default=None, help="Write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        routes = [route.strip() for route in options['routes'].split(',') if route.strip()]
+        unknown = set(routes) - set(loadtest.ROUTES)
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+
+        results = {}
+        try:
+            context = loadtest.build_context(routes)
+            for server in [options['only']] if options['only'] else SERVERS:
+                self.stdout.write(f"Running {server} for {options['duration']:g}s ...")
+                results[server] = self.run(server, options, routes, context)
+        except loadtest.LoadTestError as error:
+            raise CommandError(str(error))
+
+        self.print_results(results)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump({
+                    'environment': loadtest.environment(),
+                    'settings': {key: options[key] for key in
+                                 ('concurrency', 'duration', 'slow_clients', 'workers')},
+                    'routes_requested': routes,
+                    'servers': results,
+                }, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}"))
+
+    def run(self, server, options, routes, context):
+        with loadtest.GunicornServer(options['workers'], asgi=server == 'asgi') as process:
+            def transport():
+                return loadtest.HTTPTransport('127.0.0.1', process.port, context.cookie)
+
+            # Warm every worker up before the slow clients arrive
+            loadtest.run_clients(transport, context, routes, options['concurrency'],
+                                 requests=options['concurrency'] * 2)
+            with loadtest.SlowClients('127.0.0.1', process.port, options['slow_clients']):
+                return loadtest.run_clients(transport, context, routes, options['concurrency'],
+                                            duration=options['duration'])
+
+    def print_results(self, results):
+        self.stdout.write(
+            f"\n{'server':<8}{'reqs':>8}{'errs':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        for server, report in results.items():
+            total = report['total']
+            self.stdout.write(
+                f"{server:<8}{total['requests']:>8}{total['errors']:>6}"
+                f"{total['throughput_rps']:>9.1f}{total['p50_ms']:>9.1f}"
+                f"{total['p95_ms']:>9.1f}{total['p99_ms']:>9.1f}{total['max_ms']:>9.1f}"
+            )
+            for error in report['sample_errors']:
+                self.stdout.write(self.style.WARNING(f"  {server} error: {error}"))
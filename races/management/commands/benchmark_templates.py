@@ -0,0 +1,86 @@
+"""
+Benchmark template rendering against a stored baseline
+
+    python manage.py benchmark_templates --save-baseline    # record
+    python manage.py benchmark_templates                    # compare
+    python manage.py benchmark_templates --only race_detail --repeat 30
+
+Fails (non-zero exit) when a case is slower than the baseline by more than
+--tolerance, so it can run in CI. See races/template_bench.py for the cases.
+"""
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from races import template_bench
+
+
+def default_baseline():
+    return os.path.join(settings.BASE_DIR, 'benchmarks', 'templates.json')
+
+
+class Command(BaseCommand):
+    help = "Time template rendering and compare with the stored baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=15,
+                            help="Renders per case (the median is reported)")
+        parser.add_argument('--only', default='',
+                            help="Comma separated name fragments, e.g. race_list,filter")
+        parser.add_argument('--baseline', default=None,
+                            help="Baseline JSON file (default benchmarks/templates.json)")
+        parser.add_argument('--save-baseline', action='store_true',
+                            help="Store this run as the new baseline")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed slowdown before failing (0.25 = 25%%)")
+        parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                            help="Ignore slowdowns smaller than this many milliseconds")
+
+    def handle(self, *args, **options):
+        include = [part.strip() for part in options['only'].split(',') if part.strip()]
+        baseline_path = options['baseline'] or default_baseline()
+
+        current = template_bench.run(repeat=options['repeat'], include=include or None)
+
+        baseline = None
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as handle:
+                baseline = json.load(handle)
+        self.print_results(current, baseline)
+
+        if options['save_baseline']:
+            if baseline and include:
+                # Partial run - keep the cases we did not re-measure
+                baseline['cases'].update(current['cases'])
+                baseline['calibration_ms'] = current['calibration_ms']
+                current = baseline
+            os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+            with open(baseline_path, 'w') as handle:
+                json.dump(current, handle, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {baseline_path}"))
+            return
+
+        if baseline is None:
+            self.stdout.write(self.style.WARNING(
+                f"No baseline at {baseline_path} - run with --save-baseline first"))
+            return
+
+        regressions = template_bench.compare(
+            baseline, current, options['tolerance'], options['min_delta_ms'])
+        if regressions:
+            for name, before, after, ratio in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f"  {name}: {before:.3f} ms -> {after:.3f} ms ({ratio:.2f}x)"))
+            raise CommandError(f"{len(regressions)} template benchmark(s) regressed")
+        self.stdout.write(self.style.SUCCESS("All template benchmarks within tolerance"))
+
+    def print_results(self, current, baseline):
+        self.stdout.write(f"{'case':<44}{'median ms':>12}{'min ms':>10}{'base min':>11}")
+        for name, stats in current['cases'].items():
+            before = ''
+            if baseline and name in baseline['cases']:
+                before = f"{baseline['cases'][name]['min_ms']:.3f}"
+            self.stdout.write(
+                f"{name:<44}{stats['median_ms']:>12.3f}{stats['min_ms']:>10.3f}{before:>11}")
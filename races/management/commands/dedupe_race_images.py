@@ -0,0 +1,140 @@
+"""
+Deduplicate the existing race image library
+
+New uploads are deduplicated in Race.save(). This command catches up on the
+images that were stored before fingerprinting existed:
+
+    python manage.py dedupe_race_images --dry-run
+    python manage.py dedupe_race_images --delete-orphans
+
+Each distinct stored image is fetched once (from MEDIA_ROOT when a local copy
+exists, otherwise from Cloudinary), fingerprinted and either recorded as the
+canonical copy or pointed at an existing matching asset. Races are re-pointed
+with one UPDATE per duplicate asset - soft-deleted races waiting to be purged
+included, so --delete-orphans never destroys an image one of them still uses.
+A dry run writes nothing; it remembers the fingerprints in memory instead, so
+it reports the same duplicates a real run would merge.
+"""
+import os
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from races.images import fingerprint_bytes, hamming_distance, max_distance
+from races.models import Race, StoredImage
+from races.templatetags.cloudinary_filters import is_placeholder
+
+
+class Command(BaseCommand):
+    help = "Fingerprint stored race images and merge duplicate copies"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report duplicates without changing anything")
+        parser.add_argument(
+            '--delete-orphans', action='store_true',
+            help="Delete duplicate assets from Cloudinary once unreferenced")
+        parser.add_argument(
+            '--timeout', type=float, default=10.0,
+            help="Seconds to wait when downloading an image")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        image_field = Race._meta.get_field('image')
+
+        # STEP 1: Every distinct stored image value (one fetch per asset),
+        # soft-deleted races included
+        values = (
+            Race.all_objects.exclude(image__isnull=True).exclude(image='')
+            .values_list('image', flat=True).distinct().order_by('image')
+        )
+
+        stats = {'assets': 0, 'duplicates': 0, 'races': 0, 'skipped': 0}
+        orphans = []
+        seen = []  # (fingerprint, image) a dry run would have recorded
+
+        for value in values.iterator():
+            resource = image_field.to_python(value)
+            if is_placeholder(resource):
+                continue
+            stats['assets'] += 1
+
+            # STEP 2: Fingerprint the image bytes
+            data = self.load_image(value, resource, options['timeout'])
+            fingerprint = fingerprint_bytes(data) if data else None
+            if fingerprint is None:
+                stats['skipped'] += 1
+                self.stderr.write(f"Could not read image {value}")
+                continue
+
+            # STEP 3: Known image? Point every race at the canonical asset
+            existing = StoredImage.objects.find_match(fingerprint)
+            canonical = existing.public_id if existing is not None else None
+            if canonical is None and dry_run:
+                canonical = self.find_seen(seen, fingerprint)
+            if canonical is None:
+                if dry_run:
+                    seen.append((fingerprint, value))
+                else:
+                    StoredImage.objects.record(fingerprint, value)
+                continue
+            if canonical == value:
+                continue
+
+            stats['duplicates'] += 1
+            if dry_run:
+                count = Race.all_objects.filter(image=value).count()
+            else:
+                count = Race.all_objects.filter(image=value).update(image=canonical)
+                orphans.append(resource.public_id)
+            stats['races'] += count
+            self.stdout.write(f"{value} -> {canonical} ({count} race(s))")
+
+        # STEP 4: Optionally remove the now unreferenced copies
+        if options['delete_orphans'] and orphans:
+            from cloudinary import uploader
+            for public_id in orphans:
+                uploader.destroy(public_id)
+            self.stdout.write(f"Deleted {len(orphans)} orphaned asset(s)")
+
+        prefix = "[dry run] " if dry_run else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{stats['assets']} asset(s) checked, "
+            f"{stats['duplicates']} duplicate(s), "
+            f"{stats['races']} race(s) re-pointed, "
+            f"{stats['skipped']} skipped"
+        ))
+
+    def find_seen(self, seen, fingerprint):
+        """
+        StoredImage.objects.find_match() for the images a dry run has seen
+        """
+        limit = max_distance()
+        for known, value in seen:
+            if known.content_hash == fingerprint.content_hash:
+                return value
+            if limit and hamming_distance(known.phash, fingerprint.phash) <= limit:
+                return value
+        return None
+
+    def load_image(self, value, resource, timeout):
+        """
+        Return the raw image bytes, preferring a local copy in MEDIA_ROOT
+        """
+        filename = os.path.basename(str(value))
+        for candidate in (
+            os.path.join(settings.MEDIA_ROOT, str(value)),
+            os.path.join(settings.MEDIA_ROOT, 'race_images', filename),
+        ):
+            if os.path.isfile(candidate):
+                with open(candidate, 'rb') as handle:
+                    return handle.read()
+
+        try:
+            response = requests.get(resource.build_url(secure=True), timeout=timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            return None
+        return response.content
@@ -0,0 +1,45 @@
+"""
+Delete the accounts of approved deletion requests
+
+    python manage.py process_account_deletions
+    python manage.py process_account_deletions --batch-size 200 --pause 0.2 --limit 5
+
+Run it from a scheduler (e.g. every few minutes). Each batch is its own
+short transaction, so it can be stopped at any time; the next run resumes
+where it stopped. See races/account_deletion.py.
+"""
+from django.core.management.base import BaseCommand
+
+from races import account_deletion
+
+
+class Command(BaseCommand):
+    help = "Delete approved accounts in small batches (comments, then races, then the user)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Rows deleted per transaction")
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help="Seconds to sleep between batches")
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Process at most this many requests")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the requests that would be processed")
+
+    def handle(self, *args, **options):
+        requests = account_deletion.approved_requests()[:options['limit']]
+        if options['dry_run']:
+            for deletion_request in requests:
+                resumed = ' (resuming)' if deletion_request.processing_started_at else ''
+                self.stdout.write(f"Would delete {deletion_request.username}{resumed}")
+            return
+
+        processed = 0
+        for deletion_request in requests:
+            summary = account_deletion.execute(
+                deletion_request, options['batch_size'], options['pause'])
+            processed += 1
+            self.stdout.write(
+                f"Deleted {summary['username']}: {summary['comments']} comment(s), "
+                f"{summary['races']} race(s)")
+        self.stdout.write(self.style.SUCCESS(f"{processed} account(s) deleted"))
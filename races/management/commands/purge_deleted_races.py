@@ -0,0 +1,30 @@
+"""
+Remove races that users deleted, with their comments, in small batches
+
+    python manage.py purge_deleted_races
+    python manage.py purge_deleted_races --batch-size 200 --pause 0.1 --limit 10
+
+Deleted races are already hidden from the site; this only frees the rows.
+Run it from a scheduler. See races/purge.py.
+"""
+from django.core.management.base import BaseCommand
+
+from races import purge
+
+
+class Command(BaseCommand):
+    help = "Purge soft-deleted races and their comments in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Comments deleted per transaction")
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help="Seconds to sleep between batches")
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Purge at most this many races")
+
+    def handle(self, *args, **options):
+        purged = purge.purge_deleted(options['batch_size'], options['pause'], options['limit'])
+        for race_id, comments in purged:
+            self.stdout.write(f"Purged race {race_id} ({comments} comment(s))")
+        self.stdout.write(self.style.SUCCESS(f"{len(purged)} race(s) purged"))
@@ -0,0 +1,25 @@
+"""
+Recompute the admin dashboard statistics from scratch
+
+    python manage.py rebuild_rollups
+    python manage.py rebuild_rollups --chunk-size 50000
+
+The counters are normally kept current as rows change and rebuilt nightly
+by the scheduler (races/rollups.py). Run this after installing the feature
+or after bulk changes made outside the app.
+"""
+from django.core.management.base import BaseCommand
+
+from races import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the statistics rollup counters in primary-key chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help="Rows grouped per query")
+
+    def handle(self, *args, **options):
+        written = rollups.rebuild(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"{written} counter(s) rebuilt"))
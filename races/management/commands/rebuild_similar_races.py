@@ -0,0 +1,28 @@
+"""
+Recompute the "You might also like" lists of every race
+
+    python manage.py rebuild_similar_races
+    python manage.py rebuild_similar_races --batch-size 200 --top 6
+
+Lists are normally updated by background jobs as races are created, edited
+and approved, and rebuilt nightly by the scheduler (races/similarity.py).
+Run this once after installing the feature or after changing the
+SIMILAR_* weights.
+"""
+from django.core.management.base import BaseCommand
+
+from races import similarity
+
+
+class Command(BaseCommand):
+    help = "Recompute similar-race recommendations in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Races whose lists are replaced per transaction")
+        parser.add_argument('--top', type=int, default=None,
+                            help="Recommendations per race (default SIMILAR_RACES_TOP_K)")
+
+    def handle(self, *args, **options):
+        updated = similarity.rebuild(options['batch_size'], options['top'])
+        self.stdout.write(self.style.SUCCESS(f"{updated} race(s) updated"))
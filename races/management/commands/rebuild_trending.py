@@ -0,0 +1,25 @@
+"""
+Recompute the trending race ranking from scratch
+
+    python manage.py rebuild_trending
+    python manage.py rebuild_trending --batch-size 200
+
+The ranking is normally kept up to date as views and comments arrive
+(races/trending.py). Run this once after installing the feature, or after
+changing the TRENDING_* weights.
+"""
+from django.core.management.base import BaseCommand
+
+from races import trending
+
+
+class Command(BaseCommand):
+    help = "Recompute every trending score in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Races scored per batch")
+
+    def handle(self, *args, **options):
+        ranked = trending.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{ranked} race(s) ranked"))
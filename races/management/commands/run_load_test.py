@@ -0,0 +1,121 @@
+"""
+Load-test the site and save the results as JSON
+
+    python manage.py seed_perf_data --races 20000 --comments 200000
+    python manage.py run_load_test --requests 2000 --concurrency 8 --output before.json
+    ... make a change ...
+    python manage.py run_load_test --requests 2000 --concurrency 8 \
+        --output after.json --compare before.json
+
+--mode inprocess (default) calls config.wsgi.application directly;
+--mode gunicorn starts a local gunicorn and measures real HTTP requests;
+--mode asgi does the same with config.asgi on uvicorn workers.
+See races/loadtest.py for details.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from races import loadtest
+
+
+class Command(BaseCommand):
+    help = "Drive the site with concurrent clients and report latency per route"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['inprocess', 'gunicorn', 'asgi'], default='inprocess')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help="Number of simultaneous clients")
+        parser.add_argument('--requests', type=int, default=None,
+                            help="Total requests to send (default 500 unless --duration)")
+        parser.add_argument('--duration', type=float, default=None,
+                            help="Run for this many seconds instead of a request count")
+        parser.add_argument('--routes', default=','.join(loadtest.DEFAULT_ROUTES),
+                            help=f"Comma separated, from: {', '.join(loadtest.ROUTES)}")
+        parser.add_argument('--user', default=None,
+                            help="Username to log the clients in as")
+        parser.add_argument('--warmup', type=int, default=5,
+                            help="Unmeasured requests per client before measuring")
+        parser.add_argument('--workers', type=int, default=2,
+                            help="gunicorn worker processes (gunicorn and asgi modes)")
+        parser.add_argument('--threads', type=int, default=1,
+                            help="gunicorn threads per worker (gunicorn mode)")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--output', default=None, help="Write the results to this JSON file")
+        parser.add_argument('--compare', default=None,
+                            help="Earlier results JSON to compare against")
+
+    def handle(self, *args, **options):
+        routes = [route.strip() for route in options['routes'].split(',') if route.strip()]
+        unknown = set(routes) - set(loadtest.ROUTES)
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+        if options['requests'] is None and options['duration'] is None:
+            options['requests'] = 500
+
+        try:
+            context = loadtest.build_context(routes, options['user'], options['seed'])
+            report = self.run(options, routes, context)
+        except loadtest.LoadTestError as error:
+            raise CommandError(str(error))
+
+        result = {
+            'environment': loadtest.environment(),
+            'settings': {
+                key: options[key] for key in
+                ('mode', 'concurrency', 'requests', 'duration', 'warmup', 'workers', 'threads')
+            },
+            'routes_requested': routes,
+            **report,
+        }
+        self.print_report(result)
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(result, handle, indent=2)
+            self.stdout.write(f"Saved results to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)
+            self.print_comparison(loadtest.compare(baseline, result))
+
+    def run(self, options, routes, context):
+        run_options = {
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'duration': options['duration'],
+            'warmup': options['warmup'],
+        }
+        if options['mode'] == 'inprocess':
+            from config.wsgi import application
+
+            return loadtest.run_clients(
+                lambda: loadtest.InProcessTransport(application, context.cookie),
+                context, routes, **run_options)
+
+        with loadtest.GunicornServer(options['workers'], options['threads'],
+                                     asgi=options['mode'] == 'asgi') as server:
+            return loadtest.run_clients(
+                lambda: loadtest.HTTPTransport('127.0.0.1', server.port, context.cookie),
+                context, routes, **run_options)
+
+    def print_report(self, result):
+        header = f"{'route':<16}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+        self.stdout.write(header)
+        rows = list(result['routes'].items()) + [('TOTAL', result['total'])]
+        for route, stats in rows:
+            self.stdout.write(
+                f"{route:<16}{stats['requests']:>7}{stats['errors']:>6}"
+                f"{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>9.1f}"
+                f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+            )
+        for error in result['sample_errors']:
+            self.stdout.write(self.style.WARNING(f"  error: {error}"))
+
+    def print_comparison(self, changes):
+        self.stdout.write("\nCompared with baseline (before -> after, % change):")
+        for route, metrics in changes.items():
+            parts = [f"{metric} {before} -> {after} ({change:+.1f}%)"
+                     for metric, (before, after, change) in metrics.items()]
+            self.stdout.write(f"  {route}: " + ', '.join(parts))
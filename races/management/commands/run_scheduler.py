@@ -0,0 +1,45 @@
+"""
+Run the periodic maintenance scheduler in the foreground
+
+    python manage.py run_scheduler                       # tick forever
+    python manage.py run_scheduler --once                # run due jobs, then exit
+    python manage.py run_scheduler --job clear_expired_sessions --force
+
+Use this instead of SCHEDULER_ENABLED when maintenance should run in its
+own process (or from cron with --once). See races/scheduler.py.
+"""
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from races import scheduler
+
+
+class Command(BaseCommand):
+    help = "Run periodic maintenance jobs (leader-elected through the database)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run due jobs once and exit")
+        parser.add_argument('--job', action='append', dest='jobs', default=None,
+                            help="Only this job (repeatable)")
+        parser.add_argument('--force', action='store_true',
+                            help="Run even if the job is not due yet")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Seconds between ticks (default SCHEDULER_TICK)")
+
+    def handle(self, *args, **options):
+        unknown = set(options['jobs'] or []) - set(scheduler.registry)
+        if unknown:
+            raise CommandError(f"Unknown job(s): {', '.join(sorted(unknown))}. "
+                               f"Known: {', '.join(sorted(scheduler.registry))}")
+
+        if options['once'] or options['force']:
+            ran = scheduler.tick(names=options['jobs'], force=options['force'])
+            self.stdout.write(f"Ran: {', '.join(ran) or 'nothing due'}")
+            return
+
+        self.stdout.write(f"Scheduling: {', '.join(sorted(scheduler.registry))}")
+        try:
+            scheduler.run_forever(threading.Event(), options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
@@ -0,0 +1,92 @@
+"""
+Run background job workers
+
+    python manage.py run_workers                   # one worker, runs forever
+    python manage.py run_workers --concurrency 4   # four worker threads
+    python manage.py run_workers --burst           # stop when the queue is empty
+
+Each worker thread loops: claim the next due job, run it, and when nothing
+is due sleep for --poll-interval seconds. Ctrl+C / SIGTERM lets the
+running jobs finish, then exits. See races/jobs.py.
+"""
+import os
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from races import jobs
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the database queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help="Number of worker threads")
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help="Seconds to sleep when no job is due (default JOB_POLL_INTERVAL)")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once no job is due instead of waiting for more")
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        self.poll_interval = options['poll_interval']
+        if self.poll_interval is None:
+            self.poll_interval = getattr(settings, 'JOB_POLL_INTERVAL', 1.0)
+        self.burst = options['burst']
+        self.processed = 0
+        self.lock = threading.Lock()
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f"Re-queued {requeued} job(s) from stopped workers")
+
+        name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Starting {options['concurrency']} worker(s) ({name})")
+        if options['concurrency'] == 1:
+            # A single worker runs in this thread
+            self.work(f"{name}:0")
+        else:
+            threads = [
+                threading.Thread(target=self.work_in_thread, args=(f"{name}:{number}",),
+                                 daemon=True)
+                for number in range(options['concurrency'])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                # join() with a timeout keeps the main thread responsive to signals
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        self.stdout.write(self.style.SUCCESS(f"Workers stopped after {self.processed} job(s)"))
+
+    def stop(self, signum, frame):
+        self.stdout.write("Stopping after the running jobs finish...")
+        self.stopping.set()
+
+    def work(self, name):
+        while not self.stopping.is_set():
+            close_old_connections()
+            if jobs.run_next(name):
+                with self.lock:
+                    self.processed += 1
+                continue
+            if self.burst:
+                return
+            self.stopping.wait(self.poll_interval)
+            jobs.requeue_stale()
+
+    def work_in_thread(self, name):
+        try:
+            self.work(name)
+        finally:
+            # Each thread has its own database connection
+            connection.close()
@@ -0,0 +1,149 @@
+"""
+Generate a large, realistic data set for performance testing
+
+    python manage.py seed_perf_data --users 2000 --races 50000 --comments 500000
+
+Everything is inserted with bulk_create in batches, so hundreds of
+thousands of rows take seconds rather than hours. Generated users are
+named "perf_user_<n>" and can all log in with the --password value.
+Use --seed for a reproducible data set.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from races.models import Comment, Race
+
+# Real city centres (city, country, latitude, longitude) for coordinates
+CITIES = [
+    ('London', 'UK', 51.5074, -0.1278),
+    ('Manchester', 'UK', 53.4808, -2.2426),
+    ('Edinburgh', 'UK', 55.9533, -3.1883),
+    ('Cardiff', 'UK', 51.4816, -3.1791),
+    ('Dublin', 'Ireland', 53.3498, -6.2603),
+    ('Paris', 'France', 48.8566, 2.3522),
+    ('Bordeaux', 'France', 44.8378, -0.5792),
+    ('Berlin', 'Germany', 52.5200, 13.4050),
+    ('Amsterdam', 'Netherlands', 52.3676, 4.9041),
+    ('Madrid', 'Spain', 40.4168, -3.7038),
+    ('Rome', 'Italy', 41.9028, 12.4964),
+    ('New York', 'USA', 40.7128, -74.0060),
+    ('Boston', 'USA', 42.3601, -71.0589),
+    ('Tokyo', 'Japan', 35.6762, 139.6503),
+    ('Cape Town', 'South Africa', -33.9249, 18.4241),
+]
+
+# Popular distances are far more common than ultras
+DISTANCE_WEIGHTS = {'5K': 40, 'HALF': 25, 'FULL': 15, 'ULTRA': 5, 'OTHER': 15}
+CUSTOM_DISTANCES = ['10K', '15K', '10 miles', '30K', 'Obstacle course', '1 mile']
+NAME_WORDS = ['Mud', 'Cheese', 'Ice', 'Beach', 'Midnight', 'Zombie', 'Colour',
+              'Wine', 'Hill', 'River', 'Forest', 'Desert', 'Costume', 'Santa']
+NAME_SUFFIXES = ['Dash', 'Run', 'Challenge', 'Marathon', 'Scramble', 'Trail Race']
+
+
+class Command(BaseCommand):
+    help = "Bulk-create users, races and comments for performance testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--races', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=None,
+                            help="Random seed for a reproducible data set")
+        parser.add_argument('--password', default='perfpass123',
+                            help="Password shared by all generated users")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        users = self.create_users(options['users'], options['password'], batch_size)
+        races = self.create_races(rng, options['races'], users, batch_size)
+        comments = self.create_comments(rng, options['comments'], races, users, batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(users)} users, {len(races)} races, {comments} comments"))
+
+    def create_users(self, count, password, batch_size):
+        """Users share one pre-computed password hash (hashing is slow)"""
+        start = (User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+        password_hash = make_password(password)
+        users = [
+            User(username=f'perf_user_{start + index}', email=f'perf{start + index}@example.com',
+                 password=password_hash)
+            for index in range(count)
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=batch_size)
+        return list(
+            User.objects.filter(username__startswith='perf_user_')
+            .order_by('-pk').values_list('pk', flat=True)[:count]
+        )
+
+    def create_races(self, rng, count, user_ids, batch_size):
+        """Races spread over two years with realistic mixes of every field"""
+        if not user_ids:
+            return []
+        today = timezone.now().date()
+        distances = list(DISTANCE_WEIGHTS)
+        weights = list(DISTANCE_WEIGHTS.values())
+        difficulties = [choice for choice, _ in Race.DIFFICULTY_CHOICES]
+
+        def build():
+            distance = rng.choices(distances, weights)[0]
+            city, country, latitude, longitude = rng.choice(CITIES)
+            # Most races are upcoming; roughly a third are in the past
+            days = int(rng.triangular(-365, 365, 60))
+            return Race(
+                name=f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_SUFFIXES)} {rng.randint(1, 9999)}",
+                description=' '.join(rng.choices(NAME_WORDS, k=rng.randint(20, 120))),
+                distance=distance,
+                custom_distance=rng.choice(CUSTOM_DISTANCES) if distance == 'OTHER' else '',
+                difficulty=rng.choice(difficulties),
+                race_date=today + timedelta(days=days),
+                city=city,
+                country=country,
+                latitude=Decimal(f'{latitude + rng.uniform(-0.2, 0.2):.6f}'),
+                longitude=Decimal(f'{longitude + rng.uniform(-0.2, 0.2):.6f}'),
+                status=1 if rng.random() < 0.95 else 0,
+                approved=rng.random() < 0.85,
+                created_by_id=rng.choice(user_ids),
+            )
+
+        with transaction.atomic():
+            for offset in range(0, count, batch_size):
+                size = min(batch_size, count - offset)
+                Race.objects.bulk_create([build() for _ in range(size)])
+        return list(Race.objects.order_by('-pk').values_list('pk', flat=True)[:count])
+
+    def create_comments(self, rng, count, race_ids, user_ids, batch_size):
+        """
+        Comments follow a long-tail distribution: a few popular races get
+        most of the discussion, like real traffic
+        """
+        if not race_ids or not user_ids:
+            return 0
+        popularity = [rng.paretovariate(1.2) for _ in race_ids]
+        created = 0
+        with transaction.atomic():
+            while created < count:
+                size = min(batch_size, count - created)
+                targets = rng.choices(race_ids, popularity, k=size)
+                Comment.objects.bulk_create([
+                    Comment(
+                        race_id=race_id,
+                        author_id=rng.choice(user_ids),
+                        body=' '.join(rng.choices(NAME_WORDS, k=rng.randint(3, 40))),
+                        approved=rng.random() < 0.97,
+                    )
+                    for race_id in targets
+                ])
+                created += size
+        return created
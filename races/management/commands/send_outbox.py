@@ -0,0 +1,26 @@
+"""
+Send queued notification emails
+
+    python manage.py send_outbox
+    python manage.py send_outbox --batch-size 50 --rate 2
+
+The send_outbox scheduled job does the same every minute; use this to
+flush the outbox by hand. See races/outbox.py.
+"""
+from django.core.management.base import BaseCommand
+
+from races import outbox
+
+
+class Command(BaseCommand):
+    help = "Send pending outbox emails in batches over one connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Emails per batch (default EMAIL_OUTBOX_BATCH_SIZE)")
+        parser.add_argument('--rate', type=float, default=None,
+                            help="Max emails per second (default EMAIL_OUTBOX_RATE, 0 = no limit)")
+
+    def handle(self, *args, **options):
+        sent, failed = outbox.drain(options['batch_size'], options['rate'])
+        self.stdout.write(self.style.SUCCESS(f"{sent} email(s) sent, {failed} failed"))
@@ -0,0 +1,162 @@
+"""
+Measure how expensive it is to start a worker
+
+    python manage.py startup_profile
+    python manage.py startup_profile --top 30 --url / --url /race/1/
+
+Runs fresh Python processes (start-up costs can only be measured once per
+process) and reports:
+
+1. Import time - `python -X importtime` while loading the WSGI app, summed
+   per top-level package, so heavy or unnecessary imports stand out
+2. First-request cost - the first and second request to each URL in a cold
+   worker, and again in a worker that ran config.startup.warm_up() first
+   (what gunicorn.conf.py does before forking)
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MARKER = 'STARTUP-PROFILE:'
+
+# Executed in a fresh interpreter; prints one MARKER line with JSON timings
+CHILD_SCRIPT = r'''
+import json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+settings_ms = (time.perf_counter() - start) * 1000
+django.setup()
+setup_ms = (time.perf_counter() - start) * 1000
+from config.wsgi import application
+app_ms = (time.perf_counter() - start) * 1000
+result = {'settings_ms': settings_ms, 'setup_ms': setup_ms, 'application_ms': app_ms}
+if sys.argv[1] == 'warm':
+    from config.startup import warm_up
+    begin = time.perf_counter()
+    result['warm_up'] = warm_up()
+    result['warm_up_ms'] = (time.perf_counter() - begin) * 1000
+from races.loadtest import InProcessTransport
+transport = InProcessTransport(application)
+requests = {}
+for url in sys.argv[2:]:
+    timings = []
+    for _ in range(2):
+        begin = time.perf_counter()
+        status, size = transport.request(url)
+        timings.append((time.perf_counter() - begin) * 1000)
+    requests[url] = {'status': status, 'first_ms': timings[0], 'second_ms': timings[1]}
+result['requests'] = requests
+print('STARTUP-PROFILE:' + json.dumps(result))
+'''
+
+
+def parse_importtime(stderr):
+    """
+    Sum `-X importtime` output per top-level package
+
+    Returns (total_microseconds, [(package, self_microseconds, modules)])
+    sorted with the most expensive package first.
+    """
+    per_package = defaultdict(lambda: [0, 0])
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, _, name = line[len('import time:'):].split('|')
+            self_us = int(self_us)
+        except ValueError:
+            continue
+        package = name.strip().split('.')[0]
+        per_package[package][0] += self_us
+        per_package[package][1] += 1
+        total += self_us
+    ranked = sorted(((package, us, count) for package, (us, count) in per_package.items()),
+                    key=lambda item: item[1], reverse=True)
+    return total, ranked
+
+
+class Command(BaseCommand):
+    help = "Report import-time and first-request costs of a fresh worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15,
+                            help="Number of packages to list by import time")
+        parser.add_argument('--url', action='append', dest='urls', default=None,
+                            help="URL to request (repeatable, default: / and a race page)")
+        parser.add_argument('--json', action='store_true', help="Print raw JSON only")
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or self.default_urls()
+
+        imports = self.run_child(['cold'], importtime=True)
+        cold = self.run_child(['cold'] + urls)
+        warm = self.run_child(['warm'] + urls)
+        total_us, ranked = parse_importtime(imports['stderr'])
+
+        report = {
+            'import_total_ms': round(total_us / 1000, 1),
+            'import_by_package_ms': {package: round(us / 1000, 1)
+                                     for package, us, _ in ranked[:options['top']]},
+            'cold': cold['result'],
+            'warm': warm['result'],
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.print_report(report, ranked[:options['top']])
+
+    def default_urls(self):
+        from races.models import Race
+
+        urls = ['/']
+        race_id = (Race.objects.filter(status=1, approved=True)
+                   .values_list('pk', flat=True).first())
+        if race_id:
+            urls.append(f'/race/{race_id}/')
+        return urls
+
+    def run_child(self, arguments, importtime=False):
+        command = [sys.executable]
+        if importtime:
+            command += ['-X', 'importtime']
+        command += ['-c', CHILD_SCRIPT] + arguments
+        if importtime:
+            command.append('/')
+        environment = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'config.settings'))
+        process = subprocess.run(
+            command, cwd=str(settings.BASE_DIR), env=environment,
+            capture_output=True, text=True, timeout=300,
+        )
+        for line in process.stdout.splitlines():
+            if line.startswith(MARKER):
+                return {'result': json.loads(line[len(MARKER):]), 'stderr': process.stderr}
+        raise CommandError(f"Profiling process failed:\n{process.stderr[-2000:]}")
+
+    def print_report(self, report, ranked):
+        self.stdout.write(self.style.MIGRATE_HEADING("Import time by package"))
+        self.stdout.write(f"  total: {report['import_total_ms']:.1f} ms")
+        for package, us, modules in ranked:
+            self.stdout.write(f"  {package:<28}{us / 1000:>9.1f} ms  ({modules} modules)")
+
+        for label in ('cold', 'warm'):
+            result = report[label]
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label.capitalize()} worker"))
+            self.stdout.write(
+                f"  settings {result['settings_ms']:.0f} ms, django.setup() done at "
+                f"{result['setup_ms']:.0f} ms, WSGI app ready at {result['application_ms']:.0f} ms")
+            if label == 'warm':
+                self.stdout.write(f"  warm_up(): {result['warm_up_ms']:.0f} ms {result['warm_up']}")
+            for url, timing in result['requests'].items():
+                self.stdout.write(
+                    f"  {url:<24} first {timing['first_ms']:>8.1f} ms   "
+                    f"second {timing['second_ms']:>8.1f} ms   (HTTP {timing['status']})")
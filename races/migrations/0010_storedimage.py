@@ -0,0 +1,34 @@
+# Generated by Django 4.2.24 on 2026-10-18 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0009_remove_race_featured_image_alter_race_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(help_text='SHA-256 of the uploaded file', max_length=64, unique=True)),
+                ('phash', models.CharField(help_text='Perceptual (difference) hash of the image', max_length=16)),
+                ('phash_band_0', models.PositiveIntegerField(db_index=True)),
+                ('phash_band_1', models.PositiveIntegerField(db_index=True)),
+                ('phash_band_2', models.PositiveIntegerField(db_index=True)),
+                ('phash_band_3', models.PositiveIntegerField(db_index=True)),
+                ('public_id', models.CharField(help_text='Stored asset reused by duplicate uploads', max_length=255)),
+                ('width', models.PositiveIntegerField(default=0)),
+                ('height', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Stored Image',
+                'verbose_name_plural': 'Stored Images',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
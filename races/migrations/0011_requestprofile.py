@@ -0,0 +1,39 @@
+# Generated by Django 4.2.24 on 2026-10-18 23:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('races', '0010_storedimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('path', models.CharField(max_length=500)),
+                ('route', models.CharField(db_index=True, help_text='URL name of the profiled view', max_length=200)),
+                ('method', models.CharField(max_length=10)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField(help_text='Total request time')),
+                ('query_count', models.PositiveIntegerField(default=0)),
+                ('sql_ms', models.FloatField(default=0, help_text='Time spent in SQL')),
+                ('template_ms', models.FloatField(default=0, help_text='Time spent rendering templates')),
+                ('artifact', models.CharField(help_text='Profile file name inside PROFILE_ROOT', max_length=100)),
+                ('details', models.JSONField(blank=True, default=dict, help_text='SQL log and template timings')),
+                ('user', models.ForeignKey(blank=True, help_text='Staff user who requested the profile', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request_profiles', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Request Profile',
+                'verbose_name_plural': 'Request Profiles',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.24 on 2026-10-18 23:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0011_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True)),
+                ('kind', models.CharField(choices=[('slow', 'Slow query'), ('repeated', 'Repeated in request')], db_index=True, max_length=10)),
+                ('normalized_sql', models.TextField(help_text='Query with literals replaced by ?')),
+                ('sample_sql', models.TextField(blank=True, help_text='One real example of the query')),
+                ('view', models.CharField(blank=True, help_text='View that ran the query', max_length=200)),
+                ('location', models.CharField(blank=True, help_text='Project source line that triggered it', max_length=300)),
+                ('explain', models.TextField(blank=True, help_text='Captured query plan')),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Slow Query',
+                'verbose_name_plural': 'Slow Queries',
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('races', '0012_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('approve_race', 'Approved race'), ('unapprove_race', 'Unapproved race'), ('approve_deletion', 'Approved deletion request'), ('reject_deletion', 'Rejected deletion request')], db_index=True, max_length=20)),
+                ('object_type', models.CharField(help_text='Model of the moderated object', max_length=50)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('notes', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('moderator', models.ForeignKey(blank=True, help_text='Admin who performed the action', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='moderation_logs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Moderation Log Entry',
+                'verbose_name_plural': 'Moderation Log',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['object_type', 'object_id'], name='races_moder_object__74c76e_idx')],
+            },
+        ),
+    ]
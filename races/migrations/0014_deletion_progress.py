@@ -0,0 +1,53 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_usernames(apps, schema_editor):
+    """Fill `username` for the requests that already exist"""
+    AccountDeletionRequest = apps.get_model('races', 'AccountDeletionRequest')
+    AccountDeletionRequest.objects.filter(user__isnull=False).update(
+        username=models.Subquery(
+            apps.get_model(settings.AUTH_USER_MODEL).objects
+            .filter(pk=models.OuterRef('user_id')).values('username')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('races', '0013_moderationlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountdeletionrequest',
+            name='deleted_comments',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='accountdeletionrequest',
+            name='deleted_races',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='accountdeletionrequest',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, help_text='When the deletion executor first started on this request', null=True),
+        ),
+        migrations.AddField(
+            model_name='accountdeletionrequest',
+            name='username',
+            field=models.CharField(blank=True, help_text='Username at the time of the request', max_length=150),
+        ),
+        migrations.AlterField(
+            model_name='accountdeletionrequest',
+            name='user',
+            field=models.OneToOneField(blank=True, help_text='User requesting account deletion', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deletion_request', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(copy_usernames, migrations.RunPython.noop),
+    ]
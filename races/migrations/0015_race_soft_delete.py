@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0014_deletion_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='race',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='When this race was deleted (waiting for the background purge)', null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:16
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0015_race_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(db_index=True, max_length=100)),
+                ('kwargs', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('priority', models.SmallIntegerField(default=0, help_text='Lower runs first')),
+                ('idempotency_key', models.CharField(blank=True, help_text='Enqueueing the same key again returns the existing job', max_length=200, null=True, unique=True)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Not before this time')),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5)),
+                ('last_error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, help_text='Worker that ran it last', max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Background Job',
+                'verbose_name_plural': 'Background Jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'priority', 'run_at'], name='races_job_next_idx')],
+            },
+        ),
+    ]
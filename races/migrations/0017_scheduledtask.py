@@ -0,0 +1,39 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0016_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('next_run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_started_at', models.DateTimeField(blank=True, null=True)),
+                ('last_finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_duration_ms', models.FloatField(blank=True, null=True)),
+                ('last_result', models.TextField(blank=True, help_text='Return value or error of the last run')),
+                ('last_succeeded', models.BooleanField(null=True)),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Scheduled Task',
+                'verbose_name_plural': 'Scheduled Tasks',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='race',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Draft'), (1, 'Published'), (2, 'Archived')], default=0, help_text='Current race status'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0018_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='race',
+            name='view_count',
+            field=models.PositiveBigIntegerField(default=0, help_text='How many times the race page was viewed (updated every few seconds)'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0019_race_view_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingRace',
+            fields=[
+                ('race', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='races.race')),
+                ('score', models.FloatField(db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Trending Race',
+                'verbose_name_plural': 'Trending Races',
+                'ordering': ['-score'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0020_trendingrace'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarRace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField(help_text='1 = most similar')),
+                ('race', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='races.race')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_for', to='races.race')),
+            ],
+            options={
+                'verbose_name': 'Similar Race',
+                'verbose_name_plural': 'Similar Races',
+                'ordering': ['race', 'rank'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='similarrace',
+            constraint=models.UniqueConstraint(fields=('race', 'rank'), name='races_similar_rank_unique'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0021_similarrace'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Rollup, e.g. races_by_country', max_length=50)),
+                ('key', models.CharField(help_text='Group within the rollup, e.g. UK', max_length=100)),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Statistic',
+                'verbose_name_plural': 'Statistics',
+                'ordering': ['name', 'key'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='statcounter',
+            constraint=models.UniqueConstraint(fields=('name', 'key'), name='races_statcounter_unique'),
+        ),
+    ]
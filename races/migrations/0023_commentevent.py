@@ -0,0 +1,29 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0022_statcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('comment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='live_event', to='races.comment')),
+                ('race', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_events', to='races.race')),
+            ],
+            options={
+                'verbose_name': 'Comment Event',
+                'verbose_name_plural': 'Comment Events',
+                'ordering': ['pk'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-19 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('races', '0024_outboxemail_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life from the worker running it', null=True),
+        ),
+    ]
@@ -3,9 +3,38 @@ from django.contrib.auth.models import User
 from cloudinary.models import CloudinaryField 
 from django.urls import reverse      # Utility for generating URLs by name
 from django.utils import timezone    # Utilities for time zone-aware datetimes
+from django.core.files.uploadedfile import UploadedFile
+from . import rollups                # Statistics counters for the admin dashboard
 
 
-class Race(models.Model):
+class RaceManager(models.Manager):
+    """
+    Default race manager - hides races that were deleted (soft delete)
+
+    Deleting a race only stamps `deleted_at`; the rows are removed later, in
+    batches, by races/purge.py. Race.all_objects still sees them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class RollupTracked:
+    """
+    Model mixin - remember the values the statistics rollups group by
+
+    Set when a row is loaded, so saving an edited row can move it from its
+    old counters to its new ones (races/rollups.py). No extra query.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rollup_values = rollups.loaded_values(cls, field_names, values)
+        return instance
+
+
+class Race(RollupTracked, models.Model):
     """
     Race model represents a running event that users can create and view
     """
@@ -28,7 +57,8 @@ class Race(models.Model):
     
     STATUS_CHOICES = [
         (0, "Draft"),
-        (1, "Published"),]
+        (1, "Published"),
+        (2, "Archived"),]  # Past race - set by the archive_past_races scheduled job
 
     # MODEL FIELDS start here
     name = models.CharField(
@@ -117,6 +147,22 @@ class Race(models.Model):
         help_text="User who created this race")
 
     created_at = models.DateTimeField(auto_now_add=True, help_text="When this race was first created")
+
+    # PAGE VIEWS - buffered in memory and added in batches (races/counters.py)
+    view_count = models.PositiveBigIntegerField(
+        default=0,
+        help_text="How many times the race page was viewed (updated every few seconds)")
+
+    # SOFT DELETE - set when the race is deleted; the purge removes it later
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="When this race was deleted (waiting for the background purge)")
+
+    # MANAGERS - the first one is the default used by views, forms and admin
+    objects = RaceManager()            # Race.objects: races that are not deleted
+    all_objects = models.Manager()     # Race.all_objects: including deleted ones
   #__________________________________________________________________________________________________________
     class Meta:
         """
@@ -146,24 +192,29 @@ class Race(models.Model):
     def is_published(self):
         """
         Check if race is published and visible to public
-        Returns True if status is 1 (Published), False if 0 (Draft)
+        Returns True if status is 1 (Published) or 2 (Archived - a published
+        race that is over), False if 0 (Draft)
         """
-        return self.status == 1
+        return self.status in (1, 2)
     
     @property
     def is_visible_to_public(self):
         """
         Check if race is visible to all users (published AND approved)
         Returns True only if both published and approved by admin
+        (and not deleted)
         """
-        return self.is_published and self.approved
+        return self.is_published and self.approved and self.deleted_at is None
     
     def is_visible_to_user(self, user):
         """
         Check if race is visible to a specific user
         - Public races: visible to everyone
         - Unapproved races: visible only to creator and admin
+        - Deleted races: visible to nobody
         """
+        if self.deleted_at is not None:
+            return False
         if self.is_visible_to_public:
             return True
         # Anonymous users can only see public races
@@ -194,9 +245,46 @@ class Race(models.Model):
         """
         time_diff = self.race_date - timezone.now().date()
         return time_diff.days
+
+    def soft_delete(self):
+        """
+        Hide the race immediately; its comments and row are purged later
+
+        One UPDATE, however many comments the race has. See races/purge.py.
+        """
+        rollups.record(rollups.removal(self))
+        self.deleted_at = timezone.now()
+        Race.all_objects.filter(pk=self.pk).update(deleted_at=self.deleted_at)
+
+    def save(self, *args, **kwargs):
+        """
+        Save the race, reusing an already stored image when possible
+
+        A freshly uploaded image is fingerprinted before Cloudinary sees it.
+        If the same (or a perceptually identical) photo was uploaded before,
+        the race points at the existing asset and the upload is skipped.
+        New images are recorded so later uploads can reuse them.
+        """
+        from .images import fingerprint_file
+
+        fingerprint = None
+        if isinstance(self.image, UploadedFile):
+            fingerprint = fingerprint_file(self.image)
+            if fingerprint is not None:
+                existing = StoredImage.objects.find_match(fingerprint)
+                if existing is not None:
+                    # Reuse the stored asset - CloudinaryField skips the upload
+                    self.image = existing.as_resource()
+                    fingerprint = None
+
+        super().save(*args, **kwargs)
+
+        # Remember the newly uploaded asset for future uploads
+        if fingerprint is not None and self.image:
+            StoredImage.objects.record(fingerprint, self.image)
 #__________________________________________________________________________________________________________
 
-class Comment(models.Model):
+class Comment(RollupTracked, models.Model):
     """
     COMMENT MODEL - User discussions on races
     
@@ -285,7 +373,7 @@ class Comment(models.Model):
         return self.body[:100] + "..." if len(self.body) > 100 else self.body
 
 
-class AccountDeletionRequest(models.Model):
+class AccountDeletionRequest(RollupTracked, models.Model):
     """
     ACCOUNT DELETION REQUEST MODEL - User account deletion with admin approval
     
@@ -296,7 +384,8 @@ class AccountDeletionRequest(models.Model):
     4. Final deletion is completed by admin action
     
     RELATIONSHIPS:
-    - Each request belongs to ONE user (OneToOneField to User)
+    - Each request belongs to ONE user (OneToOneField to User); the link is
+      cleared when the account is finally deleted, `username` keeps the record
     - Each request can be reviewed by ONE admin (ForeignKey to User)
     - Users can only have ONE active deletion request at a time
     
@@ -316,10 +405,19 @@ class AccountDeletionRequest(models.Model):
     # USER RELATIONSHIP - Which user wants their account deleted
     user = models.OneToOneField(
         User,                                       # Links to Django's User model
-        on_delete=models.CASCADE,                   # Delete request if user somehow deleted first
+        on_delete=models.SET_NULL,                  # Keep the record once the account is gone
+        null=True,                                  # Empty after the deletion is completed
+        blank=True,
         related_name='deletion_request',            # Allows: user.deletion_request
         help_text="User requesting account deletion"
     )
+
+    # Copy of the username, so completed requests still show who they were for
+    username = models.CharField(
+        max_length=150,
+        blank=True,
+        help_text="Username at the time of the request"
+    )
     
     # REQUEST DETAILS - User's explanation for wanting deletion
     reason = models.TextField(
@@ -370,6 +468,15 @@ class AccountDeletionRequest(models.Model):
         help_text="Admin who reviewed this request"
     )
     
+    # DELETION PROGRESS - filled in by races/account_deletion.py
+    processing_started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the deletion executor first started on this request"
+    )
+    deleted_comments = models.PositiveIntegerField(default=0)
+    deleted_races = models.PositiveIntegerField(default=0)
+
     # Internal admin notes about the deletion decision
     admin_notes = models.TextField(
         max_length=500,                             # Space for detailed admin feedback
@@ -393,7 +500,7 @@ class AccountDeletionRequest(models.Model):
         STRING REPRESENTATION - How deletion requests appear in admin lists
         Format: "Deletion request by username (Current Status)"
         """
-        return f"Deletion request by {self.user.username} ({self.get_status_display()})"
+        return f"Deletion request by {self.username or self.user} ({self.get_status_display()})"
     
     # PROPERTY METHODS - Convenient status checking
     
@@ -462,7 +569,8 @@ class AccountDeletionRequest(models.Model):
         COMPLETE the deletion process - mark that account has been deleted
         
         This method should be called AFTER the actual user account deletion
-        to keep a record that the deletion was completed.
+        to keep a record that the deletion was completed
+        (races/account_deletion.py does this once everything is gone).
         
         Updates:
             - Sets status to 'COMPLETED'
@@ -470,4 +578,495 @@ class AccountDeletionRequest(models.Model):
         """
         self.status = 'COMPLETED'
         self.completed_at = timezone.now()
-        self.save()
\ No newline at end of file
+        self.save()
+
+    def save(self, *args, **kwargs):
+        """Remember the username while the user still exists"""
+        if self.user_id and not self.username:
+            self.username = self.user.username
+        super().save(*args, **kwargs)
+
+
+class StoredImageManager(models.Manager):
+    """
+    Lookup helpers for the image fingerprint table
+    """
+
+    def find_match(self, fingerprint):
+        """
+        Return the StoredImage matching a fingerprint, or None
+
+        STEP 1: exact content hash (unique index)
+        STEP 2: near-duplicate perceptual hash via the indexed hash bands
+        """
+        from .images import hamming_distance, max_distance
+
+        exact = self.filter(content_hash=fingerprint.content_hash).first()
+        if exact is not None:
+            return exact
+
+        limit = max_distance()
+        if limit == 0:
+            return None
+
+        # Any hash within `limit` bits shares at least one band with ours
+        bands = fingerprint.bands
+        candidates = self.filter(
+            models.Q(phash_band_0=bands[0]) |
+            models.Q(phash_band_1=bands[1]) |
+            models.Q(phash_band_2=bands[2]) |
+            models.Q(phash_band_3=bands[3])
+        ).order_by('created_at')
+
+        for candidate in candidates:
+            if hamming_distance(candidate.phash_int, fingerprint.phash) <= limit:
+                return candidate
+        return None
+
+    def record(self, fingerprint, image):
+        """
+        Store the fingerprint of a newly uploaded image
+
+        `image` is whatever the CloudinaryField holds (resource or string).
+        Returns the StoredImage row (existing one if the hash is known).
+        """
+        public_id = image.get_prep_value() if hasattr(image, 'get_prep_value') else str(image)
+        bands = fingerprint.bands
+        stored, _ = self.get_or_create(
+            content_hash=fingerprint.content_hash,
+            defaults={
+                'phash': fingerprint.phash_hex,
+                'phash_band_0': bands[0],
+                'phash_band_1': bands[1],
+                'phash_band_2': bands[2],
+                'phash_band_3': bands[3],
+                'public_id': public_id,
+                'width': fingerprint.width,
+                'height': fingerprint.height,
+            },
+        )
+        return stored
+
+
+class StoredImage(models.Model):
+    """
+    STORED IMAGE MODEL - Fingerprints of images already uploaded to storage
+
+    One row per stored asset. Uploads whose content hash or perceptual hash
+    matches a row reuse `public_id` (and every transformation Cloudinary has
+    already generated for it) instead of uploading a new copy.
+    """
+
+    # SHA-256 of the original bytes - exact duplicate lookup
+    content_hash = models.CharField(
+        max_length=64,
+        unique=True,
+        help_text="SHA-256 of the uploaded file")
+
+    # 64-bit difference hash as 16 hex characters
+    phash = models.CharField(
+        max_length=16,
+        help_text="Perceptual (difference) hash of the image")
+
+    # The perceptual hash split in four indexed 16-bit bands
+    phash_band_0 = models.PositiveIntegerField(db_index=True)
+    phash_band_1 = models.PositiveIntegerField(db_index=True)
+    phash_band_2 = models.PositiveIntegerField(db_index=True)
+    phash_band_3 = models.PositiveIntegerField(db_index=True)
+
+    # Value stored in Race.image for this asset, e.g. "image/upload/v1/abc.jpg"
+    public_id = models.CharField(
+        max_length=255,
+        help_text="Stored asset reused by duplicate uploads")
+
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = StoredImageManager()
+
+    class Meta:
+        verbose_name = "Stored Image"
+        verbose_name_plural = "Stored Images"
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.public_id} ({self.phash})"
+
+    @property
+    def phash_int(self):
+        """Perceptual hash as an integer for distance calculations"""
+        return int(self.phash, 16)
+
+    def as_resource(self):
+        """Value suitable for assigning to Race.image"""
+        return Race._meta.get_field('image').to_python(self.public_id)
+
+
+class RequestProfile(models.Model):
+    """
+    REQUEST PROFILE MODEL - One profiled production request
+
+    Created by config.middleware.ProfilingMiddleware when a staff user sends
+    the X-Profile header. The profiler output is stored as a file in
+    PROFILE_ROOT (`artifact`); SQL and template timings are kept in `details`.
+    """
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    path = models.CharField(max_length=500)
+    route = models.CharField(max_length=200, db_index=True,
+                             help_text="URL name of the profiled view")
+    method = models.CharField(max_length=10)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField(help_text="Total request time")
+    query_count = models.PositiveIntegerField(default=0)
+    sql_ms = models.FloatField(default=0, help_text="Time spent in SQL")
+    template_ms = models.FloatField(default=0, help_text="Time spent rendering templates")
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='request_profiles',
+        help_text="Staff user who requested the profile")
+    artifact = models.CharField(max_length=100,
+                                help_text="Profile file name inside PROFILE_ROOT")
+    details = models.JSONField(default=dict, blank=True,
+                               help_text="SQL log and template timings")
+
+    class Meta:
+        verbose_name = "Request Profile"
+        verbose_name_plural = "Request Profiles"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+    @property
+    def artifact_path(self):
+        """Absolute path of the stored profile file"""
+        import os
+        from .profiling import profile_root
+        return os.path.join(profile_root(), self.artifact)
+
+    def delete(self, *args, **kwargs):
+        """Remove the profile file together with the row"""
+        import os
+        try:
+            os.remove(self.artifact_path)
+        except FileNotFoundError:
+            pass
+        return super().delete(*args, **kwargs)
+
+
+class SlowQuery(models.Model):
+    """
+    SLOW QUERY MODEL - Aggregated slow and repeated (N+1) query shapes
+
+    Filled by races/slow_queries.py. One row per query shape and source
+    location, with a running count and timing, so a recurring problem shows
+    up as a single entry.
+    """
+
+    KIND_CHOICES = [
+        ('slow', 'Slow query'),              # Over SLOW_QUERY_THRESHOLD_MS
+        ('repeated', 'Repeated in request'),  # Same shape many times (N+1)
+    ]
+
+    fingerprint = models.CharField(max_length=40, unique=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, db_index=True)
+    normalized_sql = models.TextField(help_text="Query with literals replaced by ?")
+    sample_sql = models.TextField(blank=True, help_text="One real example of the query")
+    view = models.CharField(max_length=200, blank=True,
+                            help_text="View that ran the query")
+    location = models.CharField(max_length=300, blank=True,
+                                help_text="Project source line that triggered it")
+    explain = models.TextField(blank=True, help_text="Captured query plan")
+    count = models.PositiveBigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Slow Query"
+        verbose_name_plural = "Slow Queries"
+        ordering = ['-total_ms']
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.normalized_sql[:80]}"
+
+    @property
+    def average_ms(self):
+        """Mean time per execution"""
+        return self.total_ms / self.count if self.count else 0
+
+
+class ModerationLog(models.Model):
+    """
+    MODERATION LOG MODEL - Audit trail of admin moderation actions
+
+    One row per object an admin approved, unapproved, or reviewed. Written
+    with a single bulk insert per action by races/moderation.py.
+    """
+
+    ACTION_CHOICES = [
+        ('approve_race', 'Approved race'),
+        ('unapprove_race', 'Unapproved race'),
+        ('approve_deletion', 'Approved deletion request'),
+        ('reject_deletion', 'Rejected deletion request'),
+    ]
+
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES, db_index=True)
+    object_type = models.CharField(max_length=50, help_text="Model of the moderated object")
+    object_id = models.PositiveBigIntegerField()
+    moderator = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='moderation_logs',
+        help_text="Admin who performed the action")
+    notes = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = "Moderation Log Entry"
+        verbose_name_plural = "Moderation Log"
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['object_type', 'object_id'])]
+
+    def __str__(self):
+        return f"{self.get_action_display()} #{self.object_id}"
+
+
+class Job(models.Model):
+    """
+    JOB MODEL - One unit of deferred work in the database job queue
+
+    Created by races.jobs.enqueue() and run by `manage.py run_workers`.
+    `task` names a function registered with @races.jobs.task; `kwargs` are
+    its (JSON) keyword arguments.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),      # Waiting for run_at and a free worker
+        (RUNNING, 'Running'),    # Claimed by a worker
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),      # Gave up after max_attempts
+    ]
+
+    task = models.CharField(max_length=100, db_index=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0, help_text="Lower runs first")
+    idempotency_key = models.CharField(
+        max_length=200, unique=True, null=True, blank=True,
+        help_text="Enqueueing the same key again returns the existing job")
+    run_at = models.DateTimeField(default=timezone.now, help_text="Not before this time")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True, help_text="Worker that ran it last")
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True, blank=True, help_text="Last sign of life from the worker running it")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Background Job"
+        verbose_name_plural = "Background Jobs"
+        ordering = ['-created_at']
+        indexes = [
+            # The worker's "next job" lookup
+            models.Index(fields=['status', 'priority', 'run_at'], name='races_job_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+
+class ScheduledTask(models.Model):
+    """
+    SCHEDULED TASK MODEL - Run history of one periodic maintenance job
+
+    One row per job declared with @races.scheduler.periodic. The scheduler
+    uses `next_run_at` so a job runs once per interval across every worker
+    and node, and `locked_by` / `locked_until` as the leader lease on
+    databases without advisory locks.
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    next_run_at = models.DateTimeField(default=timezone.now)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_duration_ms = models.FloatField(null=True, blank=True)
+    last_result = models.TextField(blank=True, help_text="Return value or error of the last run")
+    last_succeeded = models.BooleanField(null=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Scheduled Task"
+        verbose_name_plural = "Scheduled Tasks"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class OutboxEmail(models.Model):
+    """
+    OUTBOX EMAIL MODEL - A notification email waiting to be sent
+
+    Rows are written in the same transaction as the change they announce
+    (races/outbox.py), then sent in batches over one SMTP connection by the
+    send_outbox scheduled job or `manage.py send_outbox`.
+    """
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),  # Claimed by a sender (see claimed_at)
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),   # Gave up after EMAIL_OUTBOX_MAX_ATTEMPTS
+    ]
+
+    kind = models.CharField(max_length=30, db_index=True,
+                            help_text="Template name, e.g. race_approved")
+    to = models.EmailField()
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    send_after = models.DateTimeField(default=timezone.now,
+                                      help_text="Not before this time (retries back off)")
+    created_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True,
+                                      help_text="When a sender took it (status Sending)")
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Outbox Email"
+        verbose_name_plural = "Outbox Emails"
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'send_after'], name='races_outbox_due_idx')]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+
+class TrendingRace(models.Model):
+    """
+    TRENDING RACE MODEL - Precomputed "Trending" rank of one listed race
+
+    `score` is the natural log of the race's time-weighted activity (views,
+    comments, approaching race day) - see races/trending.py. Events add to
+    it with one UPDATE; it never has to be recomputed or decayed, so the
+    trending page is a single read down the score index.
+    """
+
+    race = models.OneToOneField(
+        Race,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending')
+    score = models.FloatField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Trending Race"
+        verbose_name_plural = "Trending Races"
+        ordering = ['-score']
+
+    def __str__(self):
+        return f"{self.race_id}: {self.score:.3f}"
+
+
+class SimilarRace(models.Model):
+    """
+    SIMILAR RACE MODEL - One "You might also like" entry of a race
+
+    Computed offline from the races' text and features
+    (races/similarity.py); the race page reads its panel with one lookup
+    on (race, rank).
+    """
+
+    race = models.ForeignKey(
+        Race,
+        on_delete=models.CASCADE,
+        related_name='recommendations')     # race.recommendations.all()
+    similar = models.ForeignKey(
+        Race,
+        on_delete=models.CASCADE,
+        related_name='recommended_for')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField(help_text="1 = most similar")
+
+    class Meta:
+        verbose_name = "Similar Race"
+        verbose_name_plural = "Similar Races"
+        ordering = ['race', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['race', 'rank'], name='races_similar_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.race_id} -> {self.similar_id} (#{self.rank})"
+
+
+class StatCounter(models.Model):
+    """
+    STAT COUNTER MODEL - One precomputed count for the admin dashboard
+
+    e.g. name='races_by_country', key='UK', value=412. Kept current as rows
+    change and rebuilt nightly from the base tables (races/rollups.py).
+    """
+
+    name = models.CharField(max_length=50, help_text="Rollup, e.g. races_by_country")
+    key = models.CharField(max_length=100, help_text="Group within the rollup, e.g. UK")
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Statistic"
+        verbose_name_plural = "Statistics"
+        ordering = ['name', 'key']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'key'], name='races_statcounter_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}[{self.key}] = {self.value}"
+
+
+class CommentEvent(models.Model):
+    """
+    COMMENT EVENT MODEL - "This comment just appeared" for the live stream
+
+    Added when a comment is saved approved (races/signals.py). The id is the
+    Server-Sent Events id, so a browser that reconnects resumes after the
+    last event it saw (races/live_comments.py). Pruned after
+    LIVE_COMMENTS_RETENTION_HOURS.
+    """
+
+    race = models.ForeignKey(Race, on_delete=models.CASCADE, related_name='comment_events')
+    comment = models.OneToOneField(Comment, on_delete=models.CASCADE, related_name='live_event')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = "Comment Event"
+        verbose_name_plural = "Comment Events"
+        ordering = ['pk']
+
+    def __str__(self):
+        return f"Comment {self.comment_id} on race {self.race_id}"
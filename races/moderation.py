@@ -0,0 +1,95 @@
+"""
+Set-based moderation actions
+
+The admin actions used to load every selected object and call save() (or
+approve() / reject()) on it: one UPDATE per row, so approving 10,000
+pending races took 10,000 round-trips. Each action here costs a constant
+number of queries however many rows are selected:
+
+1. one SELECT of the primary keys that actually change
+   (e.g. only races that are not approved yet)
+2. one UPDATE ... WHERE id IN (...) stamping who did it and when
+3. one bulk INSERT of ModerationLog rows (the audit trail)
+4. the notification emails, queued in the outbox (races/outbox.py)
+5. one signal for the whole batch (races/signals.py), whose receivers
+   update the trending and similar-race tables once per action
+
+Everything runs in one transaction, so the log always matches the update.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ModerationLog
+from .outbox import queue_moderation_emails
+from .signals import deletion_requests_reviewed, races_moderated
+
+
+def _log(action, model, ids, moderator, notes, now):
+    # No batch_size: one INSERT on PostgreSQL, SQLite splits at its
+    # bound-parameter limit
+    ModerationLog.objects.bulk_create(
+        [
+            ModerationLog(action=action, object_type=model._meta.model_name,
+                          object_id=pk, moderator=moderator, notes=notes, created_at=now)
+            for pk in ids
+        ]
+    )
+
+
+def _moderate(queryset, action, changes, moderator, notes, signal, now):
+    """
+    Apply `changes` to every row of `queryset`, log it and send `signal`
+
+    Returns the number of rows changed.
+    """
+    model = queryset.model
+    with transaction.atomic(using=queryset.db):
+        ids = list(queryset.select_for_update().values_list('pk', flat=True))
+        if not ids:
+            return 0
+        model._default_manager.using(queryset.db).filter(pk__in=ids).update(**changes)
+        _log(action, model, ids, moderator, notes, now)
+        queue_moderation_emails(action, ids, notes)
+        transaction.on_commit(
+            lambda: signal.send(sender=model, action=action, ids=ids, moderator=moderator),
+            using=queryset.db,
+        )
+    return len(ids)
+
+
+def approve_races(queryset, moderator, notes=""):
+    """Approve the not yet approved races in `queryset`"""
+    now = timezone.now()
+    return _moderate(
+        queryset.filter(approved=False), 'approve_race',
+        {'approved': True, 'approved_by': moderator, 'approved_at': now},
+        moderator, notes, races_moderated, now,
+    )
+
+
+def unapprove_races(queryset, moderator, notes=""):
+    """Take the approved races in `queryset` off the public site again"""
+    return _moderate(
+        queryset.filter(approved=True), 'unapprove_race',
+        {'approved': False, 'approved_by': None, 'approved_at': None},
+        moderator, notes, races_moderated, timezone.now(),
+    )
+
+
+def approve_deletion_requests(queryset, moderator, notes=""):
+    """Approve the pending deletion requests in `queryset`"""
+    return _review_deletion_requests(queryset, 'APPROVED', 'approve_deletion', moderator, notes)
+
+
+def reject_deletion_requests(queryset, moderator, notes=""):
+    """Reject the pending deletion requests in `queryset`"""
+    return _review_deletion_requests(queryset, 'REJECTED', 'reject_deletion', moderator, notes)
+
+
+def _review_deletion_requests(queryset, status, action, moderator, notes):
+    now = timezone.now()
+    return _moderate(
+        queryset.filter(status='PENDING'), action,
+        {'status': status, 'reviewed_by': moderator, 'reviewed_at': now, 'admin_notes': notes},
+        moderator, notes, deletion_requests_reviewed, now,
+    )
@@ -0,0 +1,189 @@
+"""
+Transactional email outbox
+
+Notifications are not sent while handling a request or an admin action.
+They are rendered and stored as OutboxEmail rows inside the same
+transaction as the change they announce - if the change rolls back, no
+email is queued; if it commits, the email will be sent:
+
+- deletion request approved / rejected   (races/moderation.py)
+- race approved                          (races/moderation.py)
+- new comment on a user's race           (race_detail view)
+
+send_pending() drains the outbox in batches over ONE reused backend
+connection (one SMTP login instead of one per message), at most
+EMAIL_OUTBOX_RATE messages per second. A failed message is retried later
+with exponential backoff and marked failed after EMAIL_OUTBOX_MAX_ATTEMPTS.
+Senders may overlap (the command next to the scheduler job, a long drain
+outliving its lease): each email is claimed with a conditional UPDATE
+(PENDING -> SENDING) right before it is sent, so only one sender sends
+it. Claims older than EMAIL_OUTBOX_CLAIM_TIMEOUT belong to a sender that
+died and are put back in the queue.
+It runs every minute from the scheduler (races/maintenance.py) or with
+`manage.py send_outbox`.
+
+Any Django email backend works: use the locmem backend in tests, or point
+EMAIL_HOST / EMAIL_PORT at a local SMTP stand-in (python -m aiosmtpd -n)
+to watch real SMTP traffic.
+"""
+import logging
+import time
+from datetime import timedelta
+from smtplib import SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import AccountDeletionRequest, OutboxEmail, Race
+
+logger = logging.getLogger('races.outbox')
+
+
+def render(kind, to, context):
+    """Unsaved OutboxEmail rendered from races/email/<kind>_{subject,message}.txt"""
+    context = dict(context, site_url=getattr(settings, 'SITE_URL', '').rstrip('/'))
+    subject = render_to_string(f'races/email/{kind}_subject.txt', context)
+    body = render_to_string(f'races/email/{kind}_message.txt', context)
+    return OutboxEmail(kind=kind, to=to, subject=' '.join(subject.split())[:200], body=body)
+
+
+def queue(emails):
+    """Store rendered emails (one INSERT); skips recipients without an address"""
+    return OutboxEmail.objects.bulk_create([email for email in emails if email.to])
+
+
+# ------------------------------------------------------------------------------
+# What gets queued
+# ------------------------------------------------------------------------------
+
+def queue_moderation_emails(action, ids, notes=''):
+    """Emails for a bulk moderation action (called inside its transaction)"""
+    if action == 'approve_race':
+        races = Race.objects.filter(pk__in=ids).select_related('created_by')
+        return queue(
+            render('race_approved', race.created_by.email, {
+                'username': race.created_by.username, 'race_name': race.name,
+                'race_id': race.pk,
+            })
+            for race in races
+        )
+    if action in ('approve_deletion', 'reject_deletion'):
+        kind = 'deletion_approved' if action == 'approve_deletion' else 'deletion_rejected'
+        requests = AccountDeletionRequest.objects.filter(pk__in=ids).select_related('user')
+        return queue(
+            render(kind, deletion_request.user.email, {
+                'username': deletion_request.username, 'notes': notes,
+            })
+            for deletion_request in requests if deletion_request.user is not None
+        )
+    return []
+
+
+def queue_comment_email(comment):
+    """Tell the race creator about a new comment (not about their own)"""
+    race = comment.race
+    creator = race.created_by
+    if creator.pk == comment.author_id:
+        return []
+    return queue([render('new_comment', creator.email, {
+        'username': creator.username, 'commenter': comment.author.username,
+        'race_name': race.name, 'race_id': race.pk, 'comment': comment.body,
+    })])
+
+
+# ------------------------------------------------------------------------------
+# Sending
+# ------------------------------------------------------------------------------
+
+def retry_delay(attempts):
+    """Seconds before retry number `attempts`: 1 min, 2, 4, ... up to 1 hour"""
+    return min(3600, 60 * 2 ** (attempts - 1))
+
+
+def requeue_stale_claims():
+    """Put emails claimed by a sender that stopped responding back in the queue"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_CLAIM_TIMEOUT', 600))
+    return OutboxEmail.objects.filter(status=OutboxEmail.SENDING, claimed_at__lt=cutoff).update(
+        status=OutboxEmail.PENDING, claimed_at=None)
+
+
+def claim(email):
+    """Take `email` for this sender; False if another sender already has it"""
+    return bool(OutboxEmail.objects.filter(
+            pk=email.pk, status=OutboxEmail.PENDING, send_after__lte=timezone.now()).update(
+        status=OutboxEmail.SENDING, claimed_at=timezone.now()))
+
+
+def send_pending(batch_size=None, rate=None, connection=None):
+    """
+    Send due outbox emails over one connection; returns (sent, failed)
+
+    `rate` is the maximum messages per second (0 = unlimited).
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 100)
+    rate = getattr(settings, 'EMAIL_OUTBOX_RATE', 10) if rate is None else rate
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    from_email = settings.DEFAULT_FROM_EMAIL
+
+    requeue_stale_claims()
+    due = list(OutboxEmail.objects.filter(status=OutboxEmail.PENDING, send_after__lte=timezone.now())
+               .order_by('send_after', 'pk')[:batch_size])
+    if not due:
+        return 0, 0
+
+    connection = connection or get_connection()
+    sent = failed = 0
+    interval = 1.0 / rate if rate else 0
+    connection.open()
+    try:
+        for email in due:
+            if not claim(email):
+                continue  # Sent (or being sent) by another sender
+            started = time.monotonic()
+            message = EmailMessage(email.subject, email.body, from_email, [email.to],
+                                   connection=connection)
+            try:
+                try:
+                    message.send()
+                except SMTPServerDisconnected:
+                    # The server dropped an idle connection - reconnect once
+                    connection.close()
+                    connection.open()
+                    message.send()
+            except Exception as error:  # noqa: BLE001 - recorded and retried
+                failed += 1
+                attempts = email.attempts + 1
+                gave_up = attempts >= max_attempts
+                OutboxEmail.objects.filter(pk=email.pk).update(
+                    attempts=attempts, last_error=f"{type(error).__name__}: {error}", claimed_at=None,
+                    status=OutboxEmail.FAILED if gave_up else OutboxEmail.PENDING,
+                    send_after=timezone.now() + timedelta(seconds=retry_delay(attempts)))
+                logger.warning("Email %s to %s failed (attempt %s): %s",
+                               email.pk, email.to, attempts, error)
+            else:
+                sent += 1
+                OutboxEmail.objects.filter(pk=email.pk).update(
+                    status=OutboxEmail.SENT, sent_at=timezone.now(), attempts=email.attempts + 1)
+            # Rate limit: spread the messages out
+            remaining = interval - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+    finally:
+        connection.close()
+    logger.info("Outbox: %s sent, %s failed", sent, failed)
+    return sent, failed
+
+
+def drain(batch_size=None, rate=None):
+    """Send batches until nothing is due; returns (sent, failed)"""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = send_pending(batch_size, rate)
+        total_sent += sent
+        total_failed += failed
+        if not sent and not failed:
+            return total_sent, total_failed
+        if failed and not sent:
+            return total_sent, total_failed  # Server is down - try again next run
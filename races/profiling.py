@@ -0,0 +1,286 @@
+"""
+On-demand profiling of single production requests
+
+A staff user sends a request with an "X-Profile" header and the request is
+run under a profiler. The result is stored as a RequestProfile row (route,
+duration, SQL log, template timings) plus a downloadable profile file:
+
+    X-Profile: 1        cProfile -> .prof file (open with snakeviz / pstats)
+    X-Profile: sample   stack sampler -> .folded file (flamegraph.pl, speedscope)
+
+Profile files live in PROFILE_ROOT; only the newest PROFILE_MAX_COUNT
+profiles younger than PROFILE_MAX_AGE_DAYS are kept.
+
+Under ASGI an async view is profiled on the event-loop thread
+(profile_request_async). That covers the view's own code and template
+rendering, but also any other request's coroutines that run on the loop
+meanwhile; ORM calls awaited through sync_to_async run in a worker thread
+and appear only as time spent waiting. The SQL log and the template
+timings still cover the whole request.
+
+Since Python 3.12 cProfile hooks into the interpreter-wide sys.monitoring:
+only one profiler can run at a time, and it records every thread, not just
+the request's. So one request at a time gets cProfile; a profiled request
+overlapping it falls back to the stack sampler, and the X-Profile-Mode
+response header says which one was used.
+"""
+import cProfile
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils import timezone
+
+# Keep stored SQL logs bounded even for pathological N+1 pages
+MAX_LOGGED_QUERIES = 500
+
+
+def profile_root():
+    return str(getattr(settings, 'PROFILE_ROOT',
+                       os.path.join(settings.BASE_DIR, '.profiles')))
+
+
+class StackSampler:
+    """
+    Sample one thread's Python stack at a fixed interval
+
+    Produces "folded" stacks (frame;frame;frame count) which flame graph
+    tools turn into an interactive flame chart.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class SQLRecorder:
+    """Keeps the SQL text and time of every query of the profiled request"""
+
+    def __init__(self):
+        self.queries = []
+        self.total = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.total += 1
+            self.seconds += duration
+            if len(self.queries) < MAX_LOGGED_QUERIES:
+                self.queries.append({
+                    'sql': sql,
+                    'ms': round(duration * 1000, 3),
+                    'db': context['connection'].alias,
+                })
+
+
+# Recorder of the request being profiled; its context follows the request
+# into sync_to_async threads, where a per-connection hook would miss it
+current_recorder = ContextVar('current_sql_recorder', default=None)
+
+
+def record_sql(execute, sql, params, many, context):
+    """execute_wrapper() hook handing each query to the current recorder"""
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    """Add record_sql to a connection for good (connection_created receiver)"""
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_sql)
+
+
+# Held by the request currently profiled with cProfile (see the module docstring)
+cprofile_lock = threading.Lock()
+
+
+def start(request):
+    """
+    Recorder, stats and profiling mode for a profiled request
+
+    Template timings are added to the request's metrics stats (set by
+    MetricsMiddleware) rather than to a stats object of our own, so the
+    request metrics still count this request's SQL and template time.
+    """
+    from config import metrics
+
+    mode = 'sample' if request.META.get('HTTP_X_PROFILE', '').lower() == 'sample' else 'cprofile'
+    if mode == 'cprofile' and not cprofile_lock.acquire(blocking=False):
+        mode = 'sample (cProfile busy)'
+    recorder = SQLRecorder()
+    stats = metrics.current_stats.get()
+    stats_token = None
+    if stats is None:  # No MetricsMiddleware in front of us
+        stats = metrics.RequestStats()
+        stats_token = metrics.current_stats.set(stats)
+    stats.template_log = []
+    metrics.install_template_timer()
+    tokens = (current_recorder.set(recorder), stats_token)
+    return mode, recorder, stats, tokens
+
+
+def finish(mode, tokens):
+    from config import metrics
+
+    recorder_token, stats_token = tokens
+    current_recorder.reset(recorder_token)
+    if stats_token is not None:
+        metrics.current_stats.reset(stats_token)
+    if mode == 'cprofile':
+        cprofile_lock.release()
+
+
+def profile_request(request, get_response):
+    """
+    Run `get_response(request)` under the profiler and store the result
+
+    Returns the response with an X-Profile-Id header pointing at the stored
+    RequestProfile.
+    """
+    mode, recorder, stats, tokens = start(request)
+    profiler = None
+    sampler = None
+    begin = time.perf_counter()
+    try:
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = get_response(request)
+            finally:
+                profiler.disable()
+        else:
+            interval = getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.001)
+            with StackSampler(threading.get_ident(), interval) as sampler:
+                response = get_response(request)
+    finally:
+        finish(mode, tokens)
+    duration = time.perf_counter() - begin
+
+    profile = save_profile(request, response, duration, recorder, stats, profiler, sampler)
+    response['X-Profile-Id'] = str(profile.pk)
+    response['X-Profile-Mode'] = mode
+    return response
+
+
+async def profile_request_async(request, get_response):
+    """
+    profile_request() for the async stack: profiles the event-loop thread
+
+    See the module docstring for what that does and does not cover.
+    """
+    from asgiref.sync import sync_to_async
+
+    mode, recorder, stats, tokens = start(request)
+    profiler = None
+    sampler = None
+    begin = time.perf_counter()
+    try:
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = await get_response(request)
+            finally:
+                profiler.disable()
+        else:
+            interval = getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.001)
+            with StackSampler(threading.get_ident(), interval) as sampler:
+                response = await get_response(request)
+    finally:
+        finish(mode, tokens)
+    duration = time.perf_counter() - begin
+
+    profile = await sync_to_async(save_profile)(
+        request, response, duration, recorder, stats, profiler, sampler)
+    response['X-Profile-Id'] = str(profile.pk)
+    response['X-Profile-Mode'] = mode
+    return response
+
+
+def save_profile(request, response, duration, recorder, stats, profiler, sampler):
+    """Write the profile file, create the RequestProfile row, apply retention"""
+    from .models import RequestProfile
+
+    root = profile_root()
+    os.makedirs(root, exist_ok=True)
+    if profiler is not None:
+        filename = f"{uuid.uuid4().hex}.prof"
+        profiler.dump_stats(os.path.join(root, filename))
+    else:
+        filename = f"{uuid.uuid4().hex}.folded"
+        with open(os.path.join(root, filename), 'w') as handle:
+            handle.write(sampler.folded())
+
+    match = getattr(request, 'resolver_match', None)
+    user = request.user if request.user.is_authenticated else None
+    profile = RequestProfile.objects.create(
+        path=request.get_full_path()[:500],
+        route=(match.view_name if match else '') or 'unmatched',
+        method=request.method,
+        status_code=response.status_code,
+        duration_ms=round(duration * 1000, 2),
+        query_count=recorder.total,
+        sql_ms=round(recorder.seconds * 1000, 2),
+        template_ms=round(stats.template_seconds * 1000, 2),
+        user=user,
+        artifact=filename,
+        details={
+            'queries': recorder.queries,
+            'templates': stats.template_log,
+        },
+    )
+    apply_retention()
+    return profile
+
+
+def apply_retention():
+    """Delete profiles beyond PROFILE_MAX_COUNT or older than PROFILE_MAX_AGE_DAYS"""
+    from datetime import timedelta
+    from .models import RequestProfile
+
+    max_count = getattr(settings, 'PROFILE_MAX_COUNT', 50)
+    max_age = getattr(settings, 'PROFILE_MAX_AGE_DAYS', 7)
+    cutoff = timezone.now() - timedelta(days=max_age)
+
+    keep = RequestProfile.objects.order_by('-created_at').values_list('pk', flat=True)[:max_count]
+    expired = RequestProfile.objects.exclude(pk__in=list(keep)) | \
+        RequestProfile.objects.filter(created_at__lt=cutoff)
+    for profile in expired:
+        profile.delete()
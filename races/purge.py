@@ -0,0 +1,42 @@
+"""
+Background purge of deleted races
+
+Deleting a race through the site is a soft delete (Race.soft_delete()): a
+single UPDATE that sets `deleted_at`, so the request returns at once even
+for a race with tens of thousands of comments, and the default manager
+(Race.objects) hides it everywhere immediately.
+
+This module removes the hidden rows afterwards: the race's comments in
+small batches (each its own short transaction), then the race itself. It
+runs from the purge_deleted_races command and, like the account deletion
+executor, simply resumes with whatever is left if it was interrupted.
+"""
+import logging
+
+from . import rollups
+from .account_deletion import delete_in_batches
+from .models import Comment, Race
+
+logger = logging.getLogger('races.purge')
+
+
+def deleted_races():
+    """Soft-deleted races waiting to be purged, oldest deletion first"""
+    return Race.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at', 'pk')
+
+
+def purge_race(race, batch_size=500, pause=0.0):
+    """Delete the comments of a soft-deleted race in batches, then the race"""
+    queryset = Comment.objects.filter(race_id=race.pk)
+    counted = rollups.tally(queryset)  # Comments per month, for the dashboard
+    comments = delete_in_batches(queryset, batch_size, pause)
+    rollups.record({key: -rows for key, rows in counted.items()})
+    Race.all_objects.filter(pk=race.pk, deleted_at__isnull=False).delete()
+    logger.info("Purged race %s with %s comment(s)", race.pk, comments)
+    return comments
+
+
+def purge_deleted(batch_size=500, pause=0.0, limit=None):
+    """Purge every soft-deleted race; returns [(race_id, comments_deleted)]"""
+    return [(race.pk, purge_race(race, batch_size, pause))
+            for race in deleted_races()[:limit]]
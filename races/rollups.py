@@ -0,0 +1,240 @@
+"""
+Statistics rollups for the admin dashboard
+
+The dashboard shows counts such as races per country or comments per
+month. Running those GROUP BYs over the base tables on every page load
+gets slow as the tables grow, so the counts are kept in a small StatCounter
+table instead - one row per (rollup, key), e.g. ('races_by_country', 'UK')
+- and the dashboard reads only that table.
+
+Kept current incrementally:
+- single saves and deletes go through post_save / post_delete receivers
+  (races/signals.py). Each model remembers the values it was loaded with
+  (from_db), so an edit moves a race from its old keys to its new ones.
+- bulk changes report their own deltas: moderation (races_moderated and
+  deletion_requests_reviewed receivers), Race.soft_delete() and the batched
+  comment deletes of the purge and the account deletion executor. Comments
+  have no delete receiver on purpose: it would turn those fast
+  DELETE ... WHERE id IN (...) batches into one signal per row.
+
+Deltas are applied when the surrounding transaction commits (one UPDATE
+per touched key), so a rolled-back change never counts. Anything missed -
+a crash between commit and the update, a change made in the shell - is
+corrected by rebuild(), which recomputes every rollup from scratch in
+chunks (the rebuild_rollups command, a nightly scheduler job and the
+dashboard's "Rebuild" action, which queues a background job).
+
+A rebuild counts and writes in one transaction with the counter table
+locked, so deltas that arrive meanwhile wait and are added on top of the
+fresh counts instead of being overwritten by them.
+"""
+from collections import Counter
+from dataclasses import dataclass
+
+from django.db import connections, router, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+@dataclass(frozen=True)
+class Dimension:
+    """One rollup: counts of `model` rows grouped by `field`"""
+
+    name: str
+    model: str
+    field: str
+    by_month: bool = False  # Group a date / datetime field by calendar month
+
+    def label(self, value):
+        """Key stored for a grouped value (e.g. '2025-07' for a month)"""
+        if self.by_month:
+            if hasattr(value, 'hour'):
+                value = timezone.localtime(value) if timezone.is_aware(value) else value
+            return value.strftime('%Y-%m')
+        if isinstance(value, bool):
+            return 'approved' if value else 'pending'
+        return str(value)
+
+
+DIMENSIONS = [
+    Dimension('races_by_country', 'race', 'country'),
+    Dimension('races_by_distance', 'race', 'distance'),
+    Dimension('races_by_difficulty', 'race', 'difficulty'),
+    Dimension('races_by_month', 'race', 'race_date', by_month=True),
+    Dimension('race_approval', 'race', 'approved'),
+    Dimension('comments_by_month', 'comment', 'created_on', by_month=True),
+    Dimension('deletion_requests', 'accountdeletionrequest', 'status'),
+]
+
+
+def dimensions_for(model):
+    return [dimension for dimension in DIMENSIONS if dimension.model == model._meta.model_name]
+
+
+def tracked_fields(model):
+    """Fields whose loaded values each instance remembers (see from_db)"""
+    fields = {dimension.field for dimension in dimensions_for(model)}
+    if model._meta.model_name == 'race':
+        fields.add('deleted_at')
+    return fields
+
+
+def counted(model):
+    """Base queryset of the rows the rollups count (deleted races are not)"""
+    if model._meta.model_name == 'race':
+        return model._base_manager.filter(deleted_at__isnull=True)
+    return model._base_manager.all()
+
+
+def keys_of(model, values):
+    """{(rollup, key)} a row with `values` ({field: value}) counts towards"""
+    if values is None:
+        return None
+    if model._meta.model_name == 'race' and values.get('deleted_at') is not None:
+        return set()
+    return {(dimension.name, dimension.label(values[dimension.field]))
+            for dimension in dimensions_for(model)}
+
+
+def current_values(instance):
+    return {field: getattr(instance, field) for field in tracked_fields(type(instance))}
+
+
+def loaded_values(model, field_names, values):
+    """What from_db stores: the tracked values, or None if some were deferred"""
+    loaded = dict(zip(field_names, values))
+    fields = tracked_fields(model)
+    if not fields.issubset(loaded):
+        return None
+    return {field: loaded[field] for field in fields}
+
+
+def changes(instance, created):
+    """Counter of deltas for a saved instance ({} if unknown or unchanged)"""
+    model = type(instance)
+    new = keys_of(model, current_values(instance))
+    old = set() if created else keys_of(model, getattr(instance, '_rollup_values', None))
+    if old is None:
+        return Counter()  # Loaded with deferred fields - the nightly rebuild corrects it
+    delta = Counter({key: 1 for key in new - old})
+    delta.subtract({key: 1 for key in old - new})
+    instance._rollup_values = current_values(instance)
+    return delta
+
+
+def removal(instance):
+    """Counter of deltas for a row that stops being counted"""
+    values = getattr(instance, '_rollup_values', None) or current_values(instance)
+    return Counter({key: -1 for key in keys_of(type(instance), values)})
+
+
+def tally(queryset):
+    """Counter {(rollup, key): rows} of `queryset` - one GROUP BY per rollup"""
+    totals = Counter()
+    for dimension in dimensions_for(queryset.model):
+        group = TruncMonth(dimension.field) if dimension.by_month else F(dimension.field)
+        rows = (queryset.order_by().annotate(group=group).values('group')
+                .annotate(rows=Count('pk')).values_list('group', 'rows'))
+        for value, rows_in_group in rows:
+            if value is not None:
+                totals[(dimension.name, dimension.label(value))] += rows_in_group
+    return totals
+
+
+def apply(deltas):
+    """Add `deltas` ({(rollup, key): n}) to the counters now"""
+    from .models import StatCounter
+
+    deltas = sorted((key, amount) for key, amount in deltas.items() if amount)
+    if not deltas:
+        return
+    with transaction.atomic():
+        StatCounter.objects.bulk_create(
+            [StatCounter(name=name, key=key, value=0) for (name, key), _ in deltas],
+            ignore_conflicts=True,
+        )
+        for (name, key), amount in deltas:
+            StatCounter.objects.filter(name=name, key=key).update(
+                value=F('value') + amount, updated_at=timezone.now())
+
+
+def record(deltas):
+    """Add `deltas` once the current transaction commits"""
+    deltas = Counter({key: amount for key, amount in deltas.items() if amount})
+    if deltas:
+        transaction.on_commit(lambda: apply(deltas))
+
+
+def lock_counters():
+    """
+    Hold back counter updates until the current transaction ends
+
+    Must be the first statement of the transaction. On PostgreSQL the table
+    is locked against writes (the dashboard can still read it) and the
+    transaction switched to REPEATABLE READ, so every chunk of the rebuild
+    counts the same snapshot: rows committed after it are not counted, and
+    their deltas - waiting for the lock - are applied after the rebuild.
+    SQLite allows a single writer anyway.
+    """
+    from .models import StatCounter
+
+    connection = connections[router.db_for_write(StatCounter)]
+    if connection.vendor != 'postgresql':
+        return
+    table = connection.ops.quote_name(StatCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        if len(connection.atomic_blocks) == 1:  # Not inside a caller's transaction
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        cursor.execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE')
+
+
+def rebuild(chunk_size=10000):
+    """
+    Recompute every rollup from the base tables, `chunk_size` rows at a time
+
+    Each chunk is a primary-key range, so no single query scans a whole
+    table. Counting and replacing the counter table happen in one
+    transaction under lock_counters(), so counter updates wait for the
+    rebuild (run it from a job or the command, not in a web request).
+    Returns the number of counters written.
+    """
+    from .models import AccountDeletionRequest, Comment, Race, StatCounter
+
+    with transaction.atomic(using=router.db_for_write(StatCounter)):
+        lock_counters()
+        totals = Counter()
+        for model in (Race, Comment, AccountDeletionRequest):
+            queryset = counted(model)
+            last_pk = 0
+            while True:
+                # Primary key of the chunk's last row (None: the rest fits in one chunk)
+                upper = next(iter(queryset.filter(pk__gt=last_pk).order_by('pk')
+                                  .values_list('pk', flat=True)[chunk_size - 1:chunk_size]), None)
+                chunk = queryset.filter(pk__gt=last_pk)
+                if upper is not None:
+                    chunk = chunk.filter(pk__lte=upper)
+                totals.update(tally(chunk))
+                if upper is None:
+                    break
+                last_pk = upper
+
+        now = timezone.now()
+        StatCounter.objects.all().delete()
+        StatCounter.objects.bulk_create([
+            StatCounter(name=name, key=key, value=value, updated_at=now)
+            for (name, key), value in sorted(totals.items()) if value
+        ])
+    return len(totals)
+
+
+def dashboard():
+    """{rollup: [(key, value), ...]} read from the counters only (one query)"""
+    from .models import StatCounter
+
+    rollups = {dimension.name: [] for dimension in DIMENSIONS}
+    for name, key, value in StatCounter.objects.order_by('name', 'key').values_list(
+            'name', 'key', 'value'):
+        if value:
+            rollups.setdefault(name, []).append((key, value))
+    return rollups
@@ -0,0 +1,177 @@
+"""
+In-process periodic scheduler with database leader election
+
+Maintenance jobs are declared with a decorator (see races/maintenance.py):
+
+    @periodic('clear_expired_sessions', every=timedelta(hours=1))
+    def clear_expired_sessions():
+        ...
+
+Every process that runs the scheduler (each gunicorn worker when
+SCHEDULER_ENABLED is on, or `manage.py run_scheduler`) checks every
+SCHEDULER_TICK seconds which jobs are due. Before running a job it must
+become that job's leader:
+
+- PostgreSQL: pg_try_advisory_lock() on a key derived from the job name.
+  The lock belongs to the database session, so a crashed process releases
+  it automatically.
+- other databases: a lease on the job's ScheduledTask row, taken with a
+  conditional UPDATE (locked_until in the past) and expiring after
+  SCHEDULER_LEASE seconds in case the holder dies.
+
+The leader then re-reads `next_run_at`: if another process already ran
+the job this interval it does nothing. So each job runs once per interval
+across all workers and nodes. Jobs are expected to work in small batches
+(short transactions) so no single run holds long locks.
+"""
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections, router
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ScheduledTask
+
+logger = logging.getLogger('races.scheduler')
+
+# job name -> PeriodicJob
+registry = {}
+
+
+@dataclass
+class PeriodicJob:
+    name: str
+    function: object
+    every: timedelta
+
+
+def periodic(name, every):
+    """Decorator declaring `function()` to run every `every` (a timedelta)"""
+    def decorator(function):
+        registry[name] = PeriodicJob(name, function, every)
+        return function
+    return decorator
+
+
+def identity():
+    """Name of this process in the lease columns"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def advisory_key(name):
+    """Stable signed 64-bit lock key for a job name"""
+    return int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], 'big', signed=True)
+
+
+@contextmanager
+def leadership(name):
+    """Yield True if this process may run job `name` now, else False"""
+    db_connection = connections[router.db_for_write(ScheduledTask)]
+    if db_connection.vendor == 'postgresql':
+        with db_connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [advisory_key(name)])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with db_connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", [advisory_key(name)])
+        return
+
+    me = identity()
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'SCHEDULER_LEASE', 600))
+    acquired = bool(
+        ScheduledTask.objects.filter(name=name)
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+        .update(locked_by=me, locked_until=now + lease)
+    )
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            ScheduledTask.objects.filter(name=name, locked_by=me).update(
+                locked_by='', locked_until=None)
+
+
+def run_job(job, force=False):
+    """
+    Run `job` if it is due and we win the election; returns True if it ran
+    """
+    ScheduledTask.objects.get_or_create(name=job.name)
+    with leadership(job.name) as leader:
+        if not leader:
+            return False
+        state = ScheduledTask.objects.get(name=job.name)
+        now = timezone.now()
+        if not force and state.next_run_at > now:
+            return False  # Someone else ran it this interval
+
+        state.last_started_at = now
+        state.next_run_at = now + job.every
+        state.save(update_fields=['last_started_at', 'next_run_at'])
+        start = time.perf_counter()
+        try:
+            result = job.function()
+            state.last_succeeded = True
+            state.last_result = '' if result is None else str(result)
+        except Exception as error:  # noqa: BLE001 - recorded, retried next interval
+            logger.exception("Scheduled job %s failed", job.name)
+            state.last_succeeded = False
+            state.last_result = f"{type(error).__name__}: {error}"
+        state.last_finished_at = timezone.now()
+        state.last_duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        state.save(update_fields=['last_succeeded', 'last_result', 'last_finished_at',
+                                  'last_duration_ms'])
+        logger.info("Scheduled job %s finished in %s ms: %s",
+                    job.name, state.last_duration_ms, state.last_result)
+        return True
+
+
+def tick(names=None, force=False):
+    """Run every due job (or only `names`); returns the names that ran"""
+    ran = []
+    for job in list(registry.values()):
+        if names and job.name not in names:
+            continue
+        if run_job(job, force=force):
+            ran.append(job.name)
+    return ran
+
+
+def run_forever(stop_event, interval=None):
+    """Call tick() every `interval` seconds until `stop_event` is set"""
+    interval = interval or getattr(settings, 'SCHEDULER_TICK', 60)
+    while not stop_event.is_set():
+        try:
+            tick()
+        except Exception:  # noqa: BLE001 - e.g. database briefly unavailable
+            logger.exception("Scheduler tick failed")
+        finally:
+            # Don't keep an idle connection open between ticks
+            connection.close()
+        stop_event.wait(interval)
+
+
+_thread = None
+
+
+def start_in_background():
+    """Start the scheduler in a daemon thread of this process (once)"""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return _thread
+    _thread = threading.Thread(target=run_forever, args=(threading.Event(),),
+                               name='scheduler', daemon=True)
+    _thread.start()
+    return _thread
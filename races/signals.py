@@ -0,0 +1,96 @@
+"""
+Custom signals for moderation actions
+
+Bulk moderation (races/moderation.py) updates rows with a single UPDATE,
+which skips Model.save() and therefore pre_save/post_save. Instead, each
+action sends ONE of these signals for the whole batch:
+
+- races_moderated(sender=Race, action, ids, moderator)
+- deletion_requests_reviewed(sender=AccountDeletionRequest, action, ids, moderator)
+
+The receivers below handle a whole batch at once instead of row by row:
+approved races enter the trending ranking (unapproved ones leave it) and
+get their "similar races" computed, and approved deletion requests are
+handed to the background job queue.
+Moderation and single-row saves / deletes also update the admin
+dashboard's statistics counters (races/rollups.py), and approved comments
+are published to the race page's live stream (races/live_comments.py).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import live_comments, rollups
+from .models import AccountDeletionRequest, Comment, Race
+
+races_moderated = Signal()
+deletion_requests_reviewed = Signal()
+
+
+@receiver(races_moderated)
+def update_trending(sender, action, ids, **kwargs):
+    from . import trending
+    if action == 'approve_race':
+        trending.list_races(ids)
+    elif action == 'unapprove_race':
+        trending.unlist_races(ids)
+
+
+@receiver(races_moderated)
+def update_similar_races(sender, action, ids, **kwargs):
+    if action != 'approve_race':
+        return
+    from .jobs import enqueue
+    # One job for the whole batch: it loads the corpus once
+    enqueue('races.update_similar_races', race_ids=list(ids))
+
+
+@receiver(deletion_requests_reviewed)
+def queue_account_deletions(sender, action, ids, **kwargs):
+    if action != 'approve_deletion':
+        return
+    from .jobs import enqueue
+    for request_id in ids:
+        enqueue('races.execute_account_deletion', key=f'account-deletion-{request_id}',
+                request_id=request_id)
+
+
+@receiver(races_moderated)
+def count_moderated_races(sender, action, ids, **kwargs):
+    if action in ('approve_race', 'unapprove_race'):
+        moved = 1 if action == 'approve_race' else -1
+        # Already committed (signals are sent on commit) - apply right away
+        rollups.apply(Counter({('race_approval', 'approved'): moved * len(ids),
+                               ('race_approval', 'pending'): -moved * len(ids)}))
+
+
+@receiver(deletion_requests_reviewed)
+def count_reviewed_deletion_requests(sender, action, ids, **kwargs):
+    status = 'APPROVED' if action == 'approve_deletion' else 'REJECTED'
+    rollups.apply(Counter({('deletion_requests', 'PENDING'): -len(ids),
+                           ('deletion_requests', status): len(ids)}))
+
+
+@receiver(post_save, sender=Race)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=AccountDeletionRequest)
+def count_saved_row(sender, instance, created, raw=False, **kwargs):
+    if not raw:  # Not while loading fixtures
+        rollups.record(rollups.changes(instance, created))
+
+
+# No receiver for Comment: it would make batched comment deletes send one
+# signal per row. Code deleting comments records the change itself.
+@receiver(post_delete, sender=Race)
+@receiver(post_delete, sender=AccountDeletionRequest)
+def count_deleted_row(sender, instance, **kwargs):
+    rollups.record(rollups.removal(instance))
+
+
+@receiver(post_save, sender=Comment)
+def publish_approved_comment(sender, instance, created, raw=False, **kwargs):
+    # Posted approved or approved later; publishing twice is a no-op
+    if not raw and instance.approved:
+        transaction.on_commit(lambda: live_comments.publish(instance))
@@ -0,0 +1,228 @@
+"""
+"You might also like" - precomputed similar races
+
+Every race's SIMILAR_RACES_TOP_K most similar races are stored in the
+SimilarRace table, so the race page reads its panel with one indexed
+lookup. Similarity combines:
+
+- text: TF-IDF vectors of the name and description (sublinear term
+  frequency, smoothed IDF, L2-normalised) compared by cosine similarity
+- features: same distance, same difficulty, same city (or just country)
+
+    score = SIMILAR_TEXT_WEIGHT * cosine + feature bonuses
+
+The vectors are sparse dicts ({term: weight}) and neighbours are found
+through an inverted index (term -> races using it), so only races sharing
+at least one term - or the same city - are ever compared. Races are
+processed in batches of `batch_size`, each batch's rows replaced in one
+transaction.
+
+Kept up to date by:
+- a background job after a race is created, edited or approved
+  (update_races): the race gets new neighbours, and the lists of races it
+  now belongs in, or was already in, are recomputed too
+- the nightly rebuild_similar_races job / command (rebuild), which also
+  refreshes the IDF statistics
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or our the this
+to was were will with you your we all can but not so if into out up race run
+""".split())
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def tokenize(text):
+    return [word for word in WORD_RE.findall(text.lower())
+            if len(word) > 1 and word not in STOP_WORDS]
+
+
+class Corpus:
+    """
+    TF-IDF vectors and features of a set of races, with an inverted index
+
+    `rows` are (pk, name, description, distance, difficulty, city, country).
+    Terms used by more than `max_df` of the races carry no signal and are
+    left out of the index (they would make everything a candidate).
+    """
+
+    def __init__(self, rows, max_df=0.5):
+        self.features = {}
+        counts = {}
+        document_frequency = Counter()
+        for pk, name, description, distance, difficulty, city, country in rows:
+            # The name counts twice: it is short and says most about the race
+            terms = Counter(tokenize(name) * 2 + tokenize(description))
+            counts[pk] = terms
+            document_frequency.update(terms.keys())
+            self.features[pk] = (distance, difficulty, city.strip().lower(), country)
+
+        total = len(counts)
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1
+                    for term, df in document_frequency.items()}
+        too_common = {term for term, df in document_frequency.items()
+                      if total > 10 and df > max_df * total}
+
+        self.vectors = {}
+        self.postings = defaultdict(list)
+        for pk, terms in counts.items():
+            vector = {term: (1 + math.log(count)) * self.idf[term]
+                      for term, count in terms.items() if term not in too_common}
+            norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+            vector = {term: weight / norm for term, weight in vector.items()}
+            self.vectors[pk] = vector
+            for term, weight in vector.items():
+                self.postings[term].append((pk, weight))
+
+        self.by_city = defaultdict(list)
+        for pk, (_, _, city, _) in self.features.items():
+            if city:
+                self.by_city[city].append(pk)
+
+    def similarities(self, pk, candidates=None):
+        """{other_pk: score} for every race sharing a term or the city with `pk`"""
+        text = defaultdict(float)
+        for term, weight in self.vectors.get(pk, {}).items():
+            for other, other_weight in self.postings[term]:
+                text[other] += weight * other_weight
+        distance, difficulty, city, country = self.features[pk]
+        for other in self.by_city.get(city, ()):
+            text.setdefault(other, 0.0)
+        text.pop(pk, None)
+
+        text_weight = setting('SIMILAR_TEXT_WEIGHT', 1.0)
+        scores = {}
+        for other, cosine in text.items():
+            if candidates is not None and other not in candidates:
+                continue
+            other_distance, other_difficulty, other_city, other_country = self.features[other]
+            score = text_weight * cosine
+            if distance == other_distance:
+                score += setting('SIMILAR_DISTANCE_WEIGHT', 0.2)
+            if difficulty == other_difficulty:
+                score += setting('SIMILAR_DIFFICULTY_WEIGHT', 0.1)
+            if city and city == other_city:
+                score += setting('SIMILAR_LOCATION_WEIGHT', 0.3)
+            elif country == other_country:
+                score += setting('SIMILAR_LOCATION_WEIGHT', 0.3) / 4
+            scores[other] = score
+        return scores
+
+    def top(self, pk, k, candidates=None):
+        """The `k` best (score, other_pk) for `pk`, best first"""
+        scores = self.similarities(pk, candidates)
+        return heapq.nlargest(k, ((score, other) for other, score in scores.items()))
+
+
+FIELDS = ('pk', 'name', 'description', 'distance', 'difficulty', 'city', 'country')
+
+
+def listed_races():
+    """Races that can be recommended: published, approved, not deleted"""
+    from .models import Race
+
+    return Race.objects.filter(status=1, approved=True)
+
+
+def load_corpus(extra_pks=()):
+    """
+    (corpus, listed pks) of every listed race, plus the races `extra_pks`
+    whether listed or not (a new race waiting for approval)
+    """
+    from .models import Race
+
+    rows = list(listed_races().order_by().values_list(*FIELDS).iterator())
+    listed = {row[0] for row in rows}
+    missing = set(extra_pks) - listed
+    if missing:
+        rows += list(Race.objects.filter(pk__in=missing).values_list(*FIELDS))
+    return Corpus(rows), listed
+
+
+def store(neighbours):
+    """Replace the stored lists of {pk: [(score, other_pk), ...]} in one transaction"""
+    from .models import SimilarRace
+
+    with transaction.atomic():
+        SimilarRace.objects.filter(race_id__in=list(neighbours)).delete()
+        SimilarRace.objects.bulk_create([
+            SimilarRace(race_id=pk, similar_id=other, score=score, rank=rank)
+            for pk, top in neighbours.items()
+            for rank, (score, other) in enumerate(top, start=1)
+        ])
+
+
+def rebuild(batch_size=500, top_k=None):
+    """Recompute every listed race's neighbours; returns the number of races"""
+    from .models import SimilarRace
+
+    top_k = top_k or setting('SIMILAR_RACES_TOP_K', 4)
+    corpus, listed = load_corpus()
+    pks = sorted(listed)
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start:start + batch_size]
+        store({pk: corpus.top(pk, top_k, listed) for pk in batch})
+    # Races that left the lists keep no recommendations
+    SimilarRace.objects.exclude(race_id__in=listed_races().values('pk')).delete()
+    return len(pks)
+
+
+def update_races(race_ids, top_k=None):
+    """
+    Recompute the neighbours of races that were created, edited or approved
+
+    Also recomputes the lists of listed races they now belong in (more
+    similar than the current last entry) or are already in (an edit may
+    have made them less similar). Returns the number of lists rewritten.
+    """
+    from django.db.models import Count, Min
+    from .models import SimilarRace
+
+    top_k = top_k or setting('SIMILAR_RACES_TOP_K', 4)
+    corpus, listed = load_corpus(extra_pks=race_ids)
+    race_ids = [pk for pk in race_ids if pk in corpus.features]  # Not deleted since
+    neighbours = {pk: corpus.top(pk, top_k, listed) for pk in race_ids}
+
+    # Pairwise similarity is symmetric: score(other, race) == score(race, other)
+    best = {}
+    for pk in race_ids:
+        if pk in listed:
+            for other, score in corpus.similarities(pk, listed).items():
+                best[other] = max(score, best.get(other, score))
+    current = {
+        row['race_id']: row
+        for row in SimilarRace.objects.filter(race_id__in=list(best))
+        .values('race_id').annotate(entries=Count('pk'), lowest=Min('score'))
+    }
+    for other, score in best.items():
+        row = current.get(other)
+        if row is None or row['entries'] < top_k or score > row['lowest']:
+            neighbours.setdefault(other, None)
+    for other in SimilarRace.objects.filter(similar_id__in=race_ids).values_list('race_id', flat=True):
+        if other in listed:
+            neighbours.setdefault(other, None)
+
+    store({pk: top if top is not None else corpus.top(pk, top_k, listed)
+           for pk, top in neighbours.items()})
+    return len(neighbours)
+
+
+def similar_races(race, limit=None):
+    """The stored recommendations for `race`, best first (one query)"""
+    from .models import Race
+
+    limit = limit or setting('SIMILAR_RACES_TOP_K', 4)
+    return (Race.objects.filter(recommended_for__race=race, status=1, approved=True)
+            .order_by('recommended_for__rank')
+            .only('pk', 'name', 'city', 'race_date')[:limit])
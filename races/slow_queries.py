@@ -0,0 +1,295 @@
+"""
+Slow-query log with automatic EXPLAIN capture
+
+A wrapper installed on every database connection times each query:
+
+- queries slower than SLOW_QUERY_THRESHOLD_MS are logged (logger
+  "races.slow_queries") with their normalized SQL, the view and the
+  project source line that triggered them, and an EXPLAIN of the query
+  (EXPLAIN ANALYZE on PostgreSQL when SLOW_QUERY_EXPLAIN_ANALYZE is on)
+- within a request, a query shape executed SLOW_QUERY_REPEAT_THRESHOLD or
+  more times is recorded as a "repeated" entry - the typical N+1 pattern.
+  Counting shapes means normalizing every query, so only a sample of
+  requests (SLOW_QUERY_REPEAT_SAMPLE_RATE) is counted - every request
+  while the development N+1 detector is on
+
+Entries are aggregated by shape in the SlowQuery table (count, total and
+max time), so a recurring problem is one row with a large count rather
+than thousands of log lines. They are written when a request finishes, or
+once 100 are pending - but never from inside a transaction, whose rollback
+would take them along.
+"""
+import hashlib
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger('races.slow_queries')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+# Per-request shape counter and current view (set by QueryLogMiddleware)
+current_request_log = ContextVar('current_request_query_log', default=None)
+current_view = ContextVar('current_query_view', default='')
+
+# Our own instrumentation wrappers are never the "origin" of a query
+INSTRUMENTATION_FILES = (
+    os.path.join('config', 'metrics.py'),
+    os.path.join('config', 'middleware.py'),
+    os.path.join('races', 'profiling.py'),
+    os.path.join('races', 'slow_queries.py'),
+)
+
+_state = threading.local()
+_pending = {}
+_pending_lock = threading.Lock()
+_explained = set()
+
+
+def normalize_sql(sql):
+    """
+    Reduce a query to its "shape"
+
+    Literals and parameters become "?", IN lists collapse to "(...)" and
+    whitespace is squashed, so the same ORM query with different values
+    always normalizes to the same string.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(kind, normalized, location):
+    raw = f"{kind}|{normalized}|{location}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def threshold_ms():
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 100)
+
+
+def find_origin():
+    """
+    First stack frame inside the project (not Django or a third-party app)
+
+    Returns "races/views.py:87 in race_detail" style strings. Queries run
+    while rendering a template point at the view's render() call.
+    """
+    base = str(settings.BASE_DIR) + os.sep
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(base) and 'site-packages' not in filename
+                and not filename.endswith(INSTRUMENTATION_FILES)):
+            relative = filename[len(base):]
+            return f"{relative}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return ''
+
+
+def explain(connection, sql, params):
+    """
+    Return the query plan for `sql`, or an empty string if it can't be explained
+
+    Runs inside a savepoint so a failing EXPLAIN never breaks the caller's
+    transaction.
+    """
+    from django.db import transaction
+
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    options = {}
+    if connection.vendor == 'postgresql' and getattr(settings, 'SLOW_QUERY_EXPLAIN_ANALYZE', False):
+        options['analyze'] = True
+    try:
+        prefix = connection.ops.explain_query_prefix(**options)
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f"{prefix} {sql}", params)
+                rows = cursor.fetchall()
+    except Exception as error:  # noqa: BLE001 - plan capture must never fail a request
+        return f"EXPLAIN failed: {error}"
+    return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+
+
+def _record(kind, normalized, sql, location, view, duration_ms, count=1, plan=''):
+    """Add an observation to the in-process aggregate (flushed later)"""
+    key = fingerprint(kind, normalized, location)
+    with _pending_lock:
+        entry = _pending.get(key)
+        if entry is None:
+            entry = _pending[key] = {
+                'kind': kind, 'normalized_sql': normalized, 'sample_sql': sql,
+                'location': location, 'view': view, 'explain': plan,
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            }
+        entry['count'] += count
+        entry['total_ms'] += duration_ms
+        entry['max_ms'] = max(entry['max_ms'], duration_ms / count)
+        if plan and not entry['explain']:
+            entry['explain'] = plan
+        size = len(_pending)
+    if size >= 100 and not in_transaction():
+        flush()
+
+
+def in_transaction():
+    """True inside an atomic() block on the database the log is written to"""
+    from django.db import connections, router
+    from .models import SlowQuery
+
+    return connections[router.db_for_write(SlowQuery)].in_atomic_block
+
+
+def count_shapes():
+    """Should this request count its query shapes? (see the module docstring)"""
+    if getattr(settings, 'QUERY_INSPECTOR_ENABLED', settings.DEBUG):
+        return True
+    return random.random() < getattr(settings, 'SLOW_QUERY_REPEAT_SAMPLE_RATE', 0.05)
+
+
+def query_watcher(execute, sql, params, many, context):
+    """
+    execute_wrapper hook installed on every connection (see install())
+    """
+    if getattr(_state, 'busy', False):
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        request_log = current_request_log.get()
+        limit = threshold_ms()
+        is_slow = limit is not None and duration_ms >= limit
+        if request_log is not None or is_slow:
+            _state.busy = True
+            try:
+                normalized = normalize_sql(sql)
+                if request_log is not None:
+                    request_log.add(normalized, sql, duration_ms)
+                if is_slow:
+                    _log_slow(context['connection'], sql, params, normalized, duration_ms)
+            finally:
+                _state.busy = False
+
+
+def _log_slow(connection, sql, params, normalized, duration_ms):
+    location = find_origin()
+    view = current_view.get()
+    # EXPLAIN each shape once per process - the plan rarely changes
+    plan = ''
+    shape_key = (normalized, location)
+    if shape_key not in _explained:
+        _explained.add(shape_key)
+        plan = explain(connection, sql, params)
+    logger.warning(
+        "Slow query (%.1f ms) in %s at %s: %s",
+        duration_ms, view or '-', location or '-', normalized,
+    )
+    _record('slow', normalized, sql, location, view, duration_ms, plan=plan)
+
+
+class RequestQueryLog:
+    """Query shapes seen during one request"""
+
+    def __init__(self):
+        self.shapes = Counter()
+        self.samples = {}
+        self.times = Counter()
+        self.locations = {}
+
+    def add(self, normalized, sql, duration_ms):
+        self.shapes[normalized] += 1
+        self.times[normalized] += duration_ms
+        if normalized not in self.samples:
+            self.samples[normalized] = sql
+            self.locations[normalized] = find_origin()
+
+    def repeated(self, minimum):
+        """[(normalized_sql, count)] for shapes executed at least `minimum` times"""
+        return [(shape, count) for shape, count in self.shapes.most_common()
+                if count >= minimum]
+
+    def finish(self, view):
+        """Record repeated shapes (N+1 candidates) for this request"""
+        minimum = getattr(settings, 'SLOW_QUERY_REPEAT_THRESHOLD', 10)
+        if not minimum:
+            return
+        for shape, count in self.repeated(minimum):
+            logger.warning(
+                "Query repeated %d times in %s at %s: %s",
+                count, view or '-', self.locations[shape] or '-', shape,
+            )
+            _record('repeated', shape, self.samples[shape], self.locations[shape],
+                    view, self.times[shape], count=count)
+
+
+def flush():
+    """
+    Write the aggregated observations to the SlowQuery table
+
+    The writes run in their own atomic() block: a failure rolls back only
+    them (inside an outer transaction, a savepoint) and leaves the caller's
+    transaction usable.
+    """
+    from django.db import DatabaseError, router, transaction
+    from django.db.models import F
+    from django.db.models.functions import Greatest
+    from django.utils import timezone
+    from .models import SlowQuery
+
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+
+    _state.busy = True
+    try:
+        now = timezone.now()
+        with transaction.atomic(using=router.db_for_write(SlowQuery)):
+            for key, entry in pending.items():
+                updated = SlowQuery.objects.filter(fingerprint=key).update(
+                    count=F('count') + entry['count'],
+                    total_ms=F('total_ms') + entry['total_ms'],
+                    max_ms=Greatest(F('max_ms'), entry['max_ms']),
+                    last_seen=now,
+                )
+                if not updated:
+                    SlowQuery.objects.create(fingerprint=key, last_seen=now, **entry)
+    except DatabaseError:
+        logger.exception("Could not store slow query log")
+    finally:
+        _state.busy = False
+
+
+def install(connection, **kwargs):
+    """
+    Add query_watcher to a connection (connection_created receiver)
+
+    The watcher goes to the front of execute_wrappers so temporary
+    wrappers pushed and popped by execute_wrapper() never remove it.
+    """
+    if query_watcher not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_watcher)
+
+
+def flush_on_request_finished(**kwargs):
+    if _pending and not in_transaction():
+        flush()
@@ -0,0 +1,45 @@
+"""
+Background tasks run by the job queue (races/jobs.py)
+
+Every task must be safe to run more than once: a job whose worker dies is
+re-queued and runs again.
+"""
+from .jobs import task
+
+
+@task('races.execute_account_deletion')
+def execute_account_deletion(request_id):
+    """Delete the account of an approved deletion request in batches"""
+    from .account_deletion import execute
+    from .models import AccountDeletionRequest
+
+    deletion_request = AccountDeletionRequest.objects.filter(pk=request_id, status='APPROVED').first()
+    if deletion_request is not None:  # Already completed (or cancelled) - nothing to do
+        execute(deletion_request)
+
+
+@task('races.purge_race')
+def purge_race(race_id):
+    """Remove a soft-deleted race and its comments in batches"""
+    from .models import Race
+    from .purge import purge_race as purge
+
+    race = Race.all_objects.filter(pk=race_id, deleted_at__isnull=False).first()
+    if race is not None:
+        purge(race)
+
+
+@task('races.update_similar_races')
+def update_similar_races(race_ids):
+    """Recompute "You might also like" for created, edited or approved races"""
+    from .similarity import update_races
+
+    update_races(race_ids)
+
+
+@task('races.rebuild_rollups')
+def rebuild_rollups():
+    """Recompute the dashboard statistics from the base tables"""
+    from .rollups import rebuild
+
+    rebuild()
@@ -0,0 +1,239 @@
+"""
+Template rendering micro-benchmarks
+
+Renders the main race templates with fixed, in-memory contexts (unsaved
+model instances - no database access) and times the building blocks they
+are made of:
+
+- page renders: race_list / my_races with 6, 60 and 600 cards and
+  race_detail with 0, 100 and 5,000 comments, for a logged-in user
+- components: the cloudinary_filters filters, {% url %} resolution and
+  the cost of extending base.html
+
+Each case is rendered `repeat` times with the garbage collector paused.
+The median is reported for information; comparisons use the fastest run
+(as timeit does), which is the least affected by other processes.
+Results are compared with a stored baseline (see the benchmark_templates command); because the baseline may
+have been recorded on a faster or slower machine, timings are scaled by a
+small pure-Python calibration loop before comparing.
+"""
+import gc
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.paginator import Paginator
+from django.template import Context, Template
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.urls import resolve
+from django.utils import timezone
+
+CARD_COUNTS = (6, 60, 600)
+COMMENT_COUNTS = (0, 100, 5000)
+
+# Fixed "now" so every run renders exactly the same bytes
+FIXED_NOW = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def build_user(pk=1, username='bench_runner'):
+    return User(pk=pk, username=username, email=f'{username}@example.com')
+
+
+def build_races(count, creator):
+    """Unsaved races with every display branch represented"""
+    from .models import Race
+
+    distances = [choice for choice, _ in Race.DISTANCE_CHOICES]
+    difficulties = [choice for choice, _ in Race.DIFFICULTY_CHOICES]
+    races = []
+    for index in range(count):
+        distance = distances[index % len(distances)]
+        race = Race(
+            pk=index + 1,
+            name=f'Benchmark Race {index + 1}',
+            description='A very silly race.\n\nBring a costume.',
+            distance=distance,
+            custom_distance='10 miles' if distance == 'OTHER' else '',
+            difficulty=difficulties[index % len(difficulties)],
+            race_date=date(2025, 7, 1) + timedelta(days=index % 365),
+            city='Bordeaux',
+            country='France',
+            status=1,
+            approved=True,
+            created_by=creator,
+            created_at=FIXED_NOW,
+        )
+        # Mix of real images, placeholders and no image at all
+        race.image = ('race_images/sample_%d' % index, 'placeholder', '')[index % 3]
+        races.append(race)
+    return races
+
+
+def build_comments(count, race, authors):
+    from .models import Comment
+
+    return [
+        Comment(
+            pk=index + 1,
+            race=race,
+            author=authors[index % len(authors)],
+            body=f'Comment number {index + 1}.\nSee you at the start line!',
+            created_on=FIXED_NOW - timedelta(minutes=index),
+            approved=True,
+        )
+        for index in range(count)
+    ]
+
+
+def build_request(path, user):
+    request = RequestFactory().get(path)
+    request.user = user
+    request.resolver_match = resolve(path)
+    return request
+
+
+def page_context(races):
+    paginator = Paginator(races, max(len(races), 1))
+    page_obj = paginator.get_page(1)
+    return {'races': page_obj, 'is_paginated': page_obj.has_other_pages(), 'page_obj': page_obj}
+
+
+def page_cases():
+    """(name, callable) pairs rendering the full page templates"""
+    user = build_user()
+    other = build_user(pk=2, username='other_runner')
+    cases = []
+
+    for template_name, path in (('races/race_list.html', '/'),
+                                ('races/my_races.html', '/my-races/')):
+        template = get_template(template_name)
+        request = build_request(path, user)
+        for count in CARD_COUNTS:
+            context = page_context(build_races(count, user))
+            label = template_name.split('/')[-1].replace('.html', '')
+            cases.append((f'{label}[{count} cards]',
+                          lambda t=template, c=context, r=request: t.render(c, r)))
+
+    template = get_template('races/race_detail.html')
+    race = build_races(1, user)[0]
+    request = build_request(f'/race/{race.pk}/', user)
+    for count in COMMENT_COUNTS:
+        comments = build_comments(count, race, [user, other])
+        context = {'race': race, 'comments': comments, 'comment_count': count}
+        cases.append((f'race_detail[{count} comments]',
+                      lambda t=template, c=context, r=request: t.render(c, r)))
+    return cases
+
+
+def component_cases(iterations=1000):
+    """(name, callable) pairs isolating filters, {% url %} and inheritance"""
+    from .templatetags import cloudinary_filters
+
+    images = [f'race_images/sample_{index}' for index in range(iterations)]
+    urls = [f'https://res.cloudinary.com/demo/image/upload/v1/{name}.jpg' for name in images]
+
+    def run_filter(function, values):
+        return lambda: [function(value) for value in values]
+
+    filter_loop = Template(
+        '{% load cloudinary_filters %}{% for image in images %}'
+        '{% if image|is_placeholder %}-{% else %}{{ image|secure_cloudinary_url }}{% endif %}'
+        '{% endfor %}'
+    )
+    url_loop = Template("{% for pk in ids %}{% url 'race-detail' pk %}{% endfor %}")
+    plain_loop = Template("{% for pk in ids %}/race/{{ pk }}/{% endfor %}")
+    child = Template("{% extends 'base.html' %}{% block content %}<p>x</p>{% endblock %}")
+    standalone = Template("<html><body><p>x</p></body></html>")
+    anonymous_request = build_request('/', AnonymousUser())
+
+    def render_with_request(template):
+        from django.template import RequestContext
+        return lambda: template.render(RequestContext(anonymous_request, {}))
+
+    return [
+        (f'filter:secure_cloudinary_url[x{iterations}]',
+         run_filter(cloudinary_filters.secure_cloudinary_url, images)),
+        (f'filter:is_placeholder[x{iterations}]',
+         run_filter(cloudinary_filters.is_placeholder, images)),
+        (f'filter:cloudinary_secure[x{iterations}]',
+         run_filter(cloudinary_filters.cloudinary_secure, urls)),
+        (f'filter:template_loop[x{iterations}]',
+         lambda: filter_loop.render(Context({'images': images}))),
+        (f'url_tag[x{iterations}]',
+         lambda: url_loop.render(Context({'ids': range(iterations)}))),
+        (f'url_baseline_plain_text[x{iterations}]',
+         lambda: plain_loop.render(Context({'ids': range(iterations)}))),
+        ('inheritance:extends_base', render_with_request(child)),
+        ('inheritance:standalone_baseline', render_with_request(standalone)),
+    ]
+
+
+def time_case(function, repeat, warmup=2):
+    """Median and minimum wall time of `function` in milliseconds"""
+    for _ in range(warmup):
+        function()
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        'median_ms': round(statistics.median(timings), 4),
+        'min_ms': round(min(timings), 4),
+        'repeat': repeat,
+    }
+
+
+def calibrate(rounds=5):
+    """Milliseconds for a fixed pure-Python workload - a machine speed unit"""
+    def workload():
+        total = 0
+        for number in range(200000):
+            total += number % 7
+        return total
+    return time_case(workload, rounds, warmup=1)['min_ms']
+
+
+def run(repeat=10, include=None, iterations=1000):
+    """Run every case whose name contains one of `include` (all if None)"""
+    results = {}
+    for name, function in page_cases() + component_cases(iterations):
+        if include and not any(part in name for part in include):
+            continue
+        # Large cases are expensive - fewer repetitions keep the suite quick
+        runs = max(3, repeat // 3) if ('600' in name or '5000' in name) else repeat
+        results[name] = time_case(function, runs)
+    return {'calibration_ms': round(calibrate(), 4), 'cases': results}
+
+
+def compare(baseline, current, tolerance, min_delta_ms=0.0):
+    """
+    Return [(case, baseline_ms, scaled_current_ms, ratio)] for regressions
+
+    The current timings are scaled by the calibration ratio so a slower CI
+    machine does not look like a regression. A case regresses when it is
+    more than `tolerance` (0.2 = 20%) slower than the baseline and also at
+    least `min_delta_ms` slower, so sub-millisecond jitter is ignored.
+    """
+    scale = 1.0
+    if baseline.get('calibration_ms') and current.get('calibration_ms'):
+        scale = baseline['calibration_ms'] / current['calibration_ms']
+
+    regressions = []
+    for name, stats in current['cases'].items():
+        before = baseline['cases'].get(name)
+        if not before or not before['min_ms']:
+            continue
+        after = stats['min_ms'] * scale
+        ratio = after / before['min_ms']
+        if ratio > 1 + tolerance and after - before['min_ms'] >= min_delta_ms:
+            regressions.append((name, before['min_ms'], round(after, 4), round(ratio, 3)))
+    return regressions
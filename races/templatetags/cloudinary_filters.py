@@ -129,4 +129,4 @@ def is_placeholder(cloudinary_field):
         field_str == "" or                            # Explicit empty string
         "placeholder" in field_str.lower() or        # Contains "placeholder"
         field_str in ["sample", "default", "placeholder"]  # Common defaults
-    )
\ No newline at end of file
+    )
@@ -116,3 +116,2133 @@ class RaceVisibilityTestCase(TestCase):
         actual_str = str(self.public_race)
         self.assertEqual(actual_str, expected_str, 
                         f"Expected '{expected_str}', got '{actual_str}'")
+
+
+class ImageDeduplicationTestCase(TestCase):
+    """
+    Test that duplicate race photos reuse the already stored image.
+    Cloudinary uploads are replaced with a fake so no network is needed.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='uploader', password='pass12345')
+        self.uploads = []
+
+    def make_upload(self, size=(120, 80), fmt='PNG', name='photo.png'):
+        """Build an in-memory image with a simple gradient"""
+        from io import BytesIO
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        image = Image.new('RGB', (120, 80))
+        for x in range(120):
+            for y in range(80):
+                image.putpixel((x, y), (x * 2 % 256, y * 3 % 256, (x + y) % 256))
+        image = image.resize(size)
+        buffer = BytesIO()
+        image.save(buffer, fmt)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def fake_upload(self, file, **options):
+        """Stand-in for cloudinary.uploader.upload_resource"""
+        from cloudinary import CloudinaryResource
+        self.uploads.append(file.name)
+        return CloudinaryResource(
+            f'race_images/upload_{len(self.uploads)}', resource_type='image')
+
+    def create_race(self, upload):
+        from unittest import mock
+        with mock.patch('cloudinary.uploader.upload_resource', side_effect=self.fake_upload):
+            return Race.objects.create(
+                name='Race', description='d', city='C',
+                race_date=timezone.now().date(), created_by=self.user,
+                image=upload,
+            )
+
+    def test_identical_upload_reuses_stored_image(self):
+        """The second upload of the same bytes should not reach Cloudinary"""
+        from .models import StoredImage
+
+        first = self.create_race(self.make_upload())
+        second = self.create_race(self.make_upload())
+
+        self.assertEqual(len(self.uploads), 1)
+        self.assertEqual(StoredImage.objects.count(), 1)
+        self.assertEqual(second.image.public_id, first.image.public_id)
+
+    def test_resized_copy_matches_perceptual_hash(self):
+        """A re-encoded, resized copy of the same photo is a duplicate"""
+        first = self.create_race(self.make_upload())
+        second = self.create_race(
+            self.make_upload(size=(240, 160), fmt='JPEG', name='photo.jpg'))
+
+        self.assertEqual(len(self.uploads), 1)
+        self.assertEqual(second.image.public_id, first.image.public_id)
+
+    def test_hamming_band_lookup(self):
+        """Hashes within three bits always share an indexed band"""
+        from .images import split_bands
+
+        original = 0x0123456789ABCDEF
+        changed = original ^ (1 << 3) ^ (1 << 20) ^ (1 << 40)
+        shared = [a == b for a, b in zip(split_bands(original), split_bands(changed))]
+        self.assertTrue(any(shared))
+
+
+    def test_dedupe_command_dry_run_and_soft_deleted_races(self):
+        """A dry run reports library duplicates; the real run re-points soft-deleted races too"""
+        import os
+        import shutil
+        import tempfile
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from django.test import override_settings
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        os.makedirs(os.path.join(media_root, 'race_images'))
+        data = self.make_upload().read()
+        for name in ('first', 'second'):  # The field stores public ids without an extension
+            with open(os.path.join(media_root, 'race_images', name), 'wb') as handle:
+                handle.write(data)
+        Race.objects.bulk_create([
+            Race(name=f'Race {name}', description='d', city='C', race_date=timezone.now().date(),
+                 created_by=self.user, image=f'image/upload/race_images/{name}')
+            for name in ('first', 'second')
+        ])
+        Race.objects.get(name='Race second').soft_delete()
+
+        with override_settings(MEDIA_ROOT=media_root):
+            out = StringIO()
+            call_command('dedupe_race_images', '--dry-run', stdout=out)
+            self.assertIn('race_images/second -> race_images/first (1 race(s))',
+                          out.getvalue())
+            self.assertIn('1 duplicate(s)', out.getvalue())
+
+            with mock.patch('cloudinary.uploader.destroy') as destroy:
+                call_command('dedupe_race_images', '--delete-orphans', stdout=StringIO())
+        self.assertEqual(destroy.call_count, 1)
+        self.assertEqual(str(Race.all_objects.get(name='Race second').image),
+                         str(Race.all_objects.get(name='Race first').image))
+
+class ImageProxyTestCase(TestCase):
+    """
+    Test the /img/<w>x<h>/<path> resize proxy and its disk cache.
+    Each test gets its own temporary MEDIA_ROOT and cache directory.
+    """
+
+    def setUp(self):
+        import tempfile
+        from PIL import Image
+        from django.test import override_settings
+
+        self.media_root = tempfile.mkdtemp()
+        self.cache_root = tempfile.mkdtemp()
+        Image.new('RGB', (800, 600), (200, 30, 30)).save(
+            f'{self.media_root}/photo.jpg', 'JPEG')
+
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            IMAGE_CACHE_ROOT=self.cache_root,
+            IMAGE_CACHE_MAX_BYTES=10 * 1024 * 1024,
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        import shutil
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        shutil.rmtree(self.cache_root, ignore_errors=True)
+
+    def test_resizes_and_caches(self):
+        """The derivative fits the box; only versioned URLs are cached for good"""
+        from io import BytesIO
+        from PIL import Image
+        from .image_proxy import derivative_url
+
+        url = derivative_url('photo.jpg', '200x200')
+        self.assertRegex(url, r'^/img/200x200/photo\.jpg\?v=[0-9a-f]{12}$')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['X-Image-Derivative'], '200x200')
+
+        image = Image.open(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(image.size, (200, 150))
+
+        # The plain URL survives a new original: short max-age, revalidated by ETag
+        response = self.client.get('/img/200x200/photo.jpg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+        etag = response['ETag']
+        response.close()
+        response = self.client.get('/img/200x200/photo.jpg', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Image.new('RGB', (400, 300), (30, 30, 200)).save(f'{self.media_root}/photo.jpg', 'JPEG')
+        self.assertNotEqual(derivative_url('photo.jpg', '200x200'), url)
+        response = self.client.get('/img/200x200/photo.jpg', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response.close()
+
+    def test_concurrent_requests_resize_once(self):
+        """Parallel requests for the same derivative run a single resize"""
+        from concurrent.futures import ThreadPoolExecutor
+        from unittest import mock
+        from . import image_proxy
+
+        real_resize = image_proxy.resize_image
+        with mock.patch.object(image_proxy, 'resize_image', side_effect=real_resize) as resize:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(
+                    lambda _: image_proxy.get_derivative('photo.jpg', 100, 100),
+                    range(8)))
+        self.assertEqual(resize.call_count, 1)
+        self.assertEqual(len({path for path, _, _ in results}), 1)
+
+    def test_lru_eviction_keeps_cache_bounded(self):
+        """Old derivatives are evicted once the cache exceeds its budget"""
+        import os
+        from . import image_proxy
+
+        cache = image_proxy.DiskLRUCache(self.cache_root, max_bytes=1000)
+        for index in range(5):
+            cache.store(f'{index:02d}key', '.bin', lambda handle: handle.write(b'x' * 400))
+            # Make the write order visible through mtimes
+            path = cache.path_for(f'{index:02d}key', '.bin')
+            os.utime(path, (index, index))
+        # Lock files go with their derivative (once older than a minute)
+        for index in range(5):
+            with cache.lock(f'{index:02d}key'):
+                pass
+            os.utime(cache.lock_path_for(f'{index:02d}key'), (index, index))
+        cache.evict()
+        self.assertLessEqual(cache.total_bytes(), 1000)
+        self.assertIsNotNone(cache.get('04key', '.bin'))
+        self.assertIsNone(cache.get('00key', '.bin'))
+        self.assertFalse(os.path.exists(cache.lock_path_for('00key')))
+        self.assertTrue(os.path.exists(cache.lock_path_for('04key')))
+
+    def test_rejects_path_traversal(self):
+        """Only files inside MEDIA_ROOT can be resized"""
+        response = self.client.get('/img/100x100/../../etc/passwd.jpg')
+        self.assertEqual(response.status_code, 404)
+
+    def test_originals_redirect_to_derivative(self):
+        """Original media images are not sent to the browser"""
+        response = self.client.get('/media/photo.jpg')
+        self.assertEqual(response.status_code, 301)
+        self.assertRegex(response['Location'], r'^/img/1600x1600/photo\.jpg\?v=[0-9a-f]{12}$')
+
+
+class MetricsTestCase(TestCase):
+    """
+    Test the request metrics middleware and the /metrics endpoint.
+    """
+
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            username='ops', password='opspass123', is_staff=True)
+
+    def test_metrics_require_staff_or_token(self):
+        """Anonymous scrapes are refused, staff and token holders allowed"""
+        from django.test import override_settings
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        with override_settings(METRICS_TOKEN='s3cret'):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(response.status_code, 200)
+
+        self.client.login(username='ops', password='opspass123')
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_records_route_latency_and_queries(self):
+        """A page view shows up under its URL name with SQL and template stats"""
+        self.client.get('/')
+        self.client.login(username='ops', password='opspass123')
+        body = self.client.get('/metrics').content.decode()
+
+        self.assertIn('django_http_request_duration_seconds_bucket{method="GET",route="race-list",le="+Inf"}', body)
+        self.assertIn('django_db_queries_per_request_count{route="race-list"}', body)
+        self.assertIn('django_template_render_seconds_sum{route="race-list"}', body)
+        self.assertIn('django_http_response_size_bytes_count{route="race-list"}', body)
+
+    def test_merges_other_worker_snapshots(self):
+        """Totals written by other worker processes are added to ours"""
+        import json
+        import os
+        import tempfile
+        from django.test import override_settings
+        from config import metrics
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            other = {
+                'kinds': {'test_jobs_total': 'counter'},
+                'buckets': {},
+                'values': [['test_jobs_total', [['queue', 'default']], 5.0]],
+            }
+            with open(os.path.join(directory, '999999.json'), 'w') as handle:
+                json.dump(other, handle)
+
+            metrics.inc('test_jobs_total', 2, queue='default')
+            self.assertIn('test_jobs_total{queue="default"} 7.0', metrics.render_prometheus())
+
+
+class RequestProfilingTestCase(TestCase):
+    """
+    Test the staff-only X-Profile request profiler.
+    """
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+
+        self.profile_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            PROFILE_ROOT=self.profile_root, PROFILE_MAX_COUNT=2)
+        self.settings_override.enable()
+        self.staff = User.objects.create_user(
+            username='ops', password='opspass123', is_staff=True)
+
+    def tearDown(self):
+        import shutil
+        self.settings_override.disable()
+        shutil.rmtree(self.profile_root, ignore_errors=True)
+
+    def test_no_profile_without_header_or_for_regular_users(self):
+        """Profiling only happens for staff users who ask for it"""
+        from .models import RequestProfile
+
+        self.client.get('/')
+        User.objects.create_user(username='runner', password='runpass123')
+        self.client.login(username='runner', password='runpass123')
+        self.client.get('/', HTTP_X_PROFILE='1')
+        self.assertEqual(RequestProfile.objects.count(), 0)
+
+    def test_staff_profile_is_stored_with_sql_and_templates(self):
+        """A profiled request stores a downloadable artifact and its SQL log"""
+        import os
+        from .models import RequestProfile
+
+        self.client.login(username='ops', password='opspass123')
+        response = self.client.get('/', HTTP_X_PROFILE='1')
+
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.route, 'race-list')
+        self.assertTrue(os.path.exists(profile.artifact_path))
+        self.assertGreater(profile.query_count, 0)
+        self.assertEqual(profile.details['templates'][0]['template'], 'races/race_list.html')
+
+        # Downloading needs the admin "view request profile" permission
+        User.objects.create_superuser(username='boss', password='bosspass123')
+        self.client.login(username='boss', password='bosspass123')
+        download = self.client.get(f'/admin/races/requestprofile/{profile.pk}/download/')
+        self.assertEqual(download.status_code, 200)
+
+    def test_sampling_mode_and_retention(self):
+        """Sampling writes folded stacks; only the newest profiles are kept"""
+        from .models import RequestProfile
+
+        self.client.login(username='ops', password='opspass123')
+        for _ in range(3):
+            response = self.client.get('/', HTTP_X_PROFILE='sample')
+
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        latest = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertTrue(latest.artifact.endswith('.folded'))
+        import os
+        self.assertEqual(len(os.listdir(self.profile_root)), 2)
+
+    def test_async_view_is_profiled_on_the_event_loop(self):
+        """Under ASGI cProfile sees the async view itself, and the SQL log is complete"""
+        import pstats
+        from types import ModuleType
+        from asgiref.sync import async_to_sync
+        from django.test import override_settings
+        from django.urls import include, path
+        from . import async_views
+        from .models import RequestProfile
+
+        urls = ModuleType('async_urls')
+        urls.urlpatterns = [
+            path('', async_views.race_list, name='race-list'),
+            path('', include('config.urls')),
+        ]
+        async def profiled_request():
+            return await self.async_client.get('/', headers={'X-Profile': '1'})
+
+        self.async_client.force_login(self.staff)
+        with override_settings(ROOT_URLCONF=urls):
+            response = async_to_sync(profiled_request)()
+
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertGreater(profile.query_count, 0)
+        functions = pstats.Stats(profile.artifact_path).stats
+        self.assertTrue(any(filename.endswith('async_views.py') and name == 'race_list'
+                            for filename, _, name in functions))
+
+
+    def test_overlapping_profiles_share_cprofile_and_keep_metrics(self):
+        """A second profiled request samples while cProfile is busy; metrics still count both"""
+        import asyncio
+        from types import ModuleType
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from django.test import override_settings
+        from django.urls import include, path
+        from config import metrics
+        from . import async_views
+        from .models import RequestProfile
+
+        urls = ModuleType('async_urls')
+        urls.urlpatterns = [
+            path('', async_views.race_list, name='race-list'),
+            path('', include('config.urls')),
+        ]
+        async def two_profiled_requests():
+            return await asyncio.gather(*[
+                self.async_client.get('/', headers={'X-Profile': '1'}) for _ in range(2)])
+
+        self.async_client.force_login(self.staff)
+        with override_settings(ROOT_URLCONF=urls), \
+                mock.patch.object(metrics, 'observe', wraps=metrics.observe) as observe:
+            responses = async_to_sync(two_profiled_requests)()
+
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(sorted(response['X-Profile-Mode'] for response in responses),
+                         ['cprofile', 'sample (cProfile busy)'])
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        query_counts = [call.args[1] for call in observe.call_args_list
+                        if call.args[0] == 'django_db_queries_per_request']
+        self.assertEqual(len(query_counts), 2)
+        self.assertTrue(all(query_counts))
+        self.assertEqual(len([call for call in observe.call_args_list
+                              if call.args[0] == 'django_template_render_seconds']), 2)
+
+class SlowQueryLogTestCase(TestCase):
+    """
+    Test the slow-query log: normalization, N+1 aggregation and EXPLAIN capture.
+    """
+
+    def setUp(self):
+        self.creator = User.objects.create_user(username='creator', password='pass12345')
+        self.race = Race.objects.create(
+            name='Busy Race', description='Lots of chat', city='Leeds',
+            race_date=timezone.now().date(), status=1, approved=True,
+            created_by=self.creator,
+        )
+
+    def test_normalize_sql_collapses_literals(self):
+        """Different values of the same query normalize to one shape"""
+        from .slow_queries import normalize_sql
+
+        first = normalize_sql("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x'")
+        second = normalize_sql("SELECT *  FROM t WHERE id IN (%s, %s) AND name = %s")
+        self.assertEqual(first, second)
+        self.assertEqual(first, "SELECT * FROM t WHERE id IN (...) AND name = ?")
+
+    def test_slow_queries_are_explained_and_aggregated(self):
+        """Queries over the threshold are stored once per shape with a plan"""
+        from django.test import override_settings
+        from . import slow_queries
+        from .models import SlowQuery
+
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), \
+                self.assertLogs('races.slow_queries', 'WARNING'):
+            for _ in range(3):
+                list(Race.objects.filter(city='Leeds'))
+        slow_queries.flush()
+
+        entry = SlowQuery.objects.get(kind='slow', normalized_sql__contains='"races_race"."city" = ?')
+        self.assertEqual(entry.count, 3)
+        self.assertIn('races/tests.py', entry.location)
+        self.assertTrue(entry.explain)
+
+    def test_repeated_shapes_in_a_request_are_one_entry(self):
+        """An N+1 loop is recorded as a single "repeated" row with its count"""
+        from . import slow_queries
+        from .models import SlowQuery
+
+        users = [User.objects.create_user(username=f'fan{i}') for i in range(12)]
+        log = slow_queries.RequestQueryLog()
+        token = slow_queries.current_request_log.set(log)
+        try:
+            for user in users:
+                User.objects.get(pk=user.pk)
+        finally:
+            slow_queries.current_request_log.reset(token)
+
+        with self.assertLogs('races.slow_queries', 'WARNING'):
+            log.finish('race-detail')
+        slow_queries.flush()
+
+        entry = SlowQuery.objects.get(kind='repeated')
+        self.assertEqual(entry.count, 12)
+        self.assertEqual(entry.view, 'race-detail')
+
+    def test_log_stays_out_of_transactions_and_samples_requests(self):
+        """No flush inside atomic(); a failed flush keeps the transaction usable"""
+        from unittest import mock
+        from django.test import override_settings
+        from . import slow_queries
+        from .models import SlowQuery
+
+        # TestCase runs inside atomic(): a full buffer waits for the request to end
+        for number in range(100):
+            slow_queries._record('slow', f'SELECT {number}', 'SELECT', '', '', 1.0)
+        self.assertEqual(len(slow_queries._pending), 100)
+        slow_queries._pending.clear()
+
+        slow_queries._record('slow', 'SELECT broken', 'SELECT', '', '', 1.0)
+        slow_queries._pending[next(iter(slow_queries._pending))]['count'] = None  # NOT NULL
+        with self.assertLogs('races.slow_queries', 'ERROR'):
+            slow_queries.flush()
+        self.assertEqual(SlowQuery.objects.count(), 0)  # The transaction still works
+
+        # Shapes are only counted (every query normalized) for sampled requests
+        with override_settings(QUERY_INSPECTOR_ENABLED=False, SLOW_QUERY_REPEAT_SAMPLE_RATE=0), \
+                mock.patch.object(slow_queries, 'normalize_sql',
+                                  wraps=slow_queries.normalize_sql) as normalize:
+            self.client.get('/', HTTP_HOST='localhost')
+            self.assertFalse(normalize.called)
+            with override_settings(SLOW_QUERY_REPEAT_SAMPLE_RATE=1):
+                self.client.get('/', HTTP_HOST='localhost')
+            self.assertTrue(normalize.called)
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Performance regression tests: every URL in races/urls.py has a fixed
+    query budget and a render-time ceiling for each type of user.
+
+    The N+1 detector runs in strict mode here, so a template change that
+    adds a query per card or per comment fails loudly.
+    """
+
+    # Seconds any page may take to build with the seeded data
+    RENDER_TIME_CEILING = 0.5
+
+    # Maximum queries per GET request: {url name: {user type: budget}}
+    # Logged-in users pay ~5 queries for session + user loading and saving
+    BUDGETS = {
+        'race-list':       {'anonymous': 2, 'member': 7, 'creator': 7, 'staff': 7},
+        'race-detail':     {'anonymous': 3, 'member': 8, 'creator': 8, 'staff': 8},
+        'race-comments-live': {'anonymous': 0, 'member': 4, 'creator': 4, 'staff': 4},
+        'edit-race':       {'anonymous': 0, 'member': 6, 'creator': 6, 'staff': 6},
+        'delete-race':     {'anonymous': 0, 'member': 6, 'creator': 6, 'staff': 6},
+        'create-race':     {'anonymous': 0, 'member': 5, 'creator': 5, 'staff': 5},
+        'my-races':        {'anonymous': 0, 'member': 6, 'creator': 7, 'staff': 6},
+        # +1 for the comment's live event (deleted with it)
+        'delete-comment':  {'anonymous': 0, 'member': 8, 'creator': 6, 'staff': 6},
+        'request-deletion': {'anonymous': 0, 'member': 6, 'creator': 6, 'staff': 6},
+        'deletion-status': {'anonymous': 0, 'member': 6, 'creator': 6, 'staff': 6},
+        'cancel-deletion': {'anonymous': 0, 'member': 6, 'creator': 6, 'staff': 6},
+        'resized-image':   {'anonymous': 0, 'member': 4, 'creator': 4, 'staff': 4},
+    }
+
+    # Expected status of each GET, so a budget is never met by an error page
+    # 302 = sent to the login page (anonymous) or away with a message
+    STATUSES = {
+        'race-list':       {'anonymous': 200, 'member': 200, 'creator': 200, 'staff': 200},
+        'race-detail':     {'anonymous': 200, 'member': 200, 'creator': 200, 'staff': 200},
+        'race-comments-live': {'anonymous': 204, 'member': 204, 'creator': 204, 'staff': 204},
+        'edit-race':       {'anonymous': 302, 'member': 302, 'creator': 200, 'staff': 200},
+        'delete-race':     {'anonymous': 302, 'member': 302, 'creator': 200, 'staff': 200},
+        'create-race':     {'anonymous': 302, 'member': 200, 'creator': 200, 'staff': 200},
+        'my-races':        {'anonymous': 302, 'member': 200, 'creator': 200, 'staff': 200},
+        'delete-comment':  {'anonymous': 302, 'member': 302, 'creator': 302, 'staff': 302},
+        'request-deletion': {'anonymous': 302, 'member': 200, 'creator': 200, 'staff': 200},
+        'deletion-status': {'anonymous': 302, 'member': 200, 'creator': 200, 'staff': 200},
+        'cancel-deletion': {'anonymous': 302, 'member': 302, 'creator': 302, 'staff': 302},
+        'resized-image':   {'anonymous': 200, 'member': 200, 'creator': 200, 'staff': 200},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Seed a realistic amount of data: a busy race page, several pages
+        of races with mixed approval, distances and difficulties.
+        """
+        from datetime import timedelta
+        from .models import Comment
+
+        cls.member = User.objects.create_user(username='member', password='pass12345')
+        cls.creator = User.objects.create_user(username='creator', password='pass12345')
+        cls.staff = User.objects.create_user(
+            username='staff', password='pass12345', is_staff=True)
+        fans = [User.objects.create_user(username=f'fan{i}') for i in range(20)]
+
+        distances = [choice for choice, _ in Race.DISTANCE_CHOICES]
+        difficulties = [choice for choice, _ in Race.DIFFICULTY_CHOICES]
+        today = timezone.now().date()
+        races = [
+            Race(
+                name=f'Race {i}', description='A fun run ' * 20, city='York',
+                distance=distances[i % len(distances)],
+                custom_distance='15K' if distances[i % len(distances)] == 'OTHER' else '',
+                difficulty=difficulties[i % len(difficulties)],
+                race_date=today + timedelta(days=i), status=1,
+                approved=i % 4 != 0, created_by=cls.creator if i % 2 else fans[i % 20],
+            )
+            for i in range(30)
+        ]
+        Race.objects.bulk_create(races)
+        cls.race = Race.objects.filter(created_by=cls.creator, approved=True).first()
+        Comment.objects.bulk_create([
+            Comment(race=cls.race, author=fans[i % 20], body=f'Comment {i}')
+            for i in range(60)
+        ])
+        cls.comment = Comment.objects.create(race=cls.race, author=cls.member, body='Mine')
+
+    def url_for(self, name):
+        from django.urls import reverse
+        if name in ('race-detail', 'race-comments-live', 'edit-race', 'delete-race'):
+            return reverse(name, args=[self.race.pk])
+        if name == 'delete-comment':
+            return reverse(name, args=[self.comment.pk])
+        if name == 'resized-image':
+            return reverse(name, args=[100, 100, 'race_images/budget.jpg'])
+        return reverse(name)
+
+    def test_every_url_has_a_budget(self):
+        """New URLs must get a budget before they can be merged"""
+        from .urls import urlpatterns
+        names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(names, set(self.BUDGETS))
+        self.assertEqual(names, set(self.STATUSES))
+
+    def test_query_budgets_and_render_time(self):
+        """Every page answers as expected within its query budget and render-time ceiling"""
+        import os
+        import shutil
+        import tempfile
+        import time
+        from PIL import Image
+        from django.db import connection, transaction
+        from django.test import override_settings
+        from django.test.utils import CaptureQueriesContext
+
+        # A real original, and an empty resize cache before each request,
+        # so resized-image measures the resize path
+        media_root = tempfile.mkdtemp()
+        cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, cache_root, ignore_errors=True)
+        os.makedirs(os.path.join(media_root, 'race_images'))
+        Image.new('RGB', (800, 600), (200, 30, 30)).save(
+            os.path.join(media_root, 'race_images', 'budget.jpg'), 'JPEG')
+
+        users = {
+            'anonymous': None,
+            'member': self.member,
+            'creator': self.creator,
+            'staff': self.staff,
+        }
+        with override_settings(QUERY_INSPECTOR_ENABLED=True, QUERY_INSPECTOR_STRICT=True,
+                               MEDIA_ROOT=media_root, IMAGE_CACHE_ROOT=cache_root):
+            for name, budgets in self.BUDGETS.items():
+                for user_type, budget in budgets.items():
+                    with self.subTest(url=name, user=user_type):
+                        client = self.client_class()
+                        if users[user_type] is not None:
+                            client.force_login(users[user_type])
+                        shutil.rmtree(cache_root, ignore_errors=True)
+                        # Roll back anything the request changes (e.g. deletes)
+                        with transaction.atomic():
+                            with CaptureQueriesContext(connection) as queries:
+                                start = time.perf_counter()
+                                response = client.get(self.url_for(name))
+                                elapsed = time.perf_counter() - start
+                            transaction.set_rollback(True)
+                        self.assertEqual(response.status_code, self.STATUSES[name][user_type])
+                        response.close()
+                        self.assertLessEqual(
+                            len(queries), budget,
+                            '\n'.join(query['sql'] for query in queries.captured_queries))
+                        self.assertLess(elapsed, self.RENDER_TIME_CEILING)
+
+    def test_inspector_flags_repeated_query_shapes(self):
+        """The development middleware reports an N+1 loop"""
+        from django.http import HttpResponse
+        from django.test import RequestFactory, override_settings
+        from config.middleware import (
+            QueryInspectorMiddleware, QueryLogMiddleware, RepeatedQueryError)
+
+        def n_plus_one_view(request):
+            for user in User.objects.all()[:6]:
+                User.objects.get(pk=user.pk)
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/')
+        with override_settings(QUERY_INSPECTOR_ENABLED=True, QUERY_INSPECTOR_LIMIT=5):
+            with self.assertLogs('races.slow_queries', 'ERROR'):
+                response = QueryLogMiddleware(QueryInspectorMiddleware(n_plus_one_view))(request)
+            self.assertEqual(response['X-Repeated-Queries'], '1')
+
+            with override_settings(QUERY_INSPECTOR_STRICT=True):
+                with self.assertRaises(RepeatedQueryError):
+                    QueryLogMiddleware(QueryInspectorMiddleware(n_plus_one_view))(request)
+
+
+class LoadTestHarnessTestCase(TestCase):
+    """
+    Test the synthetic data generator and the in-process load-test harness.
+    """
+
+    def test_seed_perf_data_bulk_creates_rows(self):
+        """seed_perf_data creates the requested numbers of rows"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import Comment
+
+        call_command('seed_perf_data', users=5, races=30, comments=80,
+                     batch_size=16, seed=1, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='perf_user_').count(), 5)
+        self.assertEqual(Race.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 80)
+        self.assertTrue(Race.objects.filter(status=1, approved=True).exists())
+
+    def test_percentiles_and_inprocess_run(self):
+        """A single in-process client reports per-route latency percentiles"""
+        from config.wsgi import application
+        from . import loadtest
+
+        self.assertEqual(loadtest.percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 0.95), 10)
+        self.assertEqual(loadtest.percentile([1, 2, 3, 4], 0.5), 2)
+
+        creator = User.objects.create_user(username='creator', password='pass12345')
+        Race.objects.create(
+            name='Load Race', description='Fast', city='York',
+            race_date=timezone.now().date(), status=1, approved=True,
+            created_by=creator,
+        )
+        routes = ['race-list', 'race-detail', 'my-races']
+        context = loadtest.build_context(routes, username='creator', seed=3)
+        report = loadtest.run_clients(
+            lambda: loadtest.InProcessTransport(application, context.cookie),
+            context, routes, concurrency=1, requests=9, warmup=0)
+
+        self.assertEqual(report['total']['requests'], 9)
+        self.assertEqual(report['total']['errors'], 0)
+        self.assertEqual(set(report['routes']), set(routes))
+        for stats in report['routes'].values():
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+
+
+class TemplateBenchmarkTestCase(TestCase):
+    """
+    Test the template benchmark suite renders without touching the database.
+    """
+
+    def test_cases_render_without_queries(self):
+        """Fixed contexts are in-memory, so benchmark renders run zero queries"""
+        from . import template_bench
+
+        with self.assertNumQueries(0):
+            result = template_bench.run(
+                repeat=1, include=['[6 cards]', '[100 comments]', 'inheritance', 'url_tag'],
+                iterations=20)
+        self.assertIn('race_list[6 cards]', result['cases'])
+        self.assertIn('race_detail[100 comments]', result['cases'])
+        self.assertNotIn('race_list[600 cards]', result['cases'])
+
+        html = dict(template_bench.page_cases())['race_detail[100 comments]']()
+        self.assertEqual(html.count('Comment number'), 100)
+
+    def test_compare_scales_by_calibration_and_applies_tolerance(self):
+        """Only cases slower than the tolerance on a calibrated basis regress"""
+        from .template_bench import compare
+
+        baseline = {'calibration_ms': 10.0,
+                    'cases': {'a': {'min_ms': 1.0}, 'b': {'min_ms': 1.0}}}
+        # Machine twice as slow: 'a' is unchanged, 'b' really regressed
+        current = {'calibration_ms': 20.0,
+                   'cases': {'a': {'min_ms': 2.1}, 'b': {'min_ms': 3.0}}}
+        self.assertEqual(compare(baseline, current, 0.2), [('b', 1.0, 1.5, 1.5)])
+        self.assertEqual(compare(baseline, current, 0.2, min_delta_ms=1.0), [])
+
+
+class StartupWarmUpTestCase(TestCase):
+    """
+    Test the start-up helpers used by gunicorn.conf.py and startup_profile.
+    """
+
+    def test_warm_up_compiles_templates_and_builds_resolver(self):
+        """warm_up() compiles the project templates and reports its timings"""
+        from config.startup import template_names, warm_up
+
+        names = {name for _, name in template_names()}
+        self.assertIn('races/race_list.html', names)
+        self.assertIn('base.html', names)
+
+        timings = warm_up(database=False)
+        self.assertGreater(timings['templates_compiled'], 10)
+        self.assertGreater(timings['url_patterns'], 0)
+        self.assertNotIn('database_ms', timings)
+
+    def test_parse_importtime_groups_by_package(self):
+        """-X importtime output is summed per top-level package"""
+        from .management.commands.startup_profile import parse_importtime
+
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       100 |        100 |   django.utils\n"
+            "import time:       300 |        400 | django\n"
+            "import time:        50 |         50 | cloudinary.utils\n"
+        )
+        total, ranked = parse_importtime(stderr)
+        self.assertEqual(total, 450)
+        self.assertEqual(ranked[0], ('django', 400, 2))
+        self.assertEqual(ranked[1], ('cloudinary', 50, 1))
+
+
+class ConnectionPoolTestCase(TestCase):
+    """
+    Test the per-process database connection pool used by the pooled backends.
+    """
+
+    def make_pool(self, alive=True, **options):
+        from config.db_backends.pool import ConnectionPool
+
+        self.created, self.closed = [], []
+
+        def create():
+            self.created.append(object())
+            return self.created[-1]
+
+        return ConnectionPool('default', create=create, is_alive=lambda c: alive,
+                              close=self.closed.append, **options)
+
+    def test_connections_are_reused_and_capped(self):
+        """Released connections are reused; a full pool times out"""
+        from config.db_backends.pool import PoolTimeout
+
+        pool = self.make_pool(max_size=2, timeout=0.05)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        pool.acquire()
+        self.assertEqual(len(self.created), 2)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+        pool.release(first, reusable=False)
+        self.assertEqual(self.closed, [first])
+        self.assertIsNot(pool.acquire(), first)
+
+    def test_idle_connections_are_health_checked(self):
+        """Connections idle past HEALTH_CHECK_AFTER are dropped when dead"""
+        pool = self.make_pool(alive=False, health_check_after=0)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIsNot(pool.acquire(), connection)
+        self.assertEqual(self.closed, [connection])
+
+    def test_health_check_runs_outside_the_pool_lock(self):
+        """A hanging health check does not hold up the other threads"""
+        import threading
+        import time
+
+        checking, finish = threading.Event(), threading.Event()
+
+        def hanging_check(connection):
+            checking.set()
+            finish.wait(5)
+            return True
+
+        pool = self.make_pool(max_size=2, health_check_after=0)
+        pool.is_alive = hanging_check
+        pool.release(pool.acquire())
+        checker = threading.Thread(target=pool.acquire)
+        checker.start()
+        self.assertTrue(checking.wait(5))
+
+        start = time.monotonic()
+        other = pool.acquire()
+        pool.release(other)
+        self.assertLess(time.monotonic() - start, 1)
+        finish.set()
+        checker.join()
+
+    def test_postgresql_connections_are_discarded_before_reuse(self):
+        """Session state (the scheduler's advisory lock) never reaches the next thread"""
+        from contextlib import nullcontext
+        from types import SimpleNamespace
+        from django.db import connection
+        from config.db_backends.postgresql.base import DatabaseWrapper
+
+        statements = []
+        raw = SimpleNamespace(
+            autocommit=False,
+            rollback=lambda: statements.append('ROLLBACK'),
+            cursor=lambda: nullcontext(SimpleNamespace(execute=statements.append)))
+        wrapper = DatabaseWrapper(dict(connection.settings_dict, ENGINE='config.db_backends.postgresql'),
+                                  alias='pg_pool_test')
+        self.assertTrue(wrapper.reset_pooled_connection(raw))
+        self.assertEqual(statements, ['ROLLBACK', 'DISCARD ALL'])
+        self.assertTrue(raw.autocommit)
+
+    def test_django_connections_return_to_the_pool(self):
+        """Closing a Django connection parks the raw connection for reuse"""
+        import os
+        import tempfile
+        from django.db import connection
+        from config.db_backends.pool import pool_stats
+        from config.db_backends.sqlite3.base import DatabaseWrapper
+
+        self.assertEqual(connection.settings_dict['ENGINE'], 'config.db_backends.sqlite3')
+        directory = tempfile.mkdtemp()
+        settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, 'pool.db'))
+        wrapper = DatabaseWrapper(settings_dict, alias='pool_test')
+
+        wrapper.ensure_connection()
+        first = wrapper.connection
+        wrapper.close()
+        self.assertEqual(pool_stats()['pool_test']['idle'], 1)
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, first)
+
+        # Closed inside an atomic block: really closed, never handed out again
+        wrapper.in_atomic_block = True
+        wrapper.close()
+        self.assertEqual(pool_stats()['pool_test']['size'], 0)
+
+
+class ReplicaRoutingTestCase(TestCase):
+    """
+    Test read-replica routing and read-your-writes pinning.
+    """
+
+    def test_router_uses_replicas_only_for_allowed_reads(self):
+        """Reads go to a replica only when allowed and before any write"""
+        from unittest import mock
+        from django.contrib.sessions.models import Session
+        from config import db_routers
+
+        router = db_routers.ReplicaRouter()
+        with mock.patch.object(db_routers, 'replica_aliases', return_value=['replica_1']):
+            self.assertEqual(router.db_for_read(Race), 'default')
+
+            allowed = db_routers.replica_reads_allowed.set(True)
+            written = db_routers.request_has_written.set(False)
+            try:
+                self.assertEqual(router.db_for_read(Race), 'replica_1')
+                self.assertEqual(router.db_for_read(Session), 'default')
+                self.assertEqual(router.db_for_write(Race), 'default')
+                # Read-your-writes inside the same request
+                self.assertEqual(router.db_for_read(Race), 'default')
+            finally:
+                db_routers.replica_reads_allowed.reset(allowed)
+                db_routers.request_has_written.reset(written)
+
+            self.assertFalse(router.allow_migrate('replica_1', 'races'))
+            self.assertTrue(router.allow_migrate('default', 'races'))
+
+    def test_middleware_allows_replica_reads_and_pins_after_writes(self):
+        """Listed GET views may use replicas; a POST pins the browser to the primary"""
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from django.urls import resolve
+        from config import db_routers
+        from config.middleware import ReplicaRoutingMiddleware
+
+        seen = []
+
+        def view(request):
+            seen.append(db_routers.replica_reads_allowed.get())
+            return HttpResponse('ok')
+
+        def get_response(request):
+            # What Django's handler does between middleware and view
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+
+        def run(request, path):
+            request.resolver_match = resolve(path)
+            return middleware(request)
+
+        factory = RequestFactory()
+        response = run(factory.get('/'), '/')
+        self.assertEqual(seen, [True])
+        self.assertNotIn(ReplicaRoutingMiddleware.PIN_COOKIE, response.cookies)
+
+        run(factory.get('/create-race/'), '/create-race/')
+        self.assertEqual(seen[-1], False)
+
+        response = run(factory.post('/create-race/'), '/create-race/')
+        pin = response.cookies[ReplicaRoutingMiddleware.PIN_COOKIE].value
+
+        pinned = factory.get('/')
+        pinned.COOKIES[ReplicaRoutingMiddleware.PIN_COOKIE] = pin
+        run(pinned, '/')
+        self.assertEqual(seen[-1], False)
+
+
+class AdminLargeTableTestCase(TestCase):
+    """
+    Test the large-table admin changelists (estimated counts, keyset paging).
+    """
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            username='boss', email='boss@example.com', password='pass12345')
+        self.client.force_login(self.admin_user)
+        self.races = [
+            Race.objects.create(
+                name=f'Race {number}', description='Fun', city='Leeds',
+                race_date=timezone.now().date(), created_by=self.admin_user,
+            )
+            for number in range(5)
+        ]
+
+    def test_estimate_count_needs_postgresql(self):
+        """Databases without planner statistics fall back to an exact count"""
+        from .admin_scale import EstimatedCountPaginator, estimate_count
+
+        self.assertIsNone(estimate_count(Race.objects.all()))
+        self.assertEqual(EstimatedCountPaginator(Race.objects.all(), 2).count, 5)
+
+    def test_keyset_paging_and_autocomplete_filter(self):
+        """Large-table mode pages with a cursor and filters comments by race"""
+        from unittest import mock
+        from django.test import override_settings
+        from .admin import RaceAdmin
+        from .models import Comment
+
+        with override_settings(ADMIN_LARGE_TABLE_MODE=True), \
+                mock.patch.object(RaceAdmin, 'list_per_page', 2):
+            response = self.client.get('/admin/races/race/', HTTP_HOST='localhost')
+            names = [race.name for race in response.context['cl'].result_list]
+            self.assertEqual(names, ['Race 4', 'Race 3'])
+            next_url = response.context['cl'].next_cursor_url
+            self.assertIn('cursor=', next_url)
+
+            response = self.client.get('/admin/races/race/' + next_url, HTTP_HOST='localhost')
+            names = [race.name for race in response.context['cl'].result_list]
+            self.assertEqual(names, ['Race 2', 'Race 1'])
+            self.assertContains(response, 'Older')
+            self.assertContains(response, 'Newest')
+
+            Comment.objects.create(race=self.races[0], author=self.admin_user, body='First')
+            Comment.objects.create(race=self.races[1], author=self.admin_user, body='Second')
+            response = self.client.get(
+                f'/admin/races/comment/?race__id__exact={self.races[1].pk}',
+                HTTP_HOST='localhost')
+            self.assertEqual([comment.body for comment in response.context['cl'].result_list],
+                             ['Second'])
+            self.assertContains(response, 'autocomplete-filter-race')
+
+
+class BulkModerationTestCase(TestCase):
+    """
+    Test the set-based moderation actions and their audit trail.
+    """
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            username='moderator', email='mod@example.com', password='pass12345')
+        self.creator = User.objects.create_user(
+            username='maker', email='maker@example.com', password='pass12345')
+        Race.objects.bulk_create([
+            Race(name=f'Pending {number}', description='Fun', city='Bath',
+                 race_date=timezone.now().date(), status=1, approved=number < 2,
+                 created_by=self.creator)
+            for number in range(30)
+        ])
+
+    def test_approve_races_uses_constant_queries(self):
+        """Approving many races is one SELECT, one UPDATE, one log and one email insert"""
+        from .models import ModerationLog, OutboxEmail
+        from .moderation import approve_races
+        from .signals import races_moderated
+
+        received = []
+        races_moderated.connect(lambda sender, **kwargs: received.append(kwargs), weak=False,
+                                dispatch_uid='test-races-moderated')
+        self.addCleanup(races_moderated.disconnect, dispatch_uid='test-races-moderated')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # SAVEPOINT, SELECT ids, UPDATE, INSERT log, SELECT races + creators,
+            # INSERT emails, RELEASE
+            with self.assertNumQueries(7):
+                approved = approve_races(Race.objects.all(), self.admin_user)
+
+        self.assertEqual(approved, 28)
+        self.assertFalse(Race.objects.filter(approved=False).exists())
+        self.assertEqual(Race.objects.filter(approved_by=self.admin_user).count(), 28)
+        self.assertEqual(ModerationLog.objects.filter(action='approve_race').count(), 28)
+        self.assertEqual(OutboxEmail.objects.filter(kind='race_approved').count(), 28)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(len(received[0]['ids']), 28)
+
+    def test_review_deletion_requests_only_touches_pending(self):
+        """Approve/reject stamp the reviewer and skip already reviewed requests"""
+        from .models import AccountDeletionRequest, ModerationLog
+        from .moderation import approve_deletion_requests, reject_deletion_requests
+
+        others = [User.objects.create_user(username=f'leaver{n}') for n in range(3)]
+        requests = [AccountDeletionRequest.objects.create(user=user) for user in others]
+        AccountDeletionRequest.objects.filter(pk=requests[2].pk).update(status='REJECTED')
+
+        self.assertEqual(approve_deletion_requests(
+            AccountDeletionRequest.objects.filter(pk__in=[requests[0].pk, requests[2].pk]),
+            self.admin_user, "ok"), 1)
+        self.assertEqual(reject_deletion_requests(
+            AccountDeletionRequest.objects.all(), self.admin_user, "no"), 1)
+
+        statuses = dict(AccountDeletionRequest.objects.values_list('user__username', 'status'))
+        self.assertEqual(statuses, {'leaver0': 'APPROVED', 'leaver1': 'REJECTED',
+                                    'leaver2': 'REJECTED'})
+        approved = AccountDeletionRequest.objects.get(pk=requests[0].pk)
+        self.assertEqual(approved.reviewed_by, self.admin_user)
+        self.assertIsNotNone(approved.reviewed_at)
+        self.assertEqual(ModerationLog.objects.count(), 2)
+
+
+    def test_change_form_approval_queues_the_deletion(self):
+        """Approving on the change form emails the user and queues the deletion job"""
+        from types import SimpleNamespace
+        from django.contrib.admin import site
+        from django.test import RequestFactory
+        from .maintenance import queue_account_deletions
+        from .models import AccountDeletionRequest, Job, ModerationLog, OutboxEmail
+
+        leaver = User.objects.create_user(username='leaver', email='leaver@example.com')
+        deletion_request = AccountDeletionRequest.objects.create(user=leaver)
+        request = RequestFactory().post('/admin/')
+        request.user = self.admin_user
+        deletion_request.status = 'APPROVED'
+        deletion_request.admin_notes = 'Sorry to see you go'
+        with self.captureOnCommitCallbacks(execute=True):
+            site._registry[AccountDeletionRequest].save_model(
+                request, deletion_request, SimpleNamespace(changed_data=['status', 'admin_notes']),
+                True)
+
+        deletion_request.refresh_from_db()
+        self.assertEqual(deletion_request.status, 'APPROVED')
+        self.assertEqual(deletion_request.reviewed_by, self.admin_user)
+        self.assertEqual(ModerationLog.objects.filter(action='approve_deletion').count(), 1)
+        self.assertIn('Sorry to see you go',
+                      OutboxEmail.objects.get(kind='deletion_approved', to='leaver@example.com').body)
+        self.assertEqual(Job.objects.filter(task='races.execute_account_deletion').count(), 1)
+
+        # Approved some other way (here: an UPDATE) - the hourly sweep queues it
+        other = AccountDeletionRequest.objects.create(
+            user=User.objects.create_user(username='quiet'))
+        AccountDeletionRequest.objects.filter(pk=other.pk).update(status='APPROVED')
+        self.assertEqual(queue_account_deletions(), "2 approved request(s) queued")
+        self.assertEqual(Job.objects.filter(task='races.execute_account_deletion').count(), 2)
+
+    def test_change_form_race_approval_queues_the_email(self):
+        """Ticking "approved" on a race's change form is logged and emails the creator"""
+        from types import SimpleNamespace
+        from django.contrib.admin import site
+        from django.test import RequestFactory
+        from .models import ModerationLog, OutboxEmail
+
+        race = Race.objects.filter(approved=False).first()
+        request = RequestFactory().post('/admin/')
+        request.user = self.admin_user
+        race.approved = True
+        race.city = 'Wells'
+        site._registry[Race].save_model(
+            request, race, SimpleNamespace(changed_data=['approved', 'city']), True)
+
+        race.refresh_from_db()
+        self.assertTrue(race.approved)
+        self.assertEqual(race.city, 'Wells')
+        self.assertEqual(race.approved_by, self.admin_user)
+        self.assertEqual(ModerationLog.objects.filter(action='approve_race').count(), 1)
+        self.assertEqual(OutboxEmail.objects.filter(kind='race_approved',
+                                                    to='maker@example.com').count(), 1)
+
+class AccountDeletionExecutorTestCase(TestCase):
+    """
+    Test the batched, resumable account deletion executor.
+    """
+
+    def setUp(self):
+        from .models import AccountDeletionRequest, Comment
+
+        self.leaver = User.objects.create_user(username='leaver', password='pass12345')
+        self.stayer = User.objects.create_user(username='stayer', password='pass12345')
+        own_race = Race.objects.create(
+            name='Leaver Race', description='Bye', city='Hull',
+            race_date=timezone.now().date(), created_by=self.leaver)
+        self.other_race = Race.objects.create(
+            name='Stayer Race', description='Hi', city='Hull',
+            race_date=timezone.now().date(), created_by=self.stayer)
+        Comment.objects.bulk_create(
+            [Comment(race=self.other_race, author=self.leaver, body=f'mine {n}') for n in range(7)]
+            + [Comment(race=own_race, author=self.stayer, body=f'theirs {n}') for n in range(3)]
+            + [Comment(race=self.other_race, author=self.stayer, body='kept')]
+        )
+        self.deletion_request = AccountDeletionRequest.objects.create(user=self.leaver)
+        self.deletion_request.approve(self.stayer, 'ok')
+
+    def test_deletes_in_batches_and_completes(self):
+        """Comments, races and the user go in small batches, then COMPLETED"""
+        from .account_deletion import execute
+        from .models import AccountDeletionRequest, Comment
+
+        summary = execute(self.deletion_request, batch_size=3)
+
+        self.assertEqual(summary, {'request': self.deletion_request.pk, 'username': 'leaver',
+                                   'comments': 10, 'races': 1})
+        self.assertFalse(User.objects.filter(username='leaver').exists())
+        self.assertEqual(list(Comment.objects.values_list('body', flat=True)), ['kept'])
+        self.assertEqual(list(Race.objects.all()), [self.other_race])
+        finished = AccountDeletionRequest.objects.get(pk=self.deletion_request.pk)
+        self.assertEqual(finished.status, 'COMPLETED')
+        self.assertIsNone(finished.user)
+        self.assertEqual((finished.deleted_comments, finished.deleted_races), (10, 1))
+
+    def test_resumes_after_interruption(self):
+        """A crash mid-way leaves the request APPROVED and the next run finishes it"""
+        from unittest import mock
+        from django.core.management import call_command
+        from io import StringIO
+        from . import account_deletion
+        from .models import AccountDeletionRequest
+
+        original = account_deletion.delete_in_batches
+
+        def crash_on_races(queryset, *args, **kwargs):
+            if queryset.model is Race:
+                raise RuntimeError("worker killed")
+            return original(queryset, *args, **kwargs)
+
+        with mock.patch.object(account_deletion, 'delete_in_batches', crash_on_races):
+            with self.assertRaises(RuntimeError):
+                account_deletion.execute(self.deletion_request, batch_size=4)
+
+        interrupted = AccountDeletionRequest.objects.get(pk=self.deletion_request.pk)
+        self.assertEqual(interrupted.status, 'APPROVED')
+        self.assertEqual(interrupted.deleted_comments, 10)
+        self.assertFalse(User.objects.get(username='leaver').is_active)
+
+        out = StringIO()
+        call_command('process_account_deletions', pause=0, stdout=out)
+        self.assertIn('0 comment(s), 1 race(s)', out.getvalue())
+        self.assertEqual(AccountDeletionRequest.objects.get(pk=self.deletion_request.pk).status,
+                         'COMPLETED')
+
+
+class RaceSoftDeleteTestCase(TestCase):
+    """
+    Test soft-deleting races and the batched background purge.
+    """
+
+    def setUp(self):
+        from .models import Comment
+
+        self.creator = User.objects.create_user(username='racer', password='pass12345')
+        self.race = Race.objects.create(
+            name='Huge Thread', description='Chatty', city='Leeds',
+            race_date=timezone.now().date(), status=1, approved=True,
+            created_by=self.creator)
+        Comment.objects.bulk_create(
+            [Comment(race=self.race, author=self.creator, body=f'c{n}') for n in range(25)])
+
+    def test_delete_view_hides_race_in_constant_queries(self):
+        """Deleting only stamps deleted_at; the race is hidden everywhere at once"""
+        from .models import Comment, Job
+
+        self.client.force_login(self.creator)
+        # session, user, race, one UPDATE, queue the purge job, session save
+        # - not one query per comment
+        with self.assertNumQueries(10):
+            response = self.client.post(f'/race/{self.race.pk}/delete/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 302)
+
+        self.assertFalse(Race.objects.filter(pk=self.race.pk).exists())
+        self.assertTrue(Race.all_objects.filter(pk=self.race.pk).exists())
+        self.assertTrue(Job.objects.filter(task='races.purge_race').exists())
+        self.assertEqual(Comment.objects.count(), 25)
+        self.assertEqual(self.client.get(f'/race/{self.race.pk}/', HTTP_HOST='localhost')
+                         .status_code, 404)
+
+    def test_purge_removes_comments_then_race(self):
+        """The purge command deletes the comments in batches, then the race row"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import Comment
+
+        self.race.soft_delete()
+        out = StringIO()
+        call_command('purge_deleted_races', batch_size=10, pause=0, stdout=out)
+
+        self.assertIn(f'Purged race {self.race.pk} (25 comment(s))', out.getvalue())
+        self.assertFalse(Race.all_objects.exists())
+        self.assertFalse(Comment.objects.exists())
+
+
+class JobQueueTestCase(TestCase):
+    """
+    Test the database job queue: idempotency, retries and the worker command.
+    """
+
+    def setUp(self):
+        from . import jobs
+
+        self.calls = []
+        self.failures_left = 0
+
+        def record(value):
+            if self.failures_left:
+                self.failures_left -= 1
+                raise RuntimeError("flaky")
+            self.calls.append(value)
+
+        jobs.registry['tests.record'] = record
+        self.addCleanup(jobs.registry.pop, 'tests.record')
+
+    def test_idempotency_key_and_worker_run(self):
+        """The same key queues one job; run_workers --burst runs it"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .jobs import enqueue
+        from .models import Job
+
+        first = enqueue('tests.record', key='once', value=1)
+        second = enqueue('tests.record', key='once', value=2)
+        enqueue('tests.record', value=3)
+        self.assertEqual(first.pk, second.pk)
+
+        call_command('run_workers', burst=True, stdout=StringIO())
+        self.assertEqual(sorted(self.calls), [1, 3])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+
+    def test_failed_job_retries_with_backoff_then_fails(self):
+        """Failures are re-queued later until max_attempts, then marked failed"""
+        from .jobs import enqueue, run_next
+        from .models import Job
+
+        self.failures_left = 5
+        job = enqueue('tests.record', max_attempts=2, value=1)
+
+        self.assertTrue(run_next('test-worker'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('flaky', job.last_error)
+        self.assertFalse(run_next('test-worker'))  # Not due yet
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertTrue(run_next('test-worker'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(self.calls, [])
+
+    def test_only_jobs_without_a_heartbeat_are_requeued(self):
+        """A long job whose worker is alive stays running; a silent one is re-queued"""
+        from datetime import timedelta
+        from . import jobs
+        from .models import Job
+
+        long_ago = timezone.now() - timedelta(hours=2)
+        requeued_while_running = []
+
+        def long_task():
+            # Started hours ago, but its worker checked in when it claimed it
+            Job.objects.filter(task='tests.long').update(started_at=long_ago)
+            requeued_while_running.append(jobs.requeue_stale())
+
+        jobs.registry['tests.long'] = long_task
+        self.addCleanup(jobs.registry.pop, 'tests.long')
+        job = jobs.enqueue('tests.long')
+        self.assertTrue(jobs.run_next('test-worker'))
+        self.assertEqual(requeued_while_running, [0])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+        lost = jobs.enqueue('tests.record', value=1)
+        Job.objects.filter(pk=lost.pk).update(
+            status=Job.RUNNING, started_at=long_ago, heartbeat_at=long_ago)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        lost.refresh_from_db()
+        self.assertEqual(lost.status, Job.QUEUED)
+
+    def test_admin_shows_queue_stats(self):
+        """Staff see queue depth above the job list"""
+        from .jobs import enqueue
+
+        enqueue('tests.record', value=1)
+        admin_user = User.objects.create_superuser(
+            username='ops', email='ops@example.com', password='pass12345')
+        self.client.force_login(admin_user)
+        response = self.client.get('/admin/races/job/', HTTP_HOST='localhost')
+        self.assertEqual(response.context['queue_stats']['counts']['queued'], 1)
+        self.assertContains(response, 'Due now')
+
+
+class MaintenanceSchedulerTestCase(TestCase):
+    """
+    Test the periodic scheduler, its leader lease and the maintenance jobs.
+    """
+
+    def test_due_jobs_run_once_per_interval(self):
+        """A tick runs the due jobs; the next tick finds nothing due"""
+        from datetime import timedelta
+        from django.contrib.sessions.backends.db import SessionStore
+        from django.contrib.sessions.models import Session
+        from .models import ScheduledTask
+        from .scheduler import tick
+
+        session = SessionStore()
+        session.create()
+        Session.objects.filter(pk=session.session_key).update(
+            expire_date=timezone.now() - timedelta(days=1))
+        creator = User.objects.create_user(username='oldtimer')
+        old = Race.objects.create(
+            name='Last Year', description='Done', city='Bath', status=1, approved=True,
+            race_date=timezone.now().date() - timedelta(days=400), created_by=creator)
+
+        ran = tick()
+        self.assertIn('clear_expired_sessions', ran)
+        self.assertIn('archive_past_races', ran)
+        self.assertFalse(Session.objects.filter(pk=session.session_key).exists())
+        old.refresh_from_db()
+        self.assertEqual(old.status, 2)
+        self.assertTrue(old.is_visible_to_public)  # Archived races keep their page
+        state = ScheduledTask.objects.get(name='archive_past_races')
+        self.assertTrue(state.last_succeeded)
+        self.assertEqual(state.last_result, '1 race(s) archived')
+
+        self.assertEqual(tick(), [])
+
+    def test_job_is_skipped_while_another_process_holds_the_lease(self):
+        """Only the leader runs a job"""
+        from datetime import timedelta
+        from .models import ScheduledTask
+        from .scheduler import registry, run_job
+
+        job = registry['clear_expired_sessions']
+        ScheduledTask.objects.create(name=job.name, locked_by='other-node:1:1',
+                                     locked_until=timezone.now() + timedelta(minutes=5))
+        self.assertFalse(run_job(job, force=True))
+
+        ScheduledTask.objects.filter(name=job.name).update(
+            locked_until=timezone.now() - timedelta(seconds=1))  # Lease expired
+        self.assertTrue(run_job(job, force=True))
+        self.assertEqual(ScheduledTask.objects.get(name=job.name).locked_by, '')
+
+    def test_creator_can_edit_and_delete_an_archived_race(self):
+        """Archiving keeps the race editable and deletable by its creator"""
+        from datetime import timedelta
+        from .maintenance import archive_past_races
+
+        creator = User.objects.create_user(username='oldtimer', password='pass12345')
+        old = Race.objects.create(
+            name='Last Year', description='Done', city='Bath', status=1, approved=True,
+            race_date=timezone.now().date() - timedelta(days=400), created_by=creator)
+        archive_past_races()
+
+        self.client.force_login(creator)
+        self.assertContains(self.client.get('/my-races/', HTTP_HOST='localhost'), 'Archived')
+        response = self.client.post(f'/race/{old.pk}/edit/', {
+            'name': 'Last Year (results)', 'description': 'Done and dusted',
+            'distance': '5K', 'difficulty': 'EASY_PEASY', 'race_date': old.race_date,
+            'city': 'Bath', 'country': 'UK'}, HTTP_HOST='localhost')
+        self.assertRedirects(response, f'/race/{old.pk}/', fetch_redirect_response=False)
+        old.refresh_from_db()
+        self.assertEqual((old.name, old.status), ('Last Year (results)', 2))
+
+        response = self.client.post(f'/race/{old.pk}/delete/', HTTP_HOST='localhost')
+        self.assertRedirects(response, '/my-races/', fetch_redirect_response=False)
+
+
+class EmailOutboxTestCase(TestCase):
+    """
+    Test the email outbox: queueing with the change and batched sending.
+    """
+
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass12345')
+        self.fan = User.objects.create_user(username='fan', password='pass12345')
+        self.race = Race.objects.create(
+            name='Mud Run', description='Muddy', city='York', status=1, approved=True,
+            race_date=timezone.now().date(), created_by=self.creator)
+
+    def test_comment_queues_email_and_sender_reuses_one_connection(self):
+        """A new comment queues an email; the sender sends the batch over one connection"""
+        from unittest import mock
+        from django.core import mail
+        from django.test import override_settings
+        from .models import OutboxEmail
+        from .outbox import send_pending
+
+        self.client.force_login(self.fan)
+        for number in range(3):
+            self.client.post(f'/race/{self.race.pk}/', {'body': f'See you there {number}'},
+                             HTTP_HOST='localhost')
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.PENDING).count(), 3)
+
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            from django.core.mail.backends.locmem import EmailBackend
+            with mock.patch.object(EmailBackend, 'open', autospec=True,
+                                   side_effect=lambda backend: None) as opened:
+                self.assertEqual(send_pending(rate=0), (3, 0))
+            self.assertEqual(opened.call_count, 1)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ['owner@example.com'])
+        self.assertIn('Mud Run', mail.outbox[0].subject)
+        self.assertIn('fan commented', mail.outbox[0].body)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 3)
+
+    def test_failed_send_is_retried_later(self):
+        """A sending error leaves the email pending with a later send_after"""
+        from unittest import mock
+        from .models import OutboxEmail
+        from .outbox import queue, render, send_pending
+
+        queue([render('race_approved', 'owner@example.com',
+                      {'username': 'owner', 'race_name': 'Mud Run', 'race_id': self.race.pk})])
+        broken = mock.Mock()
+        broken.send_messages.side_effect = OSError("connection refused")
+
+        self.assertEqual(send_pending(rate=0, connection=broken), (0, 1))
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(email.send_after, timezone.now())
+        self.assertIn('connection refused', email.last_error)
+        self.assertEqual(send_pending(rate=0, connection=broken), (0, 0))  # Not due yet
+
+    def test_overlapping_senders_send_each_email_once(self):
+        """A second sender starting mid-batch skips the emails the first one claimed"""
+        from datetime import timedelta
+        from django.core import mail
+        from django.core.mail.backends.locmem import EmailBackend
+        from .models import OutboxEmail
+        from .outbox import queue, render, send_pending
+
+        queue([render('race_approved', f'owner{number}@example.com',
+                      {'username': 'owner', 'race_name': 'Mud Run', 'race_id': self.race.pk})
+               for number in range(3)])
+        overlapping = []
+
+        class OverlappingBackend(EmailBackend):
+            def send_messages(self, messages):
+                if not overlapping:
+                    # Another sender (e.g. `manage.py send_outbox`) runs meanwhile
+                    overlapping.append(send_pending(rate=0, connection=EmailBackend()))
+                return super().send_messages(messages)
+
+        self.assertEqual(send_pending(rate=0, connection=OverlappingBackend()), (1, 0))
+        self.assertEqual(overlapping, [(2, 0)])
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['owner0@example.com', 'owner1@example.com', 'owner2@example.com'])
+
+        # A claim left by a sender that died is re-queued after the timeout
+        email = OutboxEmail.objects.first()
+        OutboxEmail.objects.filter(pk=email.pk).update(
+            status=OutboxEmail.SENDING, claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(send_pending(rate=0, connection=EmailBackend()), (1, 0))
+
+
+class ViewCounterTestCase(TestCase):
+    """
+    Test the write-buffered race view counters.
+    """
+
+    def setUp(self):
+        self.creator = User.objects.create_user(username='owner', password='pass12345')
+        self.races = [
+            Race.objects.create(
+                name=f'Counted Run {number}', description='Fun', city='Leeds', status=1,
+                approved=True, race_date=timezone.now().date(), created_by=self.creator)
+            for number in range(3)
+        ]
+
+    def test_views_are_buffered_and_flushed_in_one_update(self):
+        """Page views cost no SQL; one flush adds every race's total"""
+        from .counters import CounterBuffer
+
+        buffer = CounterBuffer(Race, 'view_count', 'test_views')
+        for _ in range(5):
+            buffer.add(self.races[0].pk)
+        buffer.add(self.races[1].pk, 2)
+        self.assertEqual(buffer.pending(), {self.races[0].pk: 5, self.races[1].pk: 2})
+
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer.flush(), 2)
+        counts = dict(Race.objects.values_list('pk', 'view_count'))
+        self.assertEqual(counts, {self.races[0].pk: 5, self.races[1].pk: 2, self.races[2].pk: 0})
+        self.assertEqual((buffer.pending(), buffer.lag()), ({}, 0.0))
+
+        # The race page records its view in the process-wide buffer
+        from . import counters
+        self.client.get(f'/race/{self.races[2].pk}/', HTTP_HOST='localhost')
+        counters.flush_all()
+        self.assertEqual(Race.objects.get(pk=self.races[2].pk).view_count, 1)
+
+    def test_failed_flush_keeps_the_increments(self):
+        """A database error puts the increments back for the next flush"""
+        from unittest import mock
+        from .counters import CounterBuffer
+
+        buffer = CounterBuffer(Race, 'view_count', 'test_views')
+        buffer.add(self.races[0].pk, 3)
+        with mock.patch.object(CounterBuffer, 'write', side_effect=RuntimeError("db down")):
+            with self.assertLogs('races.counters', 'WARNING'):
+                self.assertEqual(buffer.flush(), 0)
+        buffer.add(self.races[0].pk)
+        self.assertEqual(buffer.pending(), {self.races[0].pk: 4})
+        self.assertGreaterEqual(buffer.lag(), 0.0)
+
+        buffer.flush()
+        self.assertEqual(Race.objects.get(pk=self.races[0].pk).view_count, 4)
+
+
+class TrendingRacesTestCase(TestCase):
+    """
+    Test the incrementally maintained trending ranking.
+    """
+
+    def setUp(self):
+        from datetime import date, timedelta
+
+        self.creator = User.objects.create_user(username='owner', password='pass12345')
+        self.admin_user = User.objects.create_user(
+            username='boss', password='pass12345', is_staff=True)
+        self.races = [
+            Race.objects.create(
+                name=f'Trend Run {number}', description='Fun', city='Bath', status=1,
+                approved=False, race_date=date.today() + timedelta(days=90),
+                created_by=self.creator)
+            for number in range(3)
+        ]
+
+    def test_events_reorder_the_trending_page(self):
+        """Views and comments move races up; older events count less"""
+        from datetime import timedelta
+        from . import trending
+        from .moderation import approve_races
+
+        with self.captureOnCommitCallbacks(execute=True):
+            approve_races(Race.objects.all(), self.admin_user)
+        first, second, third = self.races
+
+        now = timezone.now()
+        trending.record([first.pk], 50, now - timedelta(hours=96))  # Two half-lives ago: 12.5
+        trending.record_views({second.pk: 20})
+        self.client.force_login(self.creator)
+        self.client.post(f'/race/{third.pk}/', {'body': 'Count me in'}, HTTP_HOST='localhost')
+        self.client.logout()
+
+        self.assertEqual([race.pk for race in trending.trending_races()],
+                         [second.pk, first.pk, third.pk])
+        with self.assertNumQueries(2):  # COUNT for the paginator + the page
+            response = self.client.get('/?sort=trending', HTTP_HOST='localhost')
+        self.assertEqual([race.pk for race in response.context['races']],
+                         [second.pk, first.pk, third.pk])
+        self.assertContains(response, 'sort=trending')
+
+        # A rebuild only sees stored history: the comment (the views above
+        # were never added to view_count and the manual event is not stored)
+        self.assertEqual(trending.rebuild(), 3)
+        self.assertEqual(trending.trending_races().first().pk, third.pk)
+
+    def test_moderation_and_refresh_keep_the_table_in_step(self):
+        """Approving adds races, unapproving removes them, refresh repairs misses"""
+        from .models import TrendingRace
+        from .moderation import approve_races, unapprove_races
+        from .trending import refresh
+
+        with self.captureOnCommitCallbacks(execute=True):
+            approve_races(Race.objects.filter(pk=self.races[0].pk), self.admin_user)
+        self.assertEqual(list(TrendingRace.objects.values_list('race_id', flat=True)),
+                         [self.races[0].pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            unapprove_races(Race.objects.all(), self.admin_user)
+        self.assertFalse(TrendingRace.objects.exists())
+
+        # Approved without the moderation action (e.g. the edit form)
+        Race.objects.filter(pk=self.races[1].pk).update(approved=True)
+        self.assertEqual(refresh()[:2], (0, 1))
+        Race.objects.filter(pk=self.races[1].pk).update(status=2)
+        self.assertEqual(refresh()[:2], (1, 0))
+
+
+class SimilarRacesTestCase(TestCase):
+    """
+    Test the precomputed "You might also like" recommendations.
+    """
+
+    def setUp(self):
+        self.creator = User.objects.create_user(username='owner', password='pass12345')
+
+    def make_race(self, name, description, city='Leeds', distance='5K', approved=True):
+        return Race.objects.create(
+            name=name, description=description, city=city, distance=distance,
+            status=1, approved=approved, race_date=timezone.now().date(),
+            created_by=self.creator)
+
+    def test_rebuild_ranks_by_text_and_features(self):
+        """Shared words and features rank first; the panel is one lookup"""
+        from .similarity import rebuild, similar_races
+
+        zombie = self.make_race('Zombie Night Dash', 'Escape the zombies in the dark')
+        twin = self.make_race('Zombie Escape', 'Zombies chase you through the night')
+        far = self.make_race('Beach Paddle', 'Sand, sea and sunshine', city='Brighton',
+                             distance='10K')
+        self.make_race('Hidden Zombie Run', 'Zombies everywhere', approved=False)
+
+        self.assertEqual(rebuild(), 3)
+        with self.assertNumQueries(1):
+            recommended = list(similar_races(zombie))
+        # Nothing in common with the beach race: it is never a candidate
+        self.assertEqual([race.pk for race in recommended], [twin.pk])
+        self.assertEqual(list(similar_races(far)), [])
+
+        response = self.client.get(f'/race/{zombie.pk}/', HTTP_HOST='localhost')
+        self.assertContains(response, 'You might also like')
+        self.assertContains(response, 'Zombie Escape')
+        self.assertNotContains(response, 'Hidden Zombie Run')
+
+    def test_new_race_updates_neighbour_lists_incrementally(self):
+        """Approving a race computes its list and adds it to similar races' lists"""
+        from .models import Job
+        from .similarity import rebuild, similar_races, update_races
+
+        zombie = self.make_race('Zombie Night Dash', 'Escape the zombies in the dark')
+        self.make_race('Beach Paddle', 'Sand, sea and sunshine', city='Brighton', distance='10K')
+        rebuild()
+
+        newcomer = self.make_race('Zombie Escape', 'Zombies chase you', approved=False)
+        self.client.force_login(self.creator)
+        self.client.post(f'/race/{newcomer.pk}/edit/', {
+            'name': 'Zombie Escape', 'description': 'Zombies chase you through the night',
+            'distance': '5K', 'difficulty': 'EASY_PEASY', 'race_date': newcomer.race_date,
+            'city': 'Leeds', 'country': 'UK'}, HTTP_HOST='localhost')
+        self.assertTrue(Job.objects.filter(task='races.update_similar_races').exists())
+
+        Race.objects.filter(pk=newcomer.pk).update(approved=True)
+        self.assertEqual(update_races([newcomer.pk]), 2)  # Its own list and the zombie race's
+        self.assertEqual(similar_races(zombie)[0].pk, newcomer.pk)
+        self.assertEqual(similar_races(newcomer)[0].pk, zombie.pk)
+
+
+class StatisticsRollupTestCase(TestCase):
+    """
+    Test the rollup counters behind the admin statistics dashboard.
+    """
+
+    def setUp(self):
+        self.creator = User.objects.create_user(username='owner', password='pass12345')
+        self.admin_user = User.objects.create_superuser(
+            username='boss', email='boss@example.com', password='pass12345')
+
+    def counters(self):
+        from .models import StatCounter
+        return {(name, key): value for name, key, value in
+                StatCounter.objects.filter(value__gt=0).values_list('name', 'key', 'value')}
+
+    def test_incremental_counters_match_a_rebuild(self):
+        """Saves, edits, moderation and deletes keep the counters exact"""
+        from datetime import date
+        from .models import Comment
+        from .moderation import approve_races
+        from .rollups import rebuild
+
+        with self.captureOnCommitCallbacks(execute=True):
+            races = [
+                Race.objects.create(
+                    name=f'Stat Run {number}', description='Fun', city='Cork', country='Ireland',
+                    distance='5K', status=1, race_date=date(2025, 7, number + 1),
+                    created_by=self.creator)
+                for number in range(3)
+            ]
+        with self.captureOnCommitCallbacks(execute=True):
+            approve_races(Race.objects.filter(pk=races[0].pk), self.admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            edited = Race.objects.get(pk=races[1].pk)
+            edited.country = 'France'
+            edited.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Race.objects.get(pk=races[2].pk).soft_delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.creator)
+            self.client.post(f'/race/{races[0].pk}/', {'body': 'Great'}, HTTP_HOST='localhost')
+            self.client.post(f'/race/{races[0].pk}/', {'body': 'Again'}, HTTP_HOST='localhost')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/delete-comment/{Comment.objects.first().pk}/', HTTP_HOST='localhost')
+
+        incremental = self.counters()
+        self.assertEqual(incremental[('races_by_country', 'Ireland')], 1)
+        self.assertEqual(incremental[('races_by_country', 'France')], 1)
+        self.assertEqual(incremental[('race_approval', 'pending')], 1)
+        self.assertEqual(incremental[('race_approval', 'approved')], 1)
+        self.assertEqual(incremental[('races_by_month', '2025-07')], 2)
+        self.assertEqual(sum(value for (name, _), value in incremental.items()
+                             if name == 'comments_by_month'), 1)
+
+        rebuild(chunk_size=2)
+        self.assertEqual(self.counters(), incremental)
+
+    def test_dashboard_reads_only_the_counters(self):
+        """The admin dashboard never queries the races or comments tables"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .rollups import rebuild
+
+        Race.objects.create(name='Stat Run', description='Fun', city='Cork', status=1,
+                            race_date=timezone.now().date(), created_by=self.creator)
+        rebuild()
+        self.client.force_login(self.admin_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/races/statcounter/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats']['pending_approvals'], 1)
+        self.assertContains(response, 'Races by country')
+        self.assertFalse([query['sql'] for query in queries
+                          if 'races_race' in query['sql'] or 'races_comment' in query['sql']])
+
+
+    def test_rebuild_action_queues_a_job(self):
+        """The admin action leaves the rebuild to a background worker"""
+        from .jobs import run_next
+        from .models import Job, StatCounter
+        from .rollups import rebuild
+
+        Race.objects.create(name='Stat Run', description='Fun', city='Cork', status=1,
+                            race_date=timezone.now().date(), created_by=self.creator)
+        rebuild()
+        # Not counted yet: the post_save delta waits for a commit that never comes
+        Race.objects.create(name='Stat Run 2', description='Fun', city='Cork', status=1,
+                            race_date=timezone.now().date(), created_by=self.creator)
+        self.client.force_login(self.admin_user)
+        data = {'action': 'rebuild_counters', '_selected_action': [StatCounter.objects.first().pk]}
+        for _ in range(2):
+            response = self.client.post('/admin/races/statcounter/', data, HTTP_HOST='localhost')
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(Job.objects.filter(task='races.rebuild_rollups').count(), 1)
+        self.assertEqual(self.counters()[('race_approval', 'pending')], 1)
+
+        self.assertTrue(run_next('test-worker'))
+        self.assertEqual(self.counters()[('race_approval', 'pending')], 2)
+
+class AsyncViewsTestCase(TestCase):
+    """
+    Test the async race list / race page and the ASGI middleware stack.
+    """
+
+    def setUp(self):
+        self.creator = User.objects.create_user(username='runner', password='pass12345')
+        self.public = Race.objects.create(
+            name='Async Harbour Run', description='Fun', city='Cork', status=1, approved=True,
+            race_date=timezone.now().date(), created_by=self.creator)
+        self.pending = Race.objects.create(
+            name='Async Pending Run', description='Fun', city='Cork', status=1,
+            race_date=timezone.now().date(), created_by=self.creator)
+
+    def async_urls(self):
+        """URLconf with the async views in front of the normal ones"""
+        from types import ModuleType
+        from django.urls import include, path
+        from . import async_views
+
+        urls = ModuleType('async_urls')
+        urls.urlpatterns = [
+            path('', async_views.race_list, name='race-list'),
+            path('race/<int:pk>/', async_views.race_detail, name='race-detail'),
+            path('', include('config.urls')),
+        ]
+        return urls
+
+    def get(self, url, **extra):
+        """Request through the ASGI handler (the view runs on an event loop)"""
+        return self.send('get', url, **extra)
+
+    def send(self, method, url, *args, **extra):
+        from asgiref.sync import async_to_sync
+
+        async def request():
+            return await getattr(self.async_client, method)(url, *args, HTTP_HOST='localhost', **extra)
+        return async_to_sync(request)()
+
+    def test_async_views_render_the_same_pages(self):
+        """Same races, same query counts; no query runs while rendering"""
+        from django.test import override_settings
+
+        with override_settings(ROOT_URLCONF=self.async_urls()):
+            with self.assertNumQueries(2):
+                response = self.get('/')
+            self.assertContains(response, 'Async Harbour Run')
+            self.assertNotContains(response, 'Async Pending Run')
+
+            with self.assertNumQueries(3):
+                response = self.get(f'/race/{self.public.pk}/')
+            self.assertContains(response, 'Async Harbour Run')
+            self.assertEqual(self.get(f'/race/{self.pending.pk}/').status_code, 404)
+
+    def test_logged_in_user_and_comment_post(self):
+        """The creator sees their pending race; posting a comment uses the sync view"""
+        from django.conf import settings
+        from django.test import override_settings
+        from django.utils.module_loading import import_string
+        from .models import Comment
+
+        # Every middleware runs natively under ASGI - none falls back to a thread
+        for dotted_path in settings.MIDDLEWARE:
+            self.assertTrue(getattr(import_string(dotted_path), 'async_capable', False),
+                            dotted_path)
+
+        self.async_client.force_login(self.creator)
+        with override_settings(ROOT_URLCONF=self.async_urls()):
+            response = self.get('/')
+            self.assertContains(response, 'Async Pending Run')
+            self.assertContains(response, 'Hello, runner!')
+
+            response = self.send('post', f'/race/{self.public.pk}/', {'body': 'Posted over ASGI'})
+            self.assertEqual(response.status_code, 302)
+        self.assertTrue(Comment.objects.filter(body='Posted over ASGI').exists())
+
+    def test_async_account_middleware_matches_installed_allauth(self):
+        """Fails when allauth changes: re-check AccountMiddleware and AccountConfig against it"""
+        import inspect
+        import allauth
+        from allauth.account.apps import AccountConfig
+        from allauth.core import context
+        from config.middleware import AccountMiddleware
+
+        self.assertEqual(allauth.__version__, AccountMiddleware.ALLAUTH_VERSION)
+        self.assertTrue(AccountMiddleware.async_capable)
+        # races.apps.AccountConfig replaces a ready() that only checks MIDDLEWARE
+        self.assertIn('required_mw not in settings.MIDDLEWARE', inspect.getsource(AccountConfig.ready))
+        self.assertTrue(callable(context.request_context))
+        # The synchronous __call__ that __acall__ copies
+        source = inspect.getsource(AccountMiddleware.__mro__[1].__call__)
+        self.assertIn('context.request_context(request)', source)
+        self.assertIn('self._remove_dangling_login(request, response)', source)
+        self.assertEqual(list(inspect.signature(
+            AccountMiddleware._remove_dangling_login).parameters), ['self', 'request', 'response'])
+
+    def test_view_hooks_stay_on_the_event_loop(self):
+        """Under ASGI the middleware give Django async process_view hooks (no thread hop)"""
+        from asgiref.sync import iscoroutinefunction
+        from config.middleware import QueryLogMiddleware, RateLimitMiddleware, ReplicaRoutingMiddleware
+
+        async def get_response(request):
+            return None
+
+        for middleware in (QueryLogMiddleware, ReplicaRoutingMiddleware, RateLimitMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware(get_response).process_view))
+            self.assertFalse(iscoroutinefunction(middleware(lambda request: None).process_view))
+
+
+class LiveCommentsTestCase(TestCase):
+    """
+    Test the Server-Sent Events stream of new race comments.
+    """
+
+    def setUp(self):
+        self.creator = User.objects.create_user(username='runner', password='pass12345')
+        self.race = Race.objects.create(
+            name='Live Harbour Run', description='Fun', city='Cork', status=1, approved=True,
+            race_date=timezone.now().date(), created_by=self.creator)
+
+    def comment(self, body):
+        """Post an approved comment and run its on_commit publishing"""
+        from .models import Comment
+        with self.captureOnCommitCallbacks(execute=True):
+            return Comment.objects.create(race=self.race, author=self.creator, body=body)
+
+    def test_stream_replays_missed_comments_then_pushes_new_ones(self):
+        """Replay after Last-Event-ID, one poll fans out, heartbeats, clean unsubscribe"""
+        from asgiref.sync import async_to_sync, sync_to_async
+        from django.test import override_settings
+        from . import live_comments
+        from .models import CommentEvent
+
+        first = self.comment('Before the page was opened')
+        event = CommentEvent.objects.get(comment=first)
+        self.comment('Saved twice')  # Saving again adds no second event
+        self.assertEqual(CommentEvent.objects.count(), 2)
+
+        async def scenario():
+            stream = live_comments.stream(self.race.pk, after_id=0)
+            chunks = [await stream.__anext__() for _ in range(3)]  # retry + 2 replayed
+            new = await sync_to_async(self.comment)('Posted while watching')
+            chunks.append(await stream.__anext__())
+            chunks.append(await stream.__anext__())
+            connections = live_comments.hub.connections
+            await stream.aclose()
+            return chunks, new, connections
+
+        with override_settings(LIVE_COMMENTS_POLL_INTERVAL=0.01, LIVE_COMMENTS_HEARTBEAT=0.2):
+            chunks, new, connections = async_to_sync(scenario)()
+
+        self.assertEqual(chunks[0], b'retry: 3000\n\n')
+        self.assertTrue(chunks[1].startswith(f'id: {event.pk}\nevent: comment\n'.encode()))
+        self.assertIn(f'comment-{first.pk}'.encode(), chunks[1])
+        self.assertIn(f'comment-{new.pk}'.encode(), chunks[3])
+        self.assertEqual(chunks[4], live_comments.HEARTBEAT)
+        self.assertEqual(connections, 1)
+        self.assertEqual(live_comments.hub.connections, 0)
+
+    def test_replay_waits_for_the_hub_starting_point(self):
+        """A stream's replay query runs after the poller read its first cursor"""
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from django.test import override_settings
+        from . import live_comments
+
+        self.comment('Already there')
+        started_at_query = []
+
+        def events():
+            started_at_query.append(live_comments.hub.started.is_set())
+            return original()
+
+        async def scenario():
+            stream = live_comments.stream(self.race.pk, after_id=0)
+            chunks = [await stream.__anext__() for _ in range(2)]  # retry + 1 replayed
+            await stream.aclose()
+            return chunks
+
+        original = live_comments.events
+        with override_settings(LIVE_COMMENTS_POLL_INTERVAL=0.01), \
+                mock.patch.object(live_comments, 'events', events):
+            chunks = async_to_sync(scenario)()
+        self.assertIn(b'Already there', chunks[1])
+        self.assertTrue(started_at_query)
+        self.assertTrue(all(started_at_query))
+
+    def test_endpoint_limits_and_disconnect(self):
+        """204 under WSGI, 503 over the connection cap, stream ends when the client leaves"""
+        import asyncio
+        from asgiref.sync import async_to_sync
+        from django.core.asgi import get_asgi_application
+        from django.test import override_settings
+        from django.urls import reverse
+        from . import live_comments
+
+        url = reverse('race-comments-live', args=[self.race.pk])
+        with override_settings(ASYNC_VIEWS=False):
+            self.assertEqual(self.client.get(url).status_code, 204)
+        with override_settings(ASYNC_VIEWS=True, LIVE_COMMENTS_MAX_CONNECTIONS=0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+
+        application = live_comments.cancel_streams_on_disconnect(get_asgi_application())
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': url, 'raw_path': url.encode(),
+            'query_string': b'', 'root_path': '', 'server': ('testserver', 80),
+            'client': ('127.0.0.1', 5000),
+            'headers': [(b'host', b'testserver'), (b'accept', b'text/event-stream')],
+        }
+
+        async def scenario():
+            sent = []
+            started = asyncio.Event()
+            requests = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                if requests:
+                    return requests.pop()
+                await started.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if message.get('body', b'').startswith(b'retry:'):
+                    started.set()
+
+            await asyncio.wait_for(application(scope, receive, send), timeout=5)
+            return sent
+
+        with override_settings(ASYNC_VIEWS=True):
+            sent = async_to_sync(scenario)()
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'Content-Type', b'text/event-stream'), sent[0]['headers'])
+        self.assertEqual(live_comments.hub.connections, 0)
+
+
+class RateLimitTestCase(TestCase):
+    """
+    Test the token-bucket rate limiting of write and login endpoints.
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='runner', password='pass12345')
+        self.other = User.objects.create_user(username='walker', password='pass12345')
+
+    def test_bucket_refills_and_per_user_limit(self):
+        """Bursts up to the bucket size, then 429 with Retry-After until a token is back"""
+        from django.test import override_settings
+        from django.urls import reverse
+        from config import ratelimit
+
+        start = 1_000_000_000_000
+        self.assertEqual(ratelimit.take('bucket', '2/m', now=start), 0)
+        self.assertEqual(ratelimit.take('bucket', '2/m', now=start), 0)
+        self.assertEqual(ratelimit.take('bucket', '2/m', now=start + 1000), 29)
+        self.assertEqual(ratelimit.take('bucket', '2/m', now=start + 30000), 0)
+
+        # A lightly used bucket keeps its key until it would be full again
+        from unittest import mock
+        from django.conf import settings
+        from django.core.cache import caches
+        cache = caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+        ratelimit.take('steady', '10/m', now=start)
+        with mock.patch.object(cache, 'touch', wraps=cache.touch) as touch:
+            self.assertEqual(ratelimit.take('steady', '10/m', now=start + 1000), 0)
+        touch.assert_called_once_with('steady', 12)  # Full again at start + 12s
+
+        url = reverse('create-race')
+        with override_settings(RATE_LIMITS={'create-race': {'methods': ('POST',), 'user': '2/h'}}):
+            self.client.force_login(self.user)
+            for _ in range(2):
+                self.assertEqual(self.client.post(url, {}).status_code, 200)  # Form errors
+            response = self.client.post(url, {})
+            self.assertEqual(response.status_code, 429)
+            self.assertGreaterEqual(int(response['Retry-After']), 1790)
+            self.assertEqual(self.client.get(url).status_code, 200)  # GETs are not limited
+
+            self.client.force_login(self.other)
+            self.assertEqual(self.client.post(url, {}).status_code, 200)
+
+    def test_login_limited_per_ip_and_check_is_fast(self):
+        """Per-IP login bucket (behind one proxy), route-wide bucket only reported; check < 1 ms"""
+        import time
+        from django.test import RequestFactory, override_settings
+        from django.urls import resolve, reverse
+        from config.middleware import RateLimitMiddleware
+
+        url = reverse('account_login')
+        data = {'login': 'runner', 'password': 'wrong'}
+        rule = {'methods': ('POST',), 'ip': '1/m', 'route': '1/m'}
+        with override_settings(RATE_LIMITS={'account_login': rule}, RATE_LIMIT_PROXY_COUNT=1):
+            forwarded = {'HTTP_X_FORWARDED_FOR': '10.0.0.1, 203.0.113.7'}
+            self.assertEqual(self.client.post(url, data, **forwarded).status_code, 200)
+            self.assertEqual(self.client.post(url, data, **forwarded).status_code, 429)
+            # A forged first entry does not help; another address does
+            forwarded = {'HTTP_X_FORWARDED_FOR': '10.0.0.2, 203.0.113.7'}
+            self.assertEqual(self.client.post(url, data, **forwarded).status_code, 429)
+            # The route-wide bucket is empty too, but a flood must not lock everyone out
+            forwarded = {'HTTP_X_FORWARDED_FOR': '203.0.113.8'}
+            with self.assertLogs('config.ratelimit', 'WARNING'):
+                self.assertEqual(self.client.post(url, data, **forwarded).status_code, 200)
+
+        # Cost of the middleware's check for an allowed request
+        middleware = RateLimitMiddleware(lambda request: None)
+        request = RequestFactory().post(url)
+        request.resolver_match = resolve(url)
+        rule = {'methods': ('POST',), 'ip': '100000/s', 'route': '100000/s'}
+        with override_settings(RATE_LIMITS={'account_login': rule}):
+            start = time.perf_counter()
+            for _ in range(200):
+                self.assertIsNone(middleware.process_view(request, None, (), {}))
+            self.assertLess((time.perf_counter() - start) / 200, 0.001)
@@ -0,0 +1,204 @@
+"""
+Trending races - a ranking kept up to date as events arrive
+
+A race's trending score is its recent activity, each event counting less
+the older it is (exponential decay with a TRENDING_HALF_LIFE_HOURS
+half-life):
+
+    score(now) = sum(weight * 2 ** -((now - event_time) / half_life))
+
+Events: a page view (TRENDING_VIEW_WEIGHT), a comment
+(TRENDING_COMMENT_WEIGHT), being approved (TRENDING_NEW_RACE_WEIGHT) and,
+once a day, race day getting closer (up to TRENDING_UPCOMING_WEIGHT).
+
+Decaying every score as time passes would mean rewriting the whole table.
+Instead the TrendingRace table stores the score in "forward decay" form,
+as a natural log so it never overflows:
+
+    stored = ln(sum(weight * e ** (event_time / tau)))   tau = half_life / ln 2
+
+All scores shrink by the same factor as time passes, so ordering by
+`stored` is ordering by score(now) at any moment. An event is then one
+UPDATE (stored = ln(e ** stored + weight * e ** (now / tau)), written so
+it cannot overflow) and the trending page is one read down the score index:
+
+    SELECT ... FROM races_race JOIN races_trendingrace ... ORDER BY score DESC LIMIT 6
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Exp, Greatest, Ln
+from django.utils import timezone
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def clock(now=None):
+    """`now` in units of tau (so e ** clock() grows by 2 every half-life)"""
+    now = now or timezone.now()
+    tau_hours = setting('TRENDING_HALF_LIFE_HOURS', 48) / math.log(2)
+    return now.timestamp() / 3600 / tau_hours
+
+
+def event_score(weight, when=None):
+    """Stored score of a race whose only event is `weight` at `when`"""
+    return math.log(weight) + clock(when)
+
+
+def combine(*scores):
+    """Stored score of several stored scores added together (log-sum-exp)"""
+    top = max(scores)
+    return top + math.log(sum(math.exp(score - top) for score in scores))
+
+
+def _add_event(weight, when):
+    # ln(e^score + weight * e^x), taking the larger exponent out first so
+    # neither e^... can overflow
+    x = Value(clock(when), output_field=FloatField())
+    top = Greatest(F('score'), x)
+    return top + Ln(Exp(F('score') - top) + Value(float(weight)) * Exp(x - top))
+
+
+def record(race_ids, weight, when=None):
+    """Add an event of `weight` to each listed race in `race_ids` (one UPDATE)"""
+    from .models import TrendingRace
+
+    if not race_ids or weight <= 0:
+        return 0
+    return TrendingRace.objects.filter(race_id__in=list(race_ids)).update(
+        score=_add_event(weight, when or timezone.now()))
+
+
+def record_views(pending):
+    """Add flushed page views {race_id: views}; one UPDATE per distinct count"""
+    weight = setting('TRENDING_VIEW_WEIGHT', 1)
+    by_count = defaultdict(list)
+    for race_id, views in pending.items():
+        by_count[views].append(race_id)
+    now = timezone.now()
+    for views, race_ids in by_count.items():
+        record(race_ids, weight * views, now)
+
+
+def record_comment(comment):
+    record([comment.race_id], setting('TRENDING_COMMENT_WEIGHT', 10), comment.created_on)
+
+
+def list_races(race_ids, when=None):
+    """Start ranking newly approved races (existing rows are left alone)"""
+    from .models import TrendingRace
+
+    score = event_score(setting('TRENDING_NEW_RACE_WEIGHT', 20), when)
+    TrendingRace.objects.bulk_create(
+        [TrendingRace(race_id=race_id, score=score) for race_id in race_ids],
+        ignore_conflicts=True,
+    )
+
+
+def unlist_races(race_ids):
+    from .models import TrendingRace
+
+    return TrendingRace.objects.filter(race_id__in=list(race_ids)).delete()[0]
+
+
+def listed_races():
+    """Races that belong in the ranking: published, approved, not deleted"""
+    from .models import Race
+
+    return Race.objects.filter(status=1, approved=True)
+
+
+def trending_races():
+    """Listed races, most trending first"""
+    return listed_races().filter(trending__isnull=False).order_by('-trending__score', 'pk')
+
+
+def add_upcoming_boost(now=None):
+    """
+    Daily event: races coming up in the next TRENDING_UPCOMING_DAYS days
+
+    The closer race day is, the bigger the event. One UPDATE per race day.
+    """
+    from .models import TrendingRace
+
+    now = now or timezone.now()
+    days = setting('TRENDING_UPCOMING_DAYS', 30)
+    weight = setting('TRENDING_UPCOMING_WEIGHT', 30)
+    today = timezone.localdate(now)
+    boosted = 0
+    for days_until in range(days):
+        race_ids = TrendingRace.objects.filter(
+            race__race_date=today + timedelta(days=days_until)).values('race_id')
+        boosted += TrendingRace.objects.filter(race_id__in=race_ids).update(
+            score=_add_event(weight * (1 - days_until / days), now))
+    return boosted
+
+
+def refresh(now=None, batch_size=1000):
+    """
+    Periodic clean-up: drop races that left the lists, add listed races the
+    events missed (e.g. approved from the edit form) and add the
+    approaching-race-day boost. Returns (removed, added, boosted).
+    """
+    from .account_deletion import delete_in_batches
+    from .models import TrendingRace
+
+    removed = delete_in_batches(
+        TrendingRace.objects.exclude(race_id__in=listed_races().values('pk')), batch_size)
+    added = 0
+    while True:
+        race_ids = list(listed_races().filter(trending__isnull=True)
+                        .values_list('pk', flat=True)[:batch_size])
+        if not race_ids:
+            break
+        list_races(race_ids, now)
+        added += len(race_ids)
+    return removed, added, add_upcoming_boost(now)
+
+
+def rebuild(batch_size=500, now=None):
+    """
+    Recompute every score from scratch, `batch_size` races at a time
+
+    Uses each race's approval time, its approved comments at their own
+    times and its total views (per-view times are not kept, so views count
+    as happening now). Returns the number of races ranked.
+    """
+    from .models import Comment, TrendingRace
+
+    now = now or timezone.now()
+    new_weight = setting('TRENDING_NEW_RACE_WEIGHT', 20)
+    comment_weight = setting('TRENDING_COMMENT_WEIGHT', 10)
+    view_weight = setting('TRENDING_VIEW_WEIGHT', 1)
+
+    TrendingRace.objects.exclude(race_id__in=listed_races().values('pk')).delete()
+    ranked, last_pk = 0, 0
+    while True:
+        races = list(listed_races().filter(pk__gt=last_pk).order_by('pk')
+                     .values_list('pk', 'approved_at', 'created_at', 'view_count')[:batch_size])
+        if not races:
+            break
+        last_pk = races[-1][0]
+        comments = defaultdict(list)
+        for race_id, created_on in (Comment.objects.filter(race_id__in=[race[0] for race in races],
+                                                           approved=True)
+                                    .values_list('race_id', 'created_on').iterator()):
+            comments[race_id].append(event_score(comment_weight, created_on))
+        rows = []
+        for pk, approved_at, created_at, view_count in races:
+            scores = [event_score(new_weight, approved_at or created_at)] + comments[pk]
+            if view_count:
+                scores.append(event_score(view_weight * view_count, now))
+            rows.append(TrendingRace(race_id=pk, score=combine(*scores)))
+        TrendingRace.objects.bulk_create(
+            rows, update_conflicts=True,
+            unique_fields=['race'], update_fields=['score', 'updated_at'],
+        )
+        ranked += len(rows)
+    add_upcoming_boost(now)
+    return ranked
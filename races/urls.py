@@ -1,7 +1,15 @@
 # Import Django's URL routing system
+from django.conf import settings
 from django.urls import path
 # Import our views from the current app (races app)
-from . import views
+from . import async_views, views
+
+# Served over ASGI, the race list and race page use their async versions
+# (races/async_views.py) - same pages, no thread held while waiting
+if getattr(settings, 'ASYNC_VIEWS', False):
+    race_list_view, race_detail_view = async_views.race_list, async_views.race_detail
+else:
+    race_list_view, race_detail_view = views.race_list, views.race_detail
 
 # 
 # URL PATTERNS - Maps web addresses to view functions
@@ -12,14 +20,20 @@ from . import views
 urlpatterns = [
     # HOMEPAGE: '/' shows all races
     # path('', ...) = empty string matches root URL
-    # views.race_list = function to call
+    # race_list_view = function to call (views.race_list, or its async version)
     # name='race-list' = internal name for generating URLs
-    path('', views.race_list, name='race-list'),
+    path('', race_list_view, name='race-list'),
     
     # RACE DETAIL: '/race/5/' shows race with ID 5
     # <int:pk> = capture integer from URL as 'pk' parameter
     # Django passes pk=5 to views.race_detail(request, pk=5)
-    path('race/<int:pk>/', views.race_detail, name='race-detail'),
+    path('race/<int:pk>/', race_detail_view, name='race-detail'),
+    
+    # LIVE COMMENTS: '/race/5/comments/live/' streams new comments of race 5
+    # (Server-Sent Events, served on the ASGI stack only)
+    path('race/<int:pk>/comments/live/',
+         async_views.race_comments_live,
+         name='race-comments-live'),
     
     # EDIT RACE: '/race/5/edit/' shows edit form for race with ID 5
     # <int:pk> = capture race ID from URL as 'pk' parameter
@@ -56,4 +70,10 @@ urlpatterns = [
     
     # CANCEL DELETION: '/cancel-deletion/' allows user to cancel pending request
     path('cancel-deletion/', views.cancel_deletion_request, name='cancel-deletion'),
+
+    # IMAGE PROXY: '/img/600x400/race_images/medoc.jpg' serves a resized copy
+    # of a file in MEDIA_ROOT (0 as width or height means "any")
+    path('img/<int:width>x<int:height>/<path:path>',
+         views.resized_image,
+         name='resized-image'),
 ]
\ No newline at end of file
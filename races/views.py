@@ -10,6 +10,19 @@ from django.core.paginator import Paginator
 from .models import Race, Comment, AccountDeletionRequest
 # Import our custom forms
 from .forms import RaceForm
+# Import the background job queue and the email outbox
+from .jobs import enqueue
+from .outbox import queue_comment_email
+# Page views are counted in memory and written in batches
+from .counters import record_view
+# Trending ranking - kept up to date as views and comments come in
+from .trending import record_comment, trending_races
+# Precomputed "You might also like" recommendations
+from .similarity import similar_races
+# Statistics counters behind the admin dashboard
+from . import rollups
+# Import database transactions (save several rows all-or-nothing)
+from django.db import transaction
 
 
 def race_list(request):
@@ -40,6 +53,15 @@ def race_list(request):
             # Anonymous users: only approved races
             races = Race.objects.filter(status=1, approved=True).order_by('race_date')
     
+    # "Trending" ordering (/?sort=trending): public races ranked by recent
+    # views and comments. The ranking is precomputed (races/trending.py),
+    # so this is a single read down the score index
+    sort = request.GET.get('sort')
+    if sort == 'trending':
+        races = trending_races()
+    else:
+        sort = 'date'
+    
     # STEP 2: Split races into pages (pagination)
     # This prevents showing 100+ races on one page
     # CHANGE THIS NUMBER to control races per page:
@@ -60,6 +82,7 @@ def race_list(request):
         'races': page_obj,  # The races to display on this page
         'is_paginated': page_obj.has_other_pages(),  # True if more than 1 page
         'page_obj': page_obj,  # Pagination info (current page, total pages, etc.)
+        'sort': sort,  # 'date' or 'trending' - kept in the pagination links
     }
     
     # STEP 6: Render the HTML template with our data
@@ -75,7 +98,9 @@ def race_detail(request, pk):
     """
     
     # STEP 1: Get the race from database (published races only)
-    race = get_object_or_404(Race, pk=pk, status=1)
+    # Archived (past) races drop out of the lists but keep their page
+    # select_related = fetch the creator in the same query (shown in the footer)
+    race = get_object_or_404(Race.objects.select_related('created_by'), pk=pk, status__in=(1, 2))
     
     # STEP 2: Check if user has permission to view this race
     if not race.is_visible_to_user(request.user):
@@ -83,26 +108,46 @@ def race_detail(request, pk):
         raise Http404("Race not found or not available.")
     
     # STEP 3: Get comments for this race
-    comments = race.comments.filter(approved=True).order_by('-created_on')
-    comment_count = comments.count()
+    # select_related('author') avoids one extra user query per comment (N+1)
+    comments = (
+        race.comments.filter(approved=True)
+        .select_related('author')
+        .order_by('-created_on')
+    )
+    # len() runs the query once; the template then reuses the fetched rows
+    comment_count = len(comments)
     
     # STEP 4: Handle comment submission
     if request.method == "POST" and request.user.is_authenticated:
         comment_body = request.POST.get('body')
         if comment_body:
-            Comment.objects.create(
-                race=race,
-                author=request.user,
-                body=comment_body
-            )
+            # Save the comment and queue the email to the race creator together
+            with transaction.atomic():
+                comment = Comment.objects.create(
+                    race=race,
+                    author=request.user,
+                    body=comment_body
+                )
+                queue_comment_email(comment)
+                record_comment(comment)  # Moves the race up the trending list
             messages.success(request, 'Your comment has been added!')
             return redirect('race-detail', pk=race.pk)
     
-    # STEP 5: Send race and comments data to template
+    # STEP 5: Get the "You might also like" races
+    # Precomputed by a background job (races/similarity.py) - one lookup
+    similar = list(similar_races(race))
+    
+    # STEP 6: Count the page view
+    # Only added to an in-memory buffer here; a background thread writes
+    # the totals to the database every few seconds (races/counters.py)
+    record_view(race.pk)
+    
+    # STEP 7: Send race and comments data to template
     context = {
         'race': race,
         'comments': comments,
         'comment_count': comment_count,
+        'similar_races': similar,
     }
     return render(request, 'races/race_detail.html', context)
 
@@ -140,6 +185,8 @@ def create_race(request):
             
             # STEP 7: Now save the complete race to database
             race.save()
+            # Work out its "You might also like" races in the background
+            enqueue('races.update_similar_races', race_ids=[race.pk])
             
             # STEP 8: Show appropriate success message
             if request.user.is_staff or request.user.is_superuser:
@@ -211,15 +258,17 @@ def delete_comment(request, comment_id):
     comment = get_object_or_404(Comment, id=comment_id)
     
     # STEP 2: Check if current user is the comment author
-    if comment.author != request.user:
+    # Comparing ids avoids loading the author and race from the database
+    if comment.author_id != request.user.id:
         messages.error(request, "You can only delete your own comments!")
-        return redirect('race-detail', pk=comment.race.pk)
+        return redirect('race-detail', pk=comment.race_id)
     
     # STEP 3: Store race pk before deleting comment
-    race_pk = comment.race.pk
+    race_pk = comment.race_id
     
-    # STEP 4: Delete the comment
+    # STEP 4: Delete the comment (and take it off the dashboard statistics)
     comment.delete()
+    rollups.record(rollups.removal(comment))
     
     # STEP 5: Show success message and redirect back to race
     messages.success(request, "Your comment has been deleted!")
@@ -235,11 +284,12 @@ def edit_race(request, pk):
     Only the race creator or admin/staff can edit a race.
     """
     
-    # STEP 1: Get the race from database (published races only)
-    race = get_object_or_404(Race, pk=pk, status=1)
+    # STEP 1: Get the race from database (published or archived races)
+    # Archived races (status=2, see archive_past_races) still belong to their creator
+    race = get_object_or_404(Race, pk=pk, status__in=(1, 2))
     
     # STEP 2: Check permissions - only race creator or admin can edit
-    user_is_creator = race.created_by == request.user
+    user_is_creator = race.created_by_id == request.user.id
     user_is_admin = request.user.is_staff or request.user.is_superuser
     
     if not (user_is_creator or user_is_admin):
@@ -262,6 +312,8 @@ def edit_race(request, pk):
             # STEP 6: Save the updated race to database
             # No need to set created_by again - it stays the same
             updated_race = form.save()
+            # The text may have changed - refresh "You might also like"
+            enqueue('races.update_similar_races', race_ids=[updated_race.pk])
             
             # STEP 7: Show success message with race name
             success_msg = f'Race "{updated_race.name}" updated successfully! 🎉'
@@ -303,11 +355,12 @@ def delete_race(request, pk):
     Only the race creator or admin/staff can delete a race.
     """
     
-    # STEP 1: Get the race from database (published races only)
-    race = get_object_or_404(Race, pk=pk, status=1)
+    # STEP 1: Get the race from database (published or archived races)
+    # The confirmation page shows the creator, so fetch it in the same query
+    race = get_object_or_404(Race.objects.select_related('created_by'), pk=pk, status__in=(1, 2))
     
     # STEP 2: Check permissions - only race creator or admin can delete
-    user_is_creator = race.created_by == request.user
+    user_is_creator = race.created_by_id == request.user.id
     user_is_admin = request.user.is_staff or request.user.is_superuser
     
     if not (user_is_creator or user_is_admin):
@@ -318,8 +371,11 @@ def delete_race(request, pk):
     # STEP 3: Handle deletion confirmation
     if request.method == 'POST':
         # User confirmed deletion
+        # Soft delete: the race disappears at once and a background job
+        # removes its comments in batches (races/purge.py)
         race_name = race.name
-        race.delete()
+        race.soft_delete()
+        enqueue('races.purge_race', key=f'purge-race-{race.pk}', race_id=race.pk)
         
         # STEP 4: Show success message and redirect
         success_msg = f'Race "{race_name}" has been deleted successfully! 🗑️'
@@ -446,3 +502,60 @@ def cancel_deletion_request(request):
         'deletion_request': deletion_request,
     }
     return render(request, 'account/cancel_deletion.html', context)
+
+
+# ==============================================================================
+# IMAGE PROXY VIEW
+# ==============================================================================
+
+def resized_image(request, width, height, path):
+    """
+    VIEW 10: Resized Image - Serve a resized copy of a local media image
+
+    '/img/600x400/race_images/medoc.jpg' returns medoc.jpg scaled to fit in
+    600x400. The first request resizes and caches the file on disk, every
+    later request streams the cached copy (see races/image_proxy.py).
+
+    URLs built by derivative_url() carry the original's version
+    (?v=<hash>); only those may be cached "forever". Without it the URL
+    stays the same when the original is replaced, so browsers get a short
+    max-age and revalidate with the ETag.
+    """
+    from django.conf import settings
+    from django.http import FileResponse, Http404, HttpResponseNotModified
+    from .image_proxy import ImageProxyError, get_derivative, original_version
+
+    # STEP 1: Find (or create) the cached derivative
+    # A file can be evicted between lookup and open - try once more if so
+    for attempt in range(2):
+        try:
+            cached_path, content_type, key = get_derivative(path, width, height)
+            version = original_version(path)
+            etag = f'"{key}"'
+            if request.headers.get('If-None-Match') == etag:
+                handle = None  # The browser's copy is current
+            else:
+                handle = open(cached_path, 'rb')
+            break
+        except ImageProxyError:
+            raise Http404("Image not found.")
+        except FileNotFoundError:
+            if attempt:
+                raise Http404("Image not found.")
+
+    # STEP 2: Pick the cache lifetime
+    # The ETag changes with the original, the plain URL does not
+    if request.GET.get('v') == version:
+        cache_control = 'public, max-age=31536000, immutable'
+    else:
+        cache_control = f"public, max-age={getattr(settings, 'IMAGE_PROXY_UNVERSIONED_MAX_AGE', 300)}"
+
+    # STEP 3: Stream it (or confirm the browser's copy)
+    if handle is None:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(handle, content_type=content_type)
+    response['Cache-Control'] = cache_control
+    response['ETag'] = etag
+    response['X-Image-Derivative'] = f'{width}x{height}'
+    return response